@@ -0,0 +1,73 @@
+"""Compares the latency of cold command line runs with runs through the warm daemon, on a small input.
+
+Run from the project root directory:
+
+    python -m benchmarks.bench_daemon [number_of_runs] [number_of_records]
+"""
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import synthetic
+from src import daemon_client
+
+
+def timed_runs(command, input_data, number_of_runs):
+    timings = []
+    for _ in range(number_of_runs):
+        start = time.perf_counter()
+        subprocess.run(command, input=input_data, stdout=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summary(name, timings):
+    return '{:<28} mean {:7.1f} ms  median {:7.1f} ms  max {:7.1f} ms'.format(
+        name, statistics.mean(timings) * 1000, statistics.median(timings) * 1000, max(timings) * 1000)
+
+
+def main(number_of_runs, number_of_records):
+    records = synthetic.make_records(number_of_records)
+    input_data = json.dumps(records).encode()
+    keys_list = synthetic.key_names(2)
+    with tempfile.TemporaryDirectory(prefix='jp') as work_dir:
+        socket_path = os.path.join(work_dir, 'd.sock')
+        output = ['--output-file', os.path.join(work_dir, 'result.json')]
+        daemon = subprocess.Popen([sys.executable, '-m', 'src.daemon', '--socket', socket_path],
+                                  stdout=subprocess.DEVNULL)
+        try:
+            while not daemon_client.is_listening(socket_path):
+                time.sleep(0.01)
+            cold = timed_runs([sys.executable, '-m', 'src.json_parser'] + keys_list + output, input_data,
+                              number_of_runs)
+            env = dict(os.environ, **{daemon_client.SOCKET_ENV_VAR: socket_path})
+            client = []
+            for _ in range(number_of_runs):
+                start = time.perf_counter()
+                subprocess.run([sys.executable, '-m', 'src.daemon_client'] + keys_list + output, input=input_data,
+                               stdout=subprocess.DEVNULL, check=True, env=env)
+                client.append(time.perf_counter() - start)
+            in_process = []
+            for _ in range(number_of_runs):
+                start = time.perf_counter()
+                daemon_client.run(keys_list + output, io.BytesIO(input_data), socket_path, autostart=False)
+                in_process.append(time.perf_counter() - start)
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+    print('runs: {}  records per run: {}'.format(number_of_runs, number_of_records))
+    print(summary('cold json_parser process', cold))
+    print(summary('daemon_client process', client))
+    print(summary('daemon_client.run', in_process))
+    print('speedup (client process):   {:.1f}x'.format(statistics.mean(cold) / statistics.mean(client)))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 100)
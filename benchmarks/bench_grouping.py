@@ -0,0 +1,61 @@
+"""Compares the legacy sort + zip + build_json pipeline with the single-pass and columnar grouping engines.
+
+Run from the project root directory:
+
+    python -m benchmarks.bench_grouping [number_of_records]
+"""
+import copy
+import random
+import sys
+import time
+
+from src import columnar
+from src import grouping
+from src import json_parser
+
+
+def make_records(number_of_records, seed=0):
+    rnd = random.Random(seed)
+    countries = ['C{}'.format(i) for i in range(200)]
+    currencies = ['X{}'.format(i) for i in range(30)]
+    cities = ['T{}'.format(i) for i in range(1000)]
+    return [{'country': rnd.choice(countries),
+             'city': rnd.choice(cities),
+             'currency': rnd.choice(currencies),
+             'amount': round(rnd.random() * 1000, 2)} for _ in range(number_of_records)]
+
+
+def legacy_pipeline(keys_list, json_list):
+    json_list_ordered = json_parser.read_and_sort_json_file(keys_list, json_list)
+    return json_parser.build_json(json_parser.zip_dicts(keys_list, json_list_ordered))
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main(number_of_records):
+    # two levels: the legacy build_json mis-nests some inputs at three levels or more
+    keys_list = ['currency', 'country']
+    records = make_records(number_of_records)
+
+    # the legacy pipeline mutates its input, so each run gets its own copy
+    legacy_time, legacy_result = timed(legacy_pipeline, keys_list, copy.deepcopy(records))
+    grouping_time, grouping_result = timed(grouping.group_json, keys_list, records)
+    assert legacy_result == grouping_result
+    columnar_time, columnar_result = timed(columnar.columnar_group_json, keys_list, records)
+    assert columnar_result == grouping_result
+    columns_time, _ = timed(lambda: columnar.columnar_group_json(keys_list, records, as_columns=True))
+
+    print('records:         {}'.format(number_of_records))
+    print('legacy pipeline: {:.3f}s'.format(legacy_time))
+    print('group_json:      {:.3f}s'.format(grouping_time))
+    print('speedup:         {:.1f}x'.format(legacy_time / grouping_time))
+    print('columnar{}: {:.3f}s  (column leaves {:.3f}s)'.format(
+        '' if columnar.np else ' (no numpy, group_json)', columnar_time, columns_time))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
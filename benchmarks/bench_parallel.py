@@ -0,0 +1,52 @@
+"""Measures how parallel_json_groups scales with the number of worker processes on a high-cardinality first key.
+
+Run from the project root directory:
+
+    python -m benchmarks.bench_parallel [number_of_records] [max_workers]
+"""
+import io
+import json
+import os
+import random
+import sys
+import time
+
+from src import grouping
+from src import parallel
+from src import streaming
+
+
+def make_records(number_of_records, seed=0):
+    rnd = random.Random(seed)
+    return [{'customer': 'U{}'.format(rnd.randrange(number_of_records // 10 or 1)),
+             'currency': 'X{}'.format(rnd.randrange(30)),
+             'city': 'T{}'.format(rnd.randrange(1000)),
+             'amount': round(rnd.random() * 1000, 2)} for _ in range(number_of_records)]
+
+
+def main(number_of_records, max_workers):
+    keys_list = ['customer', 'currency']
+    records = make_records(number_of_records)
+
+    start = time.perf_counter()
+    expected = grouping.group_json(keys_list, records)
+    expected_json = json.dumps(expected)
+    single_time = time.perf_counter() - start
+    print('records: {}  cpus: {}'.format(number_of_records, os.cpu_count()))
+    print('group_json + json.dumps:       {:.3f}s'.format(single_time))
+
+    workers = 2
+    while workers <= max_workers:
+        start = time.perf_counter()
+        fp = io.StringIO()
+        streaming.write_json_fragments(parallel.parallel_json_groups(keys_list, records, workers), fp)
+        elapsed = time.perf_counter() - start
+        assert fp.getvalue() == expected_json
+        print('parallel_json_groups {:2d} workers: {:.3f}s  speedup {:.1f}x'.format(
+            workers, elapsed, single_time / elapsed))
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count())
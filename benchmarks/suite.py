@@ -0,0 +1,299 @@
+"""Times the nesting functions, the command line and the /jfile endpoint on seeded synthetic records, and compares
+the results with a stored baseline.
+
+Run from the project root directory:
+
+    python -m benchmarks.suite --records 1e5 --levels 2 --cardinality 30,200 --skew 1.1 --leaf-width 4
+    python -m benchmarks.suite --save-baseline
+    python -m benchmarks.suite --threshold 0.5
+
+Each case reports its best wall time over --repeat runs, its throughput and, in a separate run, its peak memory
+traced by tracemalloc (for the command line, the peak resident set size of the process). With a baseline for the
+same parameters, a case whose time or peak memory grew by more than --threshold is reported as a regression and
+the exit status is 1. Best times of the same case often vary by more than a third between runs on a busy
+machine, so the default threshold is 0.5; raise --repeat, or the threshold, where the noise is larger. Baselines
+are per machine: save one before comparing on a new one.
+"""
+import argparse
+import base64
+import contextlib
+import gc
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from operator import itemgetter
+
+from benchmarks import synthetic
+from src import aggregate
+from src import binary_result
+from src import columnar
+from src import grouping
+from src import json_parser
+from src import leaves
+from src import streaming
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_THRESHOLD = 0.5
+
+
+def function_cases(keys_list, records, work_dir):
+    """Returns (name, callable, setup) cases timing the public nesting functions on records already in memory.
+
+    The original json_parser pipeline sorts its input in place and pops the keys from the records, so its cases
+    have a setup callable, run untimed before each run, returning fresh arguments for the case; setup is None for
+    the cases that leave their input alone.
+    """
+    aggregations = aggregate.parse_aggregations('f0:sum,mean,max')
+    ndjson_file = os.path.join(work_dir, 'records.ndjson')
+    json_file = os.path.join(work_dir, 'result.json')
+    binary_file = os.path.join(work_dir, 'result.jbin')
+
+    def parse_ndjson():
+        with open(ndjson_file) as fp:
+            for _ in streaming.iter_ndjson(fp):
+                pass
+
+    sorted_records = sorted(records, key=itemgetter(*keys_list))
+    tree = grouping.group_json(keys_list, records)
+
+    def unsorted_copy():
+        return (list(records),)
+
+    def sorted_copy():
+        return ([dict(record) for record in sorted_records],)
+
+    def zipped_copy():
+        return (json_parser.zip_dicts(keys_list, [dict(record) for record in sorted_records]),)
+
+    return [
+        ('group_json', lambda: grouping.group_json(keys_list, records), None),
+        ('group_json_compact', lambda: leaves.group_json_compact(keys_list, records), None),
+        ('columnar_group_json', lambda: columnar.columnar_group_json(keys_list, records), None),
+        ('aggregate_json', lambda: aggregate.aggregate_json(keys_list, records, aggregations), None),
+        ('group_json_views', lambda: grouping.group_json_views([keys_list, keys_list[::-1]], records), None),
+        ('iter_ndjson', parse_ndjson, None),
+        ('read_and_sort_json_file', lambda json_list: json_parser.read_and_sort_json_file(keys_list, json_list),
+         unsorted_copy),
+        ('zip_dicts', lambda json_list: json_parser.zip_dicts(keys_list, json_list), sorted_copy),
+        ('build_json', json_parser.build_json, zipped_copy),
+        ('build_json_file', lambda: json_parser.build_json_file(tree, json_file), None),
+        ('handle_control_flow', lambda: json_parser.handle_control_flow(keys_list, records, file_name=json_file),
+         None),
+        ('write_binary_result', lambda: binary_result.write_binary_result(
+            grouping.group_json(keys_list, records).items(), len(keys_list), binary_file), None),
+    ]
+
+
+def run_cli(keys_list, work_dir):
+    """Runs the command line on the records file in a new process; returns (seconds, peak RSS in bytes)."""
+    command = [sys.executable, '-m', 'src.json_parser'] + keys_list + [
+        '--input-format', 'ndjson', '--input-file', os.path.join(work_dir, 'records.ndjson'),
+        '--output-file', os.path.join(work_dir, 'cli.json')]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=PROJECT_DIR, stdout=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+        raise RuntimeError('{} exited with {}'.format(' '.join(command), process.returncode))
+    # ru_maxrss is in kilobytes on Linux
+    return elapsed, rusage.ru_maxrss * 1024
+
+
+def jfile_case(keys_list, records):
+    """Returns a callable posting the records to /jfile through the Flask test client and reading the answer."""
+    from src import app as app_module
+
+    api_client = app_module.create_app({'CACHE_MAX_ENTRIES': 0, 'METRICS_ENABLED': False}).test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {'content-type': 'application/json', "Authorization": "Basic {}".format(user_credentials)}
+    data = json.dumps(records)
+    url = '/jfile?' + '&'.join(keys_list)
+
+    def post():
+        response = api_client.post(url, data=data, headers=headers)
+        if response.status_code != 201:
+            raise RuntimeError('/jfile answered {}'.format(response.status_code))
+        response.get_data()
+        response.close()
+
+    return post
+
+
+def best_time(function, repeat, setup=None):
+    """Returns the best wall time of repeat runs; like timeit, the garbage collector is off while timing, and setup,
+    if given, is run untimed before each run for the arguments of function."""
+    timings = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            function(*args)
+            timings.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return min(timings)
+
+
+def peak_memory(function, setup=None):
+    args = setup() if setup else ()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_suite(params, repeat=3, trace_memory=True, cli=True, jfile=True):
+    """Generates the records and runs every case.
+
+    Parameters
+    ----------
+    params : dict
+        synthetic.make_records arguments: number_of_records, levels, cardinality, skew, leaf_width, seed
+    repeat : int
+        runs per case; the best time is kept
+    trace_memory : bool
+        If True, each in-process case is run once more under tracemalloc for its peak memory.
+    cli, jfile : bool
+        If True, the command line and the /jfile endpoint are timed too.
+
+    Returns
+    -------
+    results : dict
+        {case: {'seconds': ..., 'records_per_second': ..., 'peak_memory': bytes or None}}
+    """
+    records = synthetic.make_records(**params)
+    keys_list = synthetic.key_names(params['levels'])
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir, contextlib.redirect_stdout(io.StringIO()):
+        synthetic.write_ndjson(records, os.path.join(work_dir, 'records.ndjson'))
+        cases = function_cases(keys_list, records, work_dir)
+        if jfile:
+            cases.append(('jfile', jfile_case(keys_list, records), None))
+        for name, function, setup in cases:
+            seconds = best_time(function, repeat, setup)
+            results[name] = {'seconds': seconds,
+                             'peak_memory': peak_memory(function, setup) if trace_memory else None}
+        if cli:
+            runs = [run_cli(keys_list, work_dir) for _ in range(repeat)]
+            results['cli'] = {'seconds': min(seconds for seconds, _ in runs),
+                              'peak_memory': max(peak for _, peak in runs)}
+    for result in results.values():
+        result['records_per_second'] = params['number_of_records'] / result['seconds']
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Finds the cases whose time or peak memory grew by more than threshold (a fraction) over the baseline.
+
+    Returns
+    -------
+    regressions : list
+        (case, metric, baseline value, new value) tuples
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        for metric in ('seconds', 'peak_memory'):
+            if result.get(metric) is None or not expected.get(metric):
+                continue
+            if result[metric] > expected[metric] * (1 + threshold):
+                regressions.append((name, metric, expected[metric], result[metric]))
+    return regressions
+
+
+def baseline_key(params):
+    """Identifies a set of generator parameters in the baseline file."""
+    return json.dumps(params, sort_keys=True)
+
+
+def load_baselines(file_name=BASELINE_FILE):
+    if not os.path.exists(file_name):
+        return {}
+    with open(file_name) as fp:
+        return json.load(fp)
+
+
+def save_baseline(params, results, file_name=BASELINE_FILE):
+    baselines = load_baselines(file_name)
+    baselines[baseline_key(params)] = results
+    with open(file_name, 'w') as fp:
+        json.dump(baselines, fp, indent=2, sort_keys=True)
+        fp.write('\n')
+
+
+def report(params, results, baseline=None):
+    lines = ['records: {number_of_records}  levels: {levels}  cardinality: {cardinality}  skew: {skew}  '
+             'leaf width: {leaf_width}  seed: {seed}'.format(**params),
+             '{:<24} {:>10} {:>14} {:>10} {:>10}'.format('case', 'seconds', 'records/s', 'peak MiB', 'vs base')]
+    for name, result in results.items():
+        expected = (baseline or {}).get(name)
+        change = '{:+.0%}'.format(result['seconds'] / expected['seconds'] - 1) if expected else '-'
+        peak = '-' if result['peak_memory'] is None else '{:.1f}'.format(result['peak_memory'] / 2 ** 20)
+        lines.append('{:<24} {:>10.4f} {:>14,.0f} {:>10} {:>10}'.format(
+            name, result['seconds'], result['records_per_second'], peak, change))
+    return '\n'.join(lines)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.suite', description=__doc__.split('\n')[0])
+    parser.add_argument('--records', type=lambda value: int(float(value)), default=100000,
+                        help='number of records, e.g. 1e3 to 1e7 (default: 1e5)')
+    parser.add_argument('--levels', type=int, default=2, help='number of keys to nest by')
+    parser.add_argument('--cardinality', default='30,200',
+                        help='distinct values per key level, the last one repeated for deeper levels')
+    parser.add_argument('--skew', type=float, default=0.0, help='Zipf exponent of the key values, 0 for uniform')
+    parser.add_argument('--leaf-width', type=int, default=2, help='fields besides the keys')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case, the best is kept')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc runs')
+    parser.add_argument('--no-cli', action='store_true', help='skip the command line case')
+    parser.add_argument('--no-jfile', action='store_true', help='skip the /jfile case')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed growth over the baseline before a case is a regression (default: 0.5)')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    args = parser.parse_args(argv)
+    if args.levels < 1 or args.records < 1:
+        parser.error('--records and --levels must be at least 1')
+    return args
+
+
+def main(argv):
+    args = parse_args(argv)
+    params = {'number_of_records': args.records, 'levels': args.levels,
+              'cardinality': [int(value) for value in args.cardinality.split(',')], 'skew': args.skew,
+              'leaf_width': args.leaf_width, 'seed': args.seed}
+    results = run_suite(params, repeat=args.repeat, trace_memory=not args.no_memory, cli=not args.no_cli,
+                        jfile=not args.no_jfile)
+    baseline = load_baselines(args.baseline).get(baseline_key(params))
+    print(report(params, results, baseline))
+    if args.save_baseline:
+        save_baseline(params, results, args.baseline)
+        print('baseline saved to {}'.format(args.baseline))
+        return 0
+    if baseline is None:
+        print('no baseline for these parameters, run with --save-baseline')
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    for name, metric, expected, value in regressions:
+        print('REGRESSION {} {}: {:.4g} -> {:.4g} (+{:.0%})'.format(name, metric, expected, value,
+                                                                   value / expected - 1))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
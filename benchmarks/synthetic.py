@@ -0,0 +1,60 @@
+"""Seeded synthetic flat records for the benchmarks.
+
+Records have one field per key level, key0, key1, ..., drawn from that level's cardinality with an optional Zipf
+skew, plus leaf_width leaf fields, f0, f1, ...: even ones are numbers and odd ones short strings.
+"""
+import itertools
+import json
+import random
+
+
+def key_names(levels):
+    return ['key{}'.format(level) for level in range(levels)]
+
+
+def make_records(number_of_records, levels=2, cardinality=(30, 200), skew=0.0, leaf_width=2, seed=0):
+    """Returns a list of flat records, the same for the same arguments.
+
+    Parameters
+    ----------
+    number_of_records : int
+        number of records
+    levels : int
+        number of key fields
+    cardinality : tuple
+        number of distinct values per key level; the last one is repeated for deeper levels
+    skew : float
+        Zipf exponent of the key values: 0 draws them uniformly, 1 or more concentrates the records on a few
+    leaf_width : int
+        number of fields besides the keys
+    seed : int
+        seed of the random generator
+
+    Returns
+    -------
+    records : list
+        flat dictionaries
+    """
+    rnd = random.Random(seed)
+    columns = []
+    for level in range(levels):
+        distinct = cardinality[min(level, len(cardinality) - 1)]
+        values = ['{}{}'.format(chr(ord('A') + level % 26), value) for value in range(distinct)]
+        cum_weights = list(itertools.accumulate(1 / (rank + 1) ** skew for rank in range(distinct)))
+        columns.append(rnd.choices(values, cum_weights=cum_weights, k=number_of_records))
+    words = ['w{}'.format(i) for i in range(100)]
+    for field in range(leaf_width):
+        if field % 2 == 0:
+            columns.append([round(rnd.random() * 1000, 2) for _ in range(number_of_records)])
+        else:
+            columns.append(rnd.choices(words, k=number_of_records))
+    names = key_names(levels) + ['f{}'.format(field) for field in range(leaf_width)]
+    return [dict(zip(names, values)) for values in zip(*columns)]
+
+
+def write_ndjson(records, file_name):
+    """Writes records as a JSON Lines file."""
+    with open(file_name, 'w') as fp:
+        for record in records:
+            fp.write(json.dumps(record))
+            fp.write('\n')
@@ -0,0 +1,143 @@
+import io
+import threading
+from collections import Counter
+
+QUEUE_FULL = 'queue_full'
+WAIT_TIMEOUT = 'wait_timeout'
+BODY_TOO_LARGE = 'body_too_large'
+TOO_MANY_RECORDS = 'too_many_records'
+TOO_MANY_KEYS = 'too_many_keys'
+REASONS = (QUEUE_FULL, WAIT_TIMEOUT, BODY_TOO_LARGE, TOO_MANY_RECORDS, TOO_MANY_KEYS)
+
+
+class Rejected(Exception):
+    """Raised when a request is not admitted; reason is QUEUE_FULL or WAIT_TIMEOUT, or BODY_TOO_LARGE for a
+    BoundedStream."""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
+class AdmissionController:
+    """A thread-safe semaphore bounding the requests processed at once, with a short bounded wait queue.
+
+    A request arriving while max_concurrent are in flight waits for a slot, unless max_waiting requests are already
+    waiting, in which case it is rejected straight away; one still waiting after wait_timeout seconds is rejected
+    too. Rejections are counted per reason, including the payload limits the caller enforces, see reject.
+
+    Parameters
+    ----------
+    max_concurrent : int
+        maximum number of requests in flight, no limit if None
+    max_waiting : int
+        maximum number of requests waiting for a slot
+    wait_timeout : float
+        seconds a request may wait for a slot
+    """
+
+    def __init__(self, max_concurrent=4, max_waiting=8, wait_timeout=1.0):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = Counter()
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Takes a slot, waiting up to wait_timeout seconds for one.
+
+        Raises
+        ------
+        Rejected
+            If the wait queue is full or no slot freed up in time.
+
+        Returns
+        -------
+        release : callable
+            gives the slot back; calling it again does nothing, so it can be called from every path a request may
+            end on
+        """
+        with self._condition:
+            if self._has_slot():
+                return self._admit()
+            if self.waiting >= self.max_waiting:
+                self.rejected[QUEUE_FULL] += 1
+                raise Rejected(QUEUE_FULL, '{} requests in flight and {} waiting'.format(self.in_flight,
+                                                                                           self.waiting))
+            self.waiting += 1
+            try:
+                admitted = self._condition.wait_for(self._has_slot, timeout=self.wait_timeout)
+            finally:
+                self.waiting -= 1
+            if not admitted:
+                self.rejected[WAIT_TIMEOUT] += 1
+                raise Rejected(WAIT_TIMEOUT, 'no request slot freed up within {} seconds'.format(self.wait_timeout))
+            return self._admit()
+
+    def _release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def reject(self, reason):
+        """Counts a request rejected by the caller, e.g. BODY_TOO_LARGE."""
+        with self._condition:
+            self.rejected[reason] += 1
+
+    def stats(self):
+        """Returns the limits, the requests in flight and waiting, and the admission and rejection counters as a
+        json-serializable dict."""
+        with self._condition:
+            return {'max_concurrent': self.max_concurrent, 'max_waiting': self.max_waiting,
+                    'in_flight': self.in_flight, 'waiting': self.waiting, 'admitted': self.admitted,
+                    'rejected': {reason: self.rejected[reason] for reason in REASONS}}
+
+    def _has_slot(self):
+        return self.max_concurrent is None or self.in_flight < self.max_concurrent
+
+    def _admit(self):
+        # called with the lock held
+        self.in_flight += 1
+        self.admitted += 1
+        released = threading.Event()
+
+        def release():
+            if not released.is_set():
+                released.set()
+                self._release()
+
+        return release
+
+
+class BoundedStream(io.RawIOBase):
+    """A binary stream reading another one, e.g. a request body sent without Content-Length, that raises Rejected
+    with BODY_TOO_LARGE as soon as more than max_size bytes have been read.
+
+    Parameters
+    ----------
+    raw : file
+        the binary stream to read
+    max_size : int
+        maximum number of bytes
+    """
+
+    def __init__(self, raw, max_size):
+        super().__init__()
+        self.raw = raw
+        self.max_size = max_size
+        self.size = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        # one byte past the limit is enough to tell the body is too large
+        data = self.raw.read(min(len(buffer), self.max_size - self.size + 1))
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise Rejected(BODY_TOO_LARGE, 'The body exceeds {} bytes'.format(self.max_size))
+        buffer[:len(data)] = data
+        return len(data)
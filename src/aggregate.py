@@ -0,0 +1,117 @@
+from src import columnar
+from src import grouping
+
+REDUCERS = ('sum', 'count', 'min', 'max', 'mean')
+# accumulator slots per field: count, sum, min, max
+SLOTS = 4
+
+
+def parse_aggregations(spec):
+    """Parses reducers per field, e.g. 'amount:sum,mean;quantity:max'.
+
+    Parameters
+    ----------
+    spec : str
+        ';'-separated 'field:reducer,reducer...' items
+
+    Raises
+    ------
+    ValueError
+        If an item has no field or no reducers, or a reducer is unknown.
+
+    Returns
+    -------
+    aggregations : list
+        (field, tuple of reducers) tuples, in the given order
+    """
+    aggregations = []
+    for item in spec.split(';'):
+        field, _, reducers = item.strip().partition(':')
+        reducers = tuple(reducer.strip() for reducer in reducers.split(',') if reducer.strip())
+        if not field or not reducers:
+            raise ValueError('Invalid aggregation {!r}, expected field:reducer[,reducer...]'.format(item))
+        unknown = [reducer for reducer in reducers if reducer not in REDUCERS]
+        if unknown:
+            raise ValueError('Unknown reducer {!r}, expected one of {}'.format(unknown[0], ', '.join(REDUCERS)))
+        aggregations.append((field, reducers))
+    return aggregations
+
+
+def aggregate_json(keys_list, json_list, aggregations, sort=True):
+    """Nests a stream of flat dictionaries by the keys, reducing each group to per-field statistics instead of
+    a leaf array.
+
+    Every group holds one fixed-size accumulator (count, sum, min and max per field), so memory grows with the
+    number of groups, not records, and records can be consumed from an iterator one at a time. Records
+    missing a field, or with null, are left out of that field's statistics.
+
+    Parameters
+    ----------
+    keys_list : list
+        List of keys specified in command line arguments
+    json_list : iterable
+        List (or any iterable) of dictionaries inside json file
+    aggregations : list
+        (field, reducers) tuples, see parse_aggregations
+    sort : bool
+        If True, the keys at each level are sorted like group_json does.
+
+    Raises
+    ------
+    KeyError
+        If one the keys passed as argument is not a valid key.
+    TypeError
+        If none key is indicated as argument, or a value of an aggregated field is not a number.
+
+    Returns
+    -------
+    final_dict : dict
+        a nested dictionary of dictionaries of {field: {reducer: value}} dictionaries
+    """
+    if not keys_list:
+        print("Oops!  That was not valid number of keys.  Try again...")
+        raise TypeError('at least one key is required')
+
+    fields = list(dict.fromkeys(field for field, _ in aggregations))
+    slots = {field: position * SLOTS for position, field in enumerate(fields)}
+    field_slots = list(slots.items())
+    get_path = grouping.key_path(keys_list)
+    final_dict = {}
+    for record in json_list:
+        try:
+            path = get_path(record)
+        except KeyError as ke:
+            print("Oops!  That was not a valid key.  Try again...", ke)
+            raise KeyError(ke.args[0]) from None
+        # the leaf list created by leaf_for is used as the accumulator
+        accumulator = grouping.leaf_for(final_dict, path)
+        if not accumulator:
+            accumulator.extend([0, 0, None, None] * len(fields))
+        for field, slot in field_slots:
+            value = record.get(field)
+            if value is None:
+                continue
+            if type(value) not in (int, float):
+                raise TypeError('{!r} of field {!r} is not a number'.format(value, field))
+            accumulator[slot] += 1
+            accumulator[slot + 1] += value
+            if accumulator[slot] == 1 or value < accumulator[slot + 2]:
+                accumulator[slot + 2] = value
+            if accumulator[slot] == 1 or value > accumulator[slot + 3]:
+                accumulator[slot + 3] = value
+
+    if sort:
+        grouping.sort_nested_dict(final_dict, len(keys_list))
+    return columnar.map_leaves(final_dict, len(keys_list),
+                               lambda accumulator: reduce_accumulator(accumulator, aggregations, slots))
+
+
+def reduce_accumulator(accumulator, aggregations, slots):
+    """Turns a group's accumulator into {field: {reducer: value}}; min, max and mean are None for no values."""
+    statistics = {}
+    for field, reducers in aggregations:
+        count, total, minimum, maximum = accumulator[slots[field]:slots[field] + SLOTS]
+        values = {'sum': total, 'count': count, 'min': minimum, 'max': maximum,
+                  'mean': total / count if count else None}
+        statistics.setdefault(field, {}).update((reducer, values[reducer]) for reducer in reducers)
+    return statistics
@@ -1,10 +1,80 @@
-from flask import Flask, request, make_response
+import io
+import os
+import threading
+import time
+import uuid
+
+from flask import Flask, Response, current_app, g, jsonify, request, make_response, url_for
 from functools import wraps
 
-from werkzeug.exceptions import UnsupportedMediaType, BadRequest
+from werkzeug.exceptions import UnsupportedMediaType, BadRequest, Conflict, NotFound, RequestEntityTooLarge, \
+    TooManyRequests
 from http import HTTPStatus
 
+from src import admission
+from src import aggregate
+from src import cache
+from src import compression
+from src import jobs
+from src import json_codec
 from src import json_parser
+from src import leaves
+from src import metrics
+from src import nested_index
+from src import results
+from src import streaming
+
+OUTPUT_MODES = ('body', 'file', 'store')
+MODES = ('sync', 'async')
+OPERATIONS = ('add', 'remove')
+FORMATS = ('json', 'ndjson')
+NDJSON_MIMETYPE = 'application/x-ndjson'
+METRICS_MIMETYPE = 'text/plain; version=0.0.4'
+
+DEFAULT_CONFIG = {
+    # worker threads running mode=async jobs
+    'JOBS_WORKERS': 2,
+    # queued plus running jobs before new ones are rejected with 429
+    'JOBS_MAX_PENDING': 16,
+    # seconds a finished job and its result are kept
+    'JOBS_RESULT_TTL': 300,
+    # results of repeated synchronous requests kept in an LRU cache, 0 disables it
+    'CACHE_MAX_ENTRIES': 128,
+    # total size of the cached results
+    'CACHE_MAX_BYTES': 64 * 1024 * 1024,
+    # seconds a cached result stays valid, None for no expiry
+    'CACHE_TTL': None,
+    # store the records of named indexes as compact tuples against shared schemas
+    'INDEX_COMPACT_LEAVES': True,
+    # json backend parsing payloads and dumping results: json, orjson, ujson or auto; None reads $JFILE_JSON_CODEC
+    'JSON_CODEC': None,
+    # results kept for GET /jfile/<id>/<key>/... with output=store, least recently used dropped first
+    'RESULTS_MAX_ENTRIES': 32,
+    # seconds a stored result is kept, None for no expiry
+    'RESULTS_TTL': None,
+    # records per page of a leaf array, unless the request asks for another limit up to the maximum
+    'RESULTS_PAGE_SIZE': 1000,
+    'RESULTS_MAX_PAGE_SIZE': 10000,
+    # request latency and payload size histograms served by GET /metrics, nothing is recorded when False
+    'METRICS_ENABLED': True,
+    # a compressed request body inflating beyond this many bytes is rejected with 413
+    'MAX_DECOMPRESSED_BYTES': compression.DEFAULT_MAX_SIZE,
+    # level of the gzip, deflate or lzma compression of responses and results files
+    'COMPRESSION_LEVEL': 6,
+    # /jfile bodies larger than this are rejected with 413, from Content-Length before they are read, None for no
+    # limit; a compressed body is limited by MAX_DECOMPRESSED_BYTES once inflated
+    'MAX_BODY_BYTES': 256 * 1024 * 1024,
+    # /jfile payloads with more records are rejected with 413, None for no limit
+    'MAX_RECORDS': 5 * 1000 * 1000,
+    # /jfile requests nesting by more keys are rejected with 400, None for no limit
+    'MAX_KEYS': 32,
+    # /jfile requests processed at once, until their response body has been sent; None for no limit
+    'MAX_CONCURRENT_REQUESTS': 4,
+    # /jfile requests waiting for one of those slots, more are rejected with 429 straight away
+    'MAX_WAITING_REQUESTS': 8,
+    # seconds a waiting request may wait for a slot before it is rejected with 429
+    'ADMISSION_TIMEOUT': 1.0,
+}
 
 
 def auth_required(f):
@@ -21,8 +91,51 @@ def auth_required(f):
     return decorated
 
 
-def create_app():
+def create_app(config=None):
     application = Flask(__name__)
+    application.config.update(DEFAULT_CONFIG)
+    application.config.update(config or {})
+    application.extensions['codec'] = json_codec.get_codec(application.config['JSON_CODEC'])
+    application.extensions['jobs'] = jobs.JobQueue(workers=application.config['JOBS_WORKERS'],
+                                                   max_pending=application.config['JOBS_MAX_PENDING'],
+                                                   result_ttl=application.config['JOBS_RESULT_TTL'])
+    application.extensions['cache'] = cache.ResultCache(max_entries=application.config['CACHE_MAX_ENTRIES'],
+                                                        max_bytes=application.config['CACHE_MAX_BYTES'],
+                                                        ttl=application.config['CACHE_TTL'])
+    # named NestedIndex objects updated with index=<name>
+    application.extensions['indexes'] = {}
+    application.extensions['indexes_lock'] = threading.Lock()
+    application.extensions['results'] = results.ResultStore(max_entries=application.config['RESULTS_MAX_ENTRIES'],
+                                                            ttl=application.config['RESULTS_TTL'])
+    application.extensions['admission'] = admission.AdmissionController(
+        max_concurrent=application.config['MAX_CONCURRENT_REQUESTS'],
+        max_waiting=application.config['MAX_WAITING_REQUESTS'],
+        wait_timeout=application.config['ADMISSION_TIMEOUT'])
+
+    if application.config['METRICS_ENABLED']:
+        application.extensions['metrics'] = metrics.RequestMetrics()
+        application.before_request(start_timer)
+        application.after_request(record_request)
+
+        @application.route('/metrics')
+        @auth_required
+        def metrics_endpoint():
+            """
+            ---
+            get:
+              summary: request metrics
+              description: Request latency histograms per endpoint and status, the size distributions of the
+                /jfile request and response bodies and the /jfile admission counters, in the Prometheus text
+                exposition format.
+              responses:
+                200:
+                  description: The metrics.
+                  content:
+                    text/plain
+            """
+            exposition = current_app.extensions['metrics'].expose() + metrics.expose_admission(
+                current_app.extensions['admission'].stats())
+            return Response(exposition, mimetype=METRICS_MIMETYPE)
 
     @application.route('/')
     @auth_required
@@ -37,38 +150,391 @@ def create_app():
         post:
           summary: jfile
           description: jfile data endpoint. Performs only basic validation to ensure payloads are legal JSON.
-          consumes: [application/json]
+            Query parameters without a value are the keys to nest by, in order. Query parameters with a value
+            are options.
+          consumes: [application/json, application/x-ndjson]
           parameters:
+            - in: query
+              name: output
+              description: body (default) streams the nested document back in the response, file writes it
+                to a per-request results file instead, store keeps it in memory and answers 201 with an id whose
+                subtrees and paginated leaf arrays are served by GET /jfile/<id>/<key>/...
+              required: false
+              schema:
+                type: string
+                enum: [body, file, store]
+            - in: query
+              name: format
+              description: json (default) answers one nested document, ndjson one JSON Lines line per leaf
+                group, {"path": [key, ...], "records": [...]}, so consumers can start before the whole
+                tree is written.
+              required: false
+              schema:
+                type: string
+                enum: [json, ndjson]
+            - in: query
+              name: aggregate
+              description: reduce each group to statistics instead of a leaf array, e.g. amount:sum,mean or
+                amount:sum;quantity:min,max. Reducers are sum, count, min, max and mean.
+              required: false
+              schema:
+                type: string
+            - in: query
+              name: views
+              description: build several nested documents from one scan of the payload, one per ','-separated
+                list of keys, e.g. currency,country;country,city. The body is an object keyed by each list of
+                keys. Replaces the keys given as parameters without a value.
+              required: false
+              schema:
+                type: string
+            - in: query
+              name: mode
+              description: sync (default) nests the payload while the request waits, async queues it as a job
+                and answers 202 with the job status and its URL in the Location header.
+              required: false
+              schema:
+                type: string
+                enum: [sync, async]
+            - in: query
+              name: index
+              description: fold the payload into the named index instead of nesting it from scratch. The index
+                is created with the keys of its first request; later requests may omit the keys.
+              required: false
+              schema:
+                type: string
+            - in: query
+              name: op
+              description: with index, add (default) or remove the posted records.
+              required: false
+              schema:
+                type: string
+                enum: [add, remove]
+            - in: query
+              name: compress
+              description: with output=file, write the results file compressed, gzip (.gz suffix) or lzma
+                (.xz suffix). Response bodies are compressed according to the Accept-Encoding header instead.
+              required: false
+              schema:
+                type: string
+                enum: [gzip, lzma]
+            - in: header
+              name: Content-Encoding
+              description: gzip, deflate or lzma for a compressed body, inflated while it is parsed. A body
+                inflating beyond MAX_DECOMPRESSED_BYTES is rejected with 413.
+              required: false
+              schema:
+                type: string
             - in: body
               name: jfile
-              description: JSON file.
+              description: JSON file, a json array or one flat json record per line with content type
+                application/x-ndjson.
               required: true
               schema:
                 type: object
           responses:
             201:
-              description: Json was successfully pushed into json_parser.
+              description: Json was successfully pushed into json_parser. The body is the nested document, or
+                empty with an X-Result-File header when output=file.
+              content:
+                application/json
+            202:
+              description: The payload was queued as an async job.
               content:
                 application/json
             400:
-              description: Data failed validation and was rejected.
+              description: Data failed validation and was rejected, or too many keys.
+              content:
+                application/json
+            413:
+              description: The body or its records exceed MAX_BODY_BYTES, MAX_DECOMPRESSED_BYTES or MAX_RECORDS.
               content:
                 application/json
             415:
               description: Payload was not JSON according to content-type header.
               content:
                 application/json
+            409:
+              description: The keys do not match the keys of the index.
+              content:
+                application/json
+            429:
+              description: Too many requests are in flight and waiting, or too many async jobs are pending.
+              content:
+                application/json
             500:
               description: Generic error.
               content:
                 application/json
         """
-        return handle_posted_data(request, list(request.args))
+        list_of_keys, options = parse_query_args(request.args)
+        check_payload_limits(request, list_of_keys, options)
+        release = admit()
+        try:
+            response = make_response(handle_posted_data(request, list_of_keys, options))
+        except BaseException:
+            release()
+            raise
+        if response.is_streamed:
+            # nesting goes on while the body is streamed, so the slot is held until it has been sent
+            response.response = release_after(response.response, release)
+            response.call_on_close(release)
+        else:
+            release()
+        return response
+
+    @application.route('/jfile/admission')
+    @auth_required
+    def jfile_admission():
+        """
+        ---
+        get:
+          summary: jfile admission counters
+          description: The /jfile requests in flight and waiting for a slot, and how many were admitted and
+            rejected, per reason.
+          responses:
+            200:
+              description: The admission counters.
+        """
+        return jsonify(current_app.extensions['admission'].stats())
+
+    @application.route('/jfile/indexes/<name>', methods=['GET', 'DELETE'])
+    @auth_required
+    def jfile_index(name):
+        """
+        ---
+        get:
+          summary: jfile index
+          description: The nested document of a named index.
+          responses:
+            200:
+              description: The nested document.
+              content:
+                application/json
+            404:
+              description: Unknown index.
+        delete:
+          summary: drop a jfile index
+          responses:
+            204:
+              description: The index was dropped.
+            404:
+              description: Unknown index.
+        """
+        with current_app.extensions['indexes_lock']:
+            if request.method == 'DELETE':
+                if current_app.extensions['indexes'].pop(name, None) is None:
+                    raise NotFound('Unknown index {!r}'.format(name))
+                return '', HTTPStatus.NO_CONTENT
+            named_index = find_index(name)
+        final_json = named_index.snapshot()
+        codec = current_app.extensions['codec']
+        fragments = (streaming.dump_group(key, subtree, codec) for key, subtree in final_json.items())
+        return Response(streaming.iter_json_object(fragments, codec), mimetype='application/json')
+
+    @application.route('/jfile/<result_id>', defaults={'key_path': ''}, methods=['GET', 'DELETE'])
+    @application.route('/jfile/<result_id>/<path:key_path>')
+    @auth_required
+    def jfile_result(result_id, key_path):
+        """
+        ---
+        get:
+          summary: jfile stored result
+          description: The subtree or leaf array of a result stored with output=store, at the path of keys
+            given after the result id, e.g. /jfile/<id>/EUR/FR. Leaf arrays are paginated with offset and
+            limit; the total number of records is in the X-Total-Count header and the next page in a Link
+            header.
+          parameters:
+            - in: query
+              name: offset
+              required: false
+              schema:
+                type: integer
+            - in: query
+              name: limit
+              required: false
+              schema:
+                type: integer
+          responses:
+            200:
+              description: The subtree or a page of the leaf array.
+              content:
+                application/json
+            400:
+              description: Invalid offset or limit.
+            404:
+              description: Unknown or expired result, or unknown path.
+        delete:
+          summary: drop a jfile stored result
+          responses:
+            204:
+              description: The result was dropped.
+            404:
+              description: Unknown result.
+        """
+        if request.method == 'DELETE':
+            if not current_app.extensions['results'].delete(result_id):
+                raise NotFound('Unknown or expired result {!r}'.format(result_id))
+            return '', HTTPStatus.NO_CONTENT
+        result = find_result(result_id)
+        path = key_path.split('/') if key_path else []
+        try:
+            node = result.lookup(path)
+        except KeyError:
+            raise NotFound('No {} in result {!r}'.format('/'.join(path), result_id))
+        codec = current_app.extensions['codec']
+        if isinstance(node, dict):
+            fragments = (streaming.dump_group(key, subtree, codec) for key, subtree in node.items())
+            return Response(streaming.iter_json_object(fragments, codec), mimetype='application/json')
+
+        offset, limit = parse_page(request.args)
+        headers = {'X-Total-Count': str(len(node))}
+        if offset + limit < len(node):
+            headers['Link'] = '<{}>; rel="next"'.format(url_for('jfile_result', result_id=result_id,
+                                                                key_path=key_path, offset=offset + limit,
+                                                                limit=limit))
+        page = node[offset:offset + limit]
+        return Response(codec.dumps(page, default=leaves.json_default), mimetype='application/json',
+                        headers=headers)
+
+    @application.route('/jfile/cache')
+    @auth_required
+    def jfile_cache():
+        """
+        ---
+        get:
+          summary: jfile result cache counters
+          description: Hits, misses and evictions of the jfile result cache, and its current size.
+          responses:
+            200:
+              description: The cache counters.
+        """
+        return jsonify(current_app.extensions['cache'].stats())
+
+    @application.route('/jfile/jobs/<job_id>')
+    @auth_required
+    def jfile_job(job_id):
+        """
+        ---
+        get:
+          summary: jfile job status
+          description: Status of a mode=async jfile job, one of queued, running, done or failed.
+          responses:
+            200:
+              description: The job status, with the error if it failed.
+            404:
+              description: Unknown or expired job.
+        """
+        return jsonify(find_job(job_id).to_dict())
+
+    @application.route('/jfile/jobs/<job_id>/result')
+    @auth_required
+    def jfile_job_result(job_id):
+        """
+        ---
+        get:
+          summary: jfile job result
+          description: The nested document built by a mode=async jfile job.
+          responses:
+            200:
+              description: The nested document.
+              content:
+                application/json
+            202:
+              description: The job is still queued or running; the body is its status.
+            404:
+              description: Unknown or expired job.
+            422:
+              description: The job failed; the body is its status with the error.
+        """
+        job = find_job(job_id)
+        if job.status == jobs.DONE:
+            return Response(job.result, mimetype='application/json')
+        if job.status == jobs.FAILED:
+            return jsonify(job.to_dict()), HTTPStatus.UNPROCESSABLE_ENTITY
+        return jsonify(job.to_dict()), HTTPStatus.ACCEPTED
 
     return application
 
 
-def handle_posted_data(request, list_of_args):
+def start_timer():
+    """Notes when the request started, for record_request."""
+    g.request_started = time.perf_counter()
+
+
+def record_request(response):
+    """Records the latency of a request once its response body has been sent, and for /jfile the size of the
+    request and response bodies. Streamed response bodies are counted as they are sent.
+
+    The endpoint label is the URL rule, e.g. /jfile/<result_id>, so ids do not create new series.
+
+    Parameters
+    ----------
+    response : flask.Response
+        the response to the current request
+
+    Returns
+    -------
+    response : flask.Response
+        the same response, with its body wrapped to be counted if it is streamed
+    """
+    request_metrics = current_app.extensions['metrics']
+    started = g.get('request_started', time.perf_counter())
+    method = request.method
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    status = str(response.status_code)
+    sizes = None
+    if endpoint == '/jfile' and method == 'POST':
+        request_metrics.request_size.observe(request.content_length or 0, request.mimetype or 'none')
+        if response.is_streamed:
+            sizes = [0]
+            response.response = count_bytes(response.response, sizes)
+        else:
+            sizes = [response.calculate_content_length() or 0]
+
+    def observe():
+        request_metrics.latency.observe(time.perf_counter() - started, method, endpoint, status)
+        if sizes is not None:
+            request_metrics.response_size.observe(sizes[0], status)
+
+    response.call_on_close(observe)
+    return response
+
+
+def count_bytes(chunks, sizes):
+    """Passes the chunks of a streamed response body through, adding their length to sizes[0]."""
+    try:
+        for chunk in chunks:
+            sizes[0] += len(chunk)
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def parse_query_args(args):
+    """Splits the request's query parameters into the keys to nest by and the options.
+
+    Parameters
+    ----------
+    args : MultiDict
+        request's query parameters, e.g. ?currency&country&output=file
+
+    Returns
+    -------
+    query_args : tuple
+        (list of the parameters without a value in order, dict of the parameters with a value)
+    """
+    list_of_keys = []
+    options = {}
+    for name, value in args.items(multi=True):
+        if value:
+            options[name] = value
+        else:
+            list_of_keys.append(name)
+    return list_of_keys, options
+
+
+def handle_posted_data(request, list_of_args, options=None):
     """Handles the control flow of the request.
 
     Parameters
@@ -77,16 +543,497 @@ def handle_posted_data(request, list_of_args):
         POST request
     list_of_args : list
         request's parameters list
+    options : dict
+        request's options, see parse_query_args
+
+    Raises
+    ------
+    *400* `Bad Request`
+        Raise if the keys are not valid for the payload or an option is not valid.
 
     Returns
     -------
     HTTPStatus : CREATED
-        201 code
+        201 code, with the nested document streamed in the body or the per-request results file in the
+        X-Result-File header
     """
+    options = options or {}
+    output = options.get('output', 'body')
+    if output not in OUTPUT_MODES:
+        raise bad_request('Invalid output {!r}, expected one of {}'.format(output, ', '.join(OUTPUT_MODES)))
+    mode = options.get('mode', 'sync')
+    if mode not in MODES:
+        raise bad_request('Invalid mode {!r}, expected one of {}'.format(mode, ', '.join(MODES)))
+    if mode == 'async' and output != 'body':
+        raise bad_request('output={} is not supported with mode=async'.format(output))
+    index_name = options.get('index')
+    operation = options.get('op', 'add')
+    if operation not in OPERATIONS:
+        raise bad_request('Invalid op {!r}, expected one of {}'.format(operation, ', '.join(OPERATIONS)))
+    if index_name is not None and (mode == 'async' or output != 'body'):
+        raise bad_request('index is not supported with mode=async or output=file|store')
+    output_format = options.get('format', 'json')
+    if output_format not in FORMATS:
+        raise bad_request('Invalid format {!r}, expected one of {}'.format(output_format, ', '.join(FORMATS)))
+    if output_format == 'ndjson' and (mode == 'async' or index_name is not None):
+        raise bad_request('format=ndjson is not supported with mode=async or index')
+    views = None
+    if 'views' in options:
+        if list_of_args or index_name is not None or mode == 'async' or output_format == 'ndjson':
+            raise bad_request('views is not supported with keys, index, mode=async or format=ndjson')
+        views = parse_views(options['views'])
+    aggregations = None
+    if 'aggregate' in options:
+        if index_name is not None or views is not None:
+            raise bad_request('aggregate is not supported with index or views')
+        try:
+            aggregations = aggregate.parse_aggregations(options['aggregate'])
+        except ValueError as e:
+            raise bad_request('{}'.format(e))
+    if output == 'store' and (views is not None or output_format == 'ndjson'):
+        raise bad_request('output=store is not supported with views or format=ndjson')
+    compress = options.get('compress')
+    if compress is not None and (output != 'file' or compress not in compression.FILE_SUFFIXES):
+        raise bad_request('compress must be one of {} and needs output=file; compressed responses follow '
+                          'Accept-Encoding'.format(', '.join(compression.FILE_SUFFIXES)))
+
+    # repeated synchronous requests are answered from the cache, by a hash of the raw body and the keys
+    key = None
+    if (mode == 'sync' and output == 'body' and index_name is None and output_format == 'json'
+            and current_app.config['CACHE_MAX_ENTRIES'] > 0 and request.is_json and not request.content_encoding):
+        key = cache.cache_key(read_body(request), list_of_args,
+                              {'aggregate': options.get('aggregate'), 'views': options.get('views')})
+        result = current_app.extensions['cache'].get(key)
+        if result is not None:
+            chunks, headers = encode_response([result], {'X-Cache': 'HIT'})
+            return Response(chunks, status=HTTPStatus.CREATED, mimetype='application/json', headers=headers)
+
     payload = validate_json(request)
-    json_parser.handle_control_flow(list_of_args, payload)
+    codec = current_app.extensions['codec']
+    if mode == 'async':
+        return submit_job(list_of_args, read_records(payload), aggregations)
+    if index_name is not None:
+        return update_index(index_name, list_of_args, payload, operation)
+    if output == 'store':
+        return store_result(list_of_args, payload, aggregations)
+
+    try:
+        if views is not None:
+            fragments = json_parser.nest_json_views(views, payload, codec=codec)
+        else:
+            fragments = json_parser.nest_json_fragments(list_of_args, payload, output_format=output_format,
+                                                        codec=codec, aggregations=aggregations)
+    except (KeyError, TypeError, ValueError) as e:
+        raise bad_request('Cannot nest the payload by {}: {!r}'.format(views or list_of_args, e))
+
+    if output == 'file':
+        file_name = json_parser.compressed_file_name(output_format, compress, uuid.uuid4().hex)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        streaming.stream_json_file(fragments, file_name, serialized=True, ndjson=output_format == 'ndjson',
+                                   codec=codec, compress=compress)
+        return '', HTTPStatus.CREATED, {'X-Result-File': file_name}
+
+    if output_format == 'ndjson':
+        chunks, headers = encode_response(fragments)
+        return Response(chunks, status=HTTPStatus.CREATED, mimetype=NDJSON_MIMETYPE, headers=headers)
+    chunks = streaming.iter_json_object(fragments, codec)
+    headers = {}
+    if key is not None:
+        chunks = current_app.extensions['cache'].tee(key, chunks)
+        headers['X-Cache'] = 'MISS'
+    chunks, headers = encode_response(chunks, headers)
+    return Response(chunks, status=HTTPStatus.CREATED, mimetype='application/json', headers=headers)
+
+
+def encode_response(chunks, headers=None):
+    """Compresses a response body with the best content coding the client accepts, if any.
+
+    Parameters
+    ----------
+    chunks : iterable
+        the str or bytes chunks of the body
+    headers : dict
+        the response headers, updated with Content-Encoding and Vary
+
+    Returns
+    -------
+    response : tuple
+        (chunks, headers)
+    """
+    headers = dict(headers or {})
+    headers['Vary'] = 'Accept-Encoding'
+    encoding = request.accept_encodings.best_match(compression.ENCODINGS)
+    if encoding is None:
+        return chunks, headers
+    headers['Content-Encoding'] = encoding
+    return compression.compress_chunks(chunks, encoding, current_app.config['COMPRESSION_LEVEL']), headers
+
+
+def store_result(list_of_keys, payload, aggregations=None):
+    """Nests (or aggregates) a payload and keeps the result in memory, addressable by id.
+
+    Leaf records are stored as compact tuples, see leaves.group_json_compact.
+
+    Parameters
+    ----------
+    list_of_keys : list
+        request's parameters list
+    payload : iterable
+        validated json, see validate_json
+    aggregations : list
+        (field, reducers) tuples to aggregate the groups by, see aggregate.parse_aggregations
 
-    return '', HTTPStatus.CREATED
+    Raises
+    ------
+    *400* `Bad Request`
+        Raise if the keys are not valid for the payload.
+
+    Returns
+    -------
+    HTTPStatus : CREATED
+        201 code with the result id, keys and URL, and the URL in the Location header
+    """
+    try:
+        if aggregations:
+            final_dict = aggregate.aggregate_json(list_of_keys, payload, aggregations)
+        else:
+            final_dict = leaves.group_json_compact(list_of_keys, payload)
+    except (KeyError, TypeError, ValueError) as e:
+        raise bad_request('Cannot nest the payload by {}: {!r}'.format(list_of_keys, e))
+    result_id = current_app.extensions['results'].put(list_of_keys, final_dict)
+    url = url_for('jfile_result', result_id=result_id)
+    return jsonify({'id': result_id, 'keys': list_of_keys, 'url': url}), HTTPStatus.CREATED, {'Location': url}
+
+
+def find_result(result_id):
+    """Returns the stored result with that id.
+
+    Raises
+    ------
+    *404* `Not Found`
+        Raise if the result is unknown, was dropped or has expired.
+    """
+    result = current_app.extensions['results'].get(result_id)
+    if result is None:
+        raise NotFound('Unknown or expired result {!r}'.format(result_id))
+    return result
+
+
+def parse_page(args):
+    """Reads the offset and limit query parameters of a leaf array page.
+
+    Raises
+    ------
+    *400* `Bad Request`
+        Raise if they are not non-negative integers, or limit is 0 or above RESULTS_MAX_PAGE_SIZE.
+
+    Returns
+    -------
+    page : tuple
+        (offset, limit)
+    """
+    try:
+        offset = int(args.get('offset', 0))
+        limit = int(args.get('limit', current_app.config['RESULTS_PAGE_SIZE']))
+    except ValueError:
+        raise bad_request('offset and limit must be integers')
+    if offset < 0 or not 0 < limit <= current_app.config['RESULTS_MAX_PAGE_SIZE']:
+        raise bad_request('offset must be >= 0 and limit between 1 and {}'.format(
+            current_app.config['RESULTS_MAX_PAGE_SIZE']))
+    return offset, limit
+
+
+def update_index(name, list_of_keys, payload, operation):
+    """Adds the payload to, or removes it from, a named index, creating the index on its first add.
+
+    Parameters
+    ----------
+    name : str
+        index name
+    list_of_keys : list
+        request's parameters list; may be empty once the index exists
+    payload : iterable
+        validated json, see validate_json
+    operation : str
+        add or remove
+
+    Raises
+    ------
+    *400* `Bad Request`
+        Raise if the keys are not valid for the payload.
+    *404* `Not Found`
+        Raise if records are removed from an unknown index.
+    *409* `Conflict`
+        Raise if the keys do not match the keys of the index.
+
+    Returns
+    -------
+    HTTPStatus : CREATED or OK
+        201 when records were added, 200 when removed, with the index keys and size
+    """
+    with current_app.extensions['indexes_lock']:
+        named_index = current_app.extensions['indexes'].get(name)
+        if named_index is None and operation == 'add':
+            try:
+                named_index = nested_index.NestedIndex(
+                    list_of_keys, compact=current_app.config['INDEX_COMPACT_LEAVES'])
+            except TypeError as e:
+                raise bad_request('Cannot create index {!r}: {}'.format(name, e))
+            current_app.extensions['indexes'][name] = named_index
+        elif named_index is None:
+            raise NotFound('Unknown index {!r}'.format(name))
+
+    if list_of_keys and list_of_keys != named_index.keys_list:
+        conflict_error = Conflict()
+        conflict_error.description = 'Index {!r} is nested by {}'.format(name, named_index.keys_list)
+        raise conflict_error
+    try:
+        if operation == 'add':
+            changed = named_index.add(payload)
+        else:
+            changed = named_index.remove(payload)
+    except (KeyError, TypeError, ValueError) as e:
+        raise bad_request('Cannot nest the payload by {}: {!r}'.format(named_index.keys_list, e))
+
+    status = {'index': name, 'keys': named_index.keys_list, 'records': len(named_index),
+              'added' if operation == 'add' else 'removed': changed}
+    return jsonify(status), HTTPStatus.CREATED if operation == 'add' else HTTPStatus.OK
+
+
+def find_index(name):
+    """Returns the named index.
+
+    Raises
+    ------
+    *404* `Not Found`
+        Raise if the index is unknown.
+    """
+    named_index = current_app.extensions['indexes'].get(name)
+    if named_index is None:
+        raise NotFound('Unknown index {!r}'.format(name))
+    return named_index
+
+
+def submit_job(list_of_keys, payload, aggregations=None):
+    """Queues the nesting of a payload as an async job.
+
+    Parameters
+    ----------
+    list_of_keys : list
+        request's parameters list
+    payload : list
+        validated json
+    aggregations : list
+        (field, reducers) tuples to aggregate the groups by, see aggregate.parse_aggregations
+
+    Raises
+    ------
+    *429* `Too Many Requests`
+        Raise if the job queue is full.
+
+    Returns
+    -------
+    HTTPStatus : ACCEPTED
+        202 code with the job status, and its URL in the Location header
+    """
+    try:
+        job = current_app.extensions['jobs'].submit(run_job, list_of_keys, payload, current_app.extensions['codec'],
+                                                    aggregations)
+    except jobs.QueueFull as e:
+        too_many_requests_error = TooManyRequests()
+        too_many_requests_error.description = '{}, try again later'.format(e)
+        raise too_many_requests_error
+    return jsonify(job.to_dict()), HTTPStatus.ACCEPTED, {'Location': url_for('jfile_job', job_id=job.id)}
+
+
+def run_job(list_of_keys, payload, codec, aggregations=None):
+    """Nests (or aggregates) a payload in a job worker and returns the serialized document."""
+    fragments = json_parser.nest_json_fragments(list_of_keys, payload, codec=codec, aggregations=aggregations)
+    return b''.join(streaming.iter_json_object(fragments, codec))
+
+
+def find_job(job_id):
+    """Returns the job with that id.
+
+    Raises
+    ------
+    *404* `Not Found`
+        Raise if the job is unknown or its result has expired.
+    """
+    job = current_app.extensions['jobs'].get(job_id)
+    if job is None:
+        raise NotFound('Unknown or expired job {!r}'.format(job_id))
+    return job
+
+
+def parse_views(spec):
+    """Parses the views option, ';'-separated lists of ','-separated keys, e.g. currency,country;country,city.
+
+    Raises
+    ------
+    *400* `Bad Request`
+        Raise if a view has no keys.
+
+    Returns
+    -------
+    key_lists : list
+        one list of keys per view
+    """
+    key_lists = [[key.strip() for key in view.split(',') if key.strip()] for view in spec.split(';')]
+    if not all(key_lists):
+        raise bad_request('Invalid views {!r}, expected key,key;key,key'.format(spec))
+    return key_lists
+
+
+def read_records(payload):
+    """Reads a whole validated payload into a list, e.g. before handing it to a job.
+
+    Raises
+    ------
+    *400* `Bad Request`
+        Raise if a JSON Lines payload has an invalid line.
+    """
+    try:
+        return list(payload)
+    except ValueError as e:
+        raise bad_request('{}'.format(e))
+
+
+def bad_request(description):
+    """Builds a *400* `Bad Request` error with a description."""
+    bad_request_error = BadRequest()
+    bad_request_error.description = description
+    return bad_request_error
+
+
+def request_stream(request):
+    """Returns the request body as a binary stream bounded by MAX_BODY_BYTES, see body_stream, inflated as it is
+    read if it has a Content-Encoding.
+
+    Raises
+    ------
+    *415* `Unsupported Media Type`
+        Raise if the Content-Encoding is not gzip, deflate or lzma.
+    """
+    encoding = (request.content_encoding or 'identity').strip().lower()
+    encoding = {'x-gzip': 'gzip'}.get(encoding, encoding)
+    if encoding == 'identity':
+        return body_stream(request)
+    if encoding not in compression.ENCODINGS:
+        raise UnsupportedMediaType('Unsupported Content-Encoding {!r}, expected one of {}'.format(
+            encoding, ', '.join(compression.ENCODINGS)))
+    return io.BufferedReader(compression.DecompressingStream(body_stream(request), encoding,
+                                                             current_app.config['MAX_DECOMPRESSED_BYTES']))
+
+
+def body_stream(request):
+    """Returns the request body as it was sent, as a binary stream bounded by MAX_BODY_BYTES.
+
+    A Content-Length over the limit is rejected before anything is read, see check_payload_limits, and werkzeug
+    stops reading at the Content-Length; a body sent without one raises admission.Rejected once it grows beyond
+    the limit, see admission.BoundedStream.
+    """
+    max_body_bytes = current_app.config['MAX_BODY_BYTES']
+    if max_body_bytes is None or request.content_length is not None:
+        return request.stream
+    return io.BufferedReader(admission.BoundedStream(request.stream, max_body_bytes))
+
+
+def read_body(request):
+    """Returns the whole request body, read once per request.
+
+    Raises
+    ------
+    *413* `Request Entity Too Large`
+        Raise if a body without Content-Length grows beyond MAX_BODY_BYTES.
+    """
+    if 'request_body' not in g:
+        try:
+            g.request_body = body_stream(request).read()
+        except admission.Rejected as e:
+            raise reject(e.reason, '{}'.format(e))
+    return g.request_body
+
+
+def limit_records(records):
+    """Passes records through while they are decoded, stopping at the first one over MAX_RECORDS.
+
+    Raises
+    ------
+    *413* `Request Entity Too Large`
+        Raise if there are more than MAX_RECORDS records, or the body grows beyond MAX_BODY_BYTES (or once
+        inflated, MAX_DECOMPRESSED_BYTES).
+    """
+    max_records = current_app.config['MAX_RECORDS']
+    try:
+        for number, record in enumerate(records, 1):
+            if max_records is not None and number > max_records:
+                break
+            yield record
+        else:
+            return
+    except (admission.Rejected, compression.DecompressedSizeError) as e:
+        raise reject(admission.BODY_TOO_LARGE, '{}'.format(e))
+    raise reject(admission.TOO_MANY_RECORDS, 'The payload has more than {} records'.format(max_records))
+
+
+def check_payload_limits(request, list_of_keys, options):
+    """Rejects a /jfile request nesting by too many keys, or whose Content-Length is over MAX_BODY_BYTES, before
+    anything is read; bodies without one are limited while they are read, see body_stream.
+
+    Raises
+    ------
+    *400* `Bad Request`
+        Raise if the request nests by more than MAX_KEYS keys.
+    *413* `Request Entity Too Large`
+        Raise if the Content-Length is over MAX_BODY_BYTES.
+    """
+    max_keys = current_app.config['MAX_KEYS']
+    depth = max([len(list_of_keys)] + [len(view.split(',')) for view in options.get('views', '').split(';')])
+    if max_keys is not None and depth > max_keys:
+        raise reject(admission.TOO_MANY_KEYS, 'Cannot nest by more than {} keys'.format(max_keys), BadRequest)
+    max_body_bytes = current_app.config['MAX_BODY_BYTES']
+    if max_body_bytes is not None and (request.content_length or 0) > max_body_bytes:
+        raise reject(admission.BODY_TOO_LARGE, 'The body exceeds {} bytes'.format(max_body_bytes))
+
+
+def admit():
+    """Takes one of the MAX_CONCURRENT_REQUESTS slots for the current request, see
+    admission.AdmissionController.acquire.
+
+    Raises
+    ------
+    *429* `Too Many Requests`
+        Raise if MAX_WAITING_REQUESTS requests are already waiting, or no slot freed up within ADMISSION_TIMEOUT.
+
+    Returns
+    -------
+    release : callable
+        gives the slot back
+    """
+    try:
+        return current_app.extensions['admission'].acquire()
+    except admission.Rejected as e:
+        too_many_requests_error = TooManyRequests(retry_after=1)
+        too_many_requests_error.description = '{}, try again later'.format(e)
+        raise too_many_requests_error
+
+
+def release_after(chunks, release):
+    """Passes the chunks of a streamed response body through, then releases its admission slot."""
+    try:
+        yield from chunks
+    finally:
+        release()
+
+
+def reject(reason, description, error_class=RequestEntityTooLarge):
+    """Counts a request rejected for a payload limit and builds its error, *413* `Request Entity Too Large` by
+    default."""
+    current_app.extensions['admission'].reject(reason)
+    error = error_class(description)
+    error.reason = reason
+    return error
 
 
 def validate_json(request):
@@ -109,18 +1056,34 @@ def validate_json(request):
     Returns
     -------
     json_payload : dict
-        validated json
+        validated json, or for an application/x-ndjson payload an iterator decoding its records in batches of
+        lines while it is consumed
     """
+    charset = request.mimetype_params.get('charset', 'utf-8')
+    if request.mimetype == NDJSON_MIMETYPE:
+        return limit_records(streaming.iter_ndjson(io.TextIOWrapper(request_stream(request), encoding=charset),
+                                                   codec=current_app.extensions['codec']))
     if not request.is_json:
         print("Warning! Bad content-type '{}' in payload".format(request.content_type))
         raise UnsupportedMediaType
+    if request.content_encoding:
+        # decoded one element at a time while it is inflated, instead of inflating the whole body first
+        try:
+            return list(limit_records(streaming.iter_json_array(io.TextIOWrapper(request_stream(request),
+                                                                                  encoding=charset))))
+        except ValueError as e:
+            raise bad_request('{}'.format(e))
+    body = read_body(request)
     try:
-        json_payload = request.get_json()
-        return json_payload
+        json_payload = current_app.extensions['codec'].loads(body)
     except Exception as e:
-        bad_request_error = BadRequest()
-        bad_request_error.description = '{}'.format(e)
-        raise bad_request_error
+        raise bad_request('{}'.format(e))
+    # parsed whole by the json backend, about four times faster than decoding it one element at a time, so
+    # MAX_RECORDS is checked once it is parsed; MAX_BODY_BYTES bounds the parse
+    max_records = current_app.config['MAX_RECORDS']
+    if max_records is not None and isinstance(json_payload, list) and len(json_payload) > max_records:
+        raise reject(admission.TOO_MANY_RECORDS, 'The payload has more than {} records'.format(max_records))
+    return json_payload
 
 
 if __name__ == '__main__':
@@ -0,0 +1,270 @@
+import json
+import mmap
+import struct
+
+from src import leaves
+from src import results
+from src import streaming
+
+EXTENSION = 'jbin'
+MAGIC = b'JBIN'
+VERSION = 1
+# magic, version, depth, number of leaf groups, then the offsets of the keys, table and sorted index sections
+HEADER = struct.Struct('<4sHHQQQQ')
+# per leaf group, in document order: data offset, data length, key offset, key length
+ENTRY = struct.Struct('<QQQQ')
+# per leaf group, in key order: position of its entry in the table
+POSITION = struct.Struct('<Q')
+# joins the encoded keys of a path; JSON strings escape control characters, so it never occurs inside a key
+PATH_SEPARATOR = b'\x1f'
+
+
+def encode_key(key):
+    """Encodes a key of the nested document as the JSON string json.dump writes for it."""
+    return json.dumps(results.json_key(key)).encode('utf-8')
+
+
+def encode_path(path):
+    """Encodes a path of keys as one bytes string, ordered so that every subtree is a contiguous prefix range."""
+    return PATH_SEPARATOR.join(encode_key(key) for key in path)
+
+
+def write_binary_result(groups, depth, file_name, codec=None):
+    """Creates a binary results file holding each serialized leaf array and a table of their key paths.
+
+    The file is a header, the leaf arrays dumped back to back in document order, their encoded key paths, a
+    fixed-width table of (data offset, data length, key offset, key length) entries in document order and the
+    table positions sorted by key path, so a reader can memory-map it and binary search a path without loading
+    anything else, see BinaryResult.
+
+    Parameters
+    ----------
+    groups : iterable
+        (top-level key, subtree) tuples, e.g. final_dict.items() or from streaming.iter_top_level_groups
+    depth : int
+        number of keys, i.e. dictionary levels above the leaf arrays
+    file_name : str
+        a str that contains the path and the name of the result file
+    codec : json_codec.Codec
+        the JSON backend dumping the leaf arrays, the json module if None
+
+    Raises
+    ------
+    IOError
+        If there is an error creating result file.
+
+    Returns
+    -------
+    number_of_leaves : int
+        number of leaf arrays written
+    """
+    try:
+        with open(file_name, 'wb') as fp:
+            fp.write(bytes(HEADER.size))
+            entries = []
+            keys = []
+            offset = HEADER.size
+            for path, leaf in streaming.iter_leaf_groups(groups, depth):
+                if codec is None:
+                    data = json.dumps(leaf, default=leaves.json_default).encode('utf-8')
+                else:
+                    data = codec.dumps(leaf, default=leaves.json_default)
+                fp.write(data)
+                entries.append((offset, len(data)))
+                keys.append(encode_path(path))
+                offset += len(data)
+
+            keys_offset = offset
+            key_offset = 0
+            for key in keys:
+                fp.write(key)
+            table_offset = keys_offset + sum(len(key) for key in keys)
+            for (data_offset, data_length), key in zip(entries, keys):
+                fp.write(ENTRY.pack(data_offset, data_length, key_offset, len(key)))
+                key_offset += len(key)
+            index_offset = table_offset + len(entries) * ENTRY.size
+            for position in sorted(range(len(keys)), key=keys.__getitem__):
+                fp.write(POSITION.pack(position))
+
+            fp.seek(0)
+            fp.write(HEADER.pack(MAGIC, VERSION, depth, len(entries), keys_offset, table_offset, index_offset))
+        print('[INFO] Binary file created in {}'.format(file_name))
+        return len(entries)
+    except FileNotFoundError as fnf_error:
+        print("I/O error: {}".format(fnf_error))
+
+
+class BinaryResult:
+    """Reads a file written by write_binary_result through a memory map, decoding only the requested subtrees.
+
+    Opening reads the header only; a lookup binary searches the sorted key paths and touches just the pages of
+    the leaf arrays below the path. Use it as a context manager, or call close.
+
+    Parameters
+    ----------
+    file_name : str
+        path of the binary results file
+    codec : json_codec.Codec
+        the JSON backend decoding the leaf arrays, the json module if None
+
+    Raises
+    ------
+    ValueError
+        If the file is not a binary results file of a supported version.
+    """
+
+    def __init__(self, file_name, codec=None):
+        self.loads = json.loads if codec is None else codec.loads
+        with open(file_name, 'rb') as fp:
+            self._mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < HEADER.size:
+            self.close()
+            raise ValueError('{} is not a binary results file'.format(file_name))
+        magic, version, self.depth, self._count, self._keys_offset, self._table_offset, self._index_offset = \
+            HEADER.unpack_from(self._mm)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('{} is not a binary results file of version {}'.format(file_name, VERSION))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._mm.close()
+
+    def __len__(self):
+        return self._count
+
+    def lookup(self, path=()):
+        """Decodes the subtree or leaf array at the end of a path of keys.
+
+        Parameters
+        ----------
+        path : iterable
+            keys from the top level down, as str like in the JSON document; the whole document if empty
+
+        Raises
+        ------
+        KeyError
+            If the path is not in the result.
+
+        Returns
+        -------
+        node : dict or list
+            like json.loads of the same part of the JSON document
+        """
+        path = tuple(path)
+        positions = self._positions(path)
+        if len(path) == self.depth:
+            return self.loads(self._data(positions[0]))
+        node = {}
+        for position in positions:
+            keys = self._key(position).split(PATH_SEPARATOR)[len(path):]
+            parent = node
+            for key in keys[:-1]:
+                parent = parent.setdefault(json.loads(key), {})
+            parent[json.loads(keys[-1])] = self.loads(self._data(position))
+        return node
+
+    def export(self, path=(), fp=None):
+        """Writes the subtree or leaf array at the end of a path of keys as JSON, copying the stored leaf arrays
+        as they are instead of decoding them.
+
+        Parameters
+        ----------
+        path : iterable
+            keys from the top level down, as str like in the JSON document; the whole document if empty
+        fp : file
+            a file opened in binary mode; the JSON is returned if None
+
+        Raises
+        ------
+        KeyError
+            If the path is not in the result.
+
+        Returns
+        -------
+        document : bytes
+            the JSON, if no fp is given
+        """
+        parts = self._iter_export(tuple(path))
+        if fp is None:
+            return b''.join(parts)
+        for part in parts:
+            fp.write(part)
+
+    def _iter_export(self, path):
+        positions = self._positions(path)
+        if len(path) == self.depth:
+            yield self._data(positions[0])
+            return
+        yield b'{'
+        previous = None
+        for position in positions:
+            keys = self._key(position).split(PATH_SEPARATOR)[len(path):]
+            common = 0
+            if previous is not None:
+                while common < len(keys) - 1 and keys[common] == previous[common]:
+                    common += 1
+                yield b'}' * (len(keys) - 1 - common) + b', '
+            for key in keys[common:-1]:
+                yield key + b': {'
+            yield keys[-1] + b': '
+            yield self._data(position)
+            previous = keys
+        if previous is not None:
+            yield b'}' * (len(previous) - 1)
+        yield b'}'
+
+    def _positions(self, path):
+        """Returns the table positions of the leaf groups below a path, in document order."""
+        if len(path) > self.depth:
+            raise KeyError(path)
+        if not path:
+            return range(self._count)
+        target = encode_path(path)
+        if len(path) == self.depth:
+            rank = self._lower_bound(target)
+            if rank < self._count and self._key(self._sorted(rank)) == target:
+                return [self._sorted(rank)]
+            raise KeyError(path)
+        prefix = target + PATH_SEPARATOR
+        positions = []
+        rank = self._lower_bound(prefix)
+        while rank < self._count:
+            position = self._sorted(rank)
+            if not self._key(position).startswith(prefix):
+                break
+            positions.append(position)
+            rank += 1
+        if not positions:
+            raise KeyError(path)
+        return sorted(positions)
+
+    def _lower_bound(self, target):
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(self._sorted(middle)) < target:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _sorted(self, rank):
+        return POSITION.unpack_from(self._mm, self._index_offset + rank * POSITION.size)[0]
+
+    def _entry(self, position):
+        return ENTRY.unpack_from(self._mm, self._table_offset + position * ENTRY.size)
+
+    def _key(self, position):
+        key_offset, key_length = self._entry(position)[2:]
+        start = self._keys_offset + key_offset
+        return self._mm[start:start + key_length]
+
+    def _data(self, position):
+        data_offset, data_length = self._entry(position)[:2]
+        return self._mm[data_offset:data_offset + data_length]
@@ -0,0 +1,123 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def cache_key(body, list_of_keys, options=None):
+    """Builds the cache key of a request from its raw body, its ordered list of keys and the options that change
+    the result.
+
+    Parameters
+    ----------
+    body : bytes
+        raw request body
+    list_of_keys : list
+        request's parameters list, in order
+    options : dict
+        options changing the result, e.g. the aggregations
+
+    Returns
+    -------
+    key : tuple
+        (sha256 hex digest of the body, tuple of keys, sorted tuple of options)
+    """
+    return hashlib.sha256(body).hexdigest(), tuple(list_of_keys), tuple(sorted((options or {}).items()))
+
+
+class ResultCache:
+    """A thread-safe LRU cache of serialized results, bounded by number of entries and total size.
+
+    Parameters
+    ----------
+    max_entries : int
+        maximum number of cached results
+    max_bytes : int
+        maximum total length of the cached results; a result larger than this is not cached
+    ttl : float
+        seconds a result stays valid, forever if None
+    clock : callable
+        returns the current time in seconds, time.monotonic by default
+    """
+
+    def __init__(self, max_entries=128, max_bytes=64 * 1024 * 1024, ttl=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached result for key, or None, counting a hit or a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and entry[1] <= self.clock():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, result):
+        """Caches a result, evicting the least recently used ones to stay within the bounds."""
+        size = len(result)
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        expires_at = None if self.ttl is None else self.clock() + self.ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (result, expires_at)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def tee(self, key, chunks):
+        """Passes chunks of a result through, caching the joined result once they are all consumed.
+
+        Results growing past max_bytes stop being collected, so a streamed response is never held in full
+        just to be cached.
+
+        Parameters
+        ----------
+        key : tuple
+            the cache key, see cache_key
+        chunks : iterable
+            str or bytes chunks of the result
+
+        Yields
+        ------
+        chunk : str or bytes
+        """
+        parts = []
+        size = 0
+        for chunk in chunks:
+            yield chunk
+            if parts is not None:
+                size += len(chunk)
+                if size > self.max_bytes:
+                    parts = None
+                else:
+                    parts.append(chunk)
+        if parts is not None:
+            self.put(key, b''.join(parts) if parts and isinstance(parts[0], bytes) else ''.join(parts))
+
+    def stats(self):
+        """Returns the hit, miss and eviction counters and the current size as a json-serializable dict."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._entries), 'bytes': self._bytes}
+
+    def _remove(self, key):
+        # called with the lock held
+        result, _ = self._entries.pop(key)
+        self._bytes -= len(result)
@@ -0,0 +1,223 @@
+from itertools import repeat
+from operator import itemgetter
+
+from src import grouping
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, group_json is used instead
+    np = None
+
+
+def columnar_group_json(keys_list, json_list, sort=True, as_columns=False):
+    """Groups a list of flat dictionaries with a fixed schema using numpy column operations.
+
+    The grouping columns are dictionary-encoded into integer codes, and a stable numpy.lexsort over the
+    codes gives the group boundaries. Leaves are only materialized once the groups are known, either as
+    records or as column slices. Falls back to grouping.group_json when numpy is not installed, the records
+    do not share one schema, or sort is False.
+
+    Parameters
+    ----------
+    keys_list : list
+        List of keys specified in command line arguments
+    json_list : iterable
+        List (or any iterable) of dictionaries inside json file
+    sort : bool
+        If True, the keys at each level are sorted like group_json does.
+    as_columns : bool
+        If True, each leaf is a dict of field -> list of values (a column slice) instead of a list of records.
+
+    Raises
+    ------
+    KeyError
+        If one the keys passed as argument is not a valid key.
+    TypeError
+        If none key is indicated as argument
+    ValueError
+        If as_columns is True and the records do not share one schema.
+
+    Returns
+    -------
+    final_dict : dict
+        a nested dictionary of dictionaries of arrays (or of column dicts)
+    """
+    if not keys_list:
+        print("Oops!  That was not valid number of keys.  Try again...")
+        raise TypeError('at least one key is required')
+
+    json_list = json_list if isinstance(json_list, list) else list(json_list)
+    fields = common_fields(json_list)
+    if fields is not None and not set(keys_list).issubset(fields):
+        missing = next(key for key in keys_list if key not in fields)
+        print("Oops!  That was not a valid key.  Try again...", repr(missing))
+        raise KeyError(missing)
+
+    if np is None or not sort or fields is None or not json_list:
+        if as_columns and fields is None:
+            raise ValueError('leaves can only be returned as columns when all records share one schema')
+        final_dict = grouping.group_json(keys_list, json_list, sort=sort)
+        if as_columns:
+            leaf_fields = [field for field in fields if field not in keys_list]
+            final_dict = map_leaves(final_dict, len(keys_list), lambda leaf: records_to_columns(leaf_fields, leaf))
+        return final_dict
+
+    uniques, codes = [], []
+    for key in keys_list:
+        key_uniques, key_codes = encode_column(list(map(itemgetter(key), json_list)))
+        uniques.append(key_uniques)
+        codes.append(key_codes)
+
+    # lexsort sorts by the last array first and is stable, so equal paths keep their input order
+    order = np.lexsort(codes[::-1])
+    sorted_codes = np.stack(codes)[:, order]
+    del codes
+    changes = np.any(sorted_codes[:, 1:] != sorted_codes[:, :-1], axis=0)
+    starts = np.concatenate(([0], np.flatnonzero(changes) + 1)).tolist()
+    ends = starts[1:] + [len(order)]
+    group_codes = sorted_codes[:, starts].T.tolist()
+    del sorted_codes
+
+    leaf_fields = tuple(field for field in fields if field not in keys_list)
+    leaf_columns = [sort_column(list(map(itemgetter(field), json_list)), order) for field in leaf_fields]
+    if as_columns:
+        leaves = None
+    elif leaf_fields:
+        leaves = list(map(dict, map(zip, repeat(leaf_fields), zip(*leaf_columns))))
+    else:
+        leaves = [{} for _ in range(len(order))]
+
+    # groups come in sorted order, so a group only opens new nodes below the first level where its path
+    # differs from the previous one
+    final_dict = {}
+    nodes = [final_dict]
+    previous_codes = None
+    last_level = len(keys_list) - 1
+    for path_codes, start, end in zip(group_codes, starts, ends):
+        level = 0
+        if previous_codes is not None:
+            while path_codes[level] == previous_codes[level]:
+                level += 1
+            del nodes[level + 1:]
+        for depth in range(level, last_level):
+            child = nodes[depth][uniques[depth][path_codes[depth]]] = {}
+            nodes.append(child)
+        if as_columns:
+            leaf = {field: column[start:end] for field, column in zip(leaf_fields, leaf_columns)}
+        else:
+            leaf = leaves[start:end]
+        nodes[last_level][uniques[last_level][path_codes[last_level]]] = leaf
+        previous_codes = path_codes
+    return final_dict
+
+
+def encode_column(column):
+    """Dictionary-encodes a grouping column, numbering its distinct values in sorted order.
+
+    Parameters
+    ----------
+    column : list
+        the values of one grouping key
+
+    Raises
+    ------
+    TypeError
+        If the values cannot be sorted, like group_json with sort=True.
+
+    Returns
+    -------
+    column_encoded : tuple
+        (sorted distinct values, numpy array of the position of each value among them)
+    """
+    codes = dict.fromkeys(column)
+    sorted_uniques = sorted(codes)
+    for code, value in enumerate(sorted_uniques):
+        codes[value] = code
+    return sorted_uniques, np.fromiter(map(codes.__getitem__, column), dtype=np.intp, count=len(column))
+
+
+def sort_column(column, order):
+    """Reorders a column of python objects with a numpy permutation.
+
+    Parameters
+    ----------
+    column : list
+        the values of one field, in input order
+    order : numpy.ndarray
+        the positions of the values in sorted order
+
+    Returns
+    -------
+    sorted_column : list
+    """
+    values = np.empty(len(column), dtype=object)
+    values[:] = column
+    return values[order].tolist()
+
+
+def common_fields(json_list):
+    """Returns the fields shared by all records, in order, or None if the records do not share one schema.
+
+    Records with the same fields in a different order count as different schemas, since the order shows in
+    the leaves.
+
+    Parameters
+    ----------
+    json_list : list
+        List of dictionaries inside json file
+
+    Returns
+    -------
+    fields : tuple
+    """
+    if not json_list or not isinstance(json_list[0], dict):
+        return None
+    schemas = set(map(tuple, json_list))
+    if len(schemas) != 1:
+        return None
+    return schemas.pop()
+
+
+def records_to_columns(leaf_fields, leaf):
+    """Turns a leaf array of records into a dict of field -> list of values.
+
+    Parameters
+    ----------
+    leaf_fields : list
+        the fields of the records
+    leaf : list
+        a leaf array of records
+
+    Returns
+    -------
+    columns : dict
+    """
+    return {field: [record[field] for record in leaf] for field in leaf_fields}
+
+
+def map_leaves(final_dict, depth, function):
+    """Replaces every leaf array of a nested dictionary with function(leaf), in place and without recursion.
+
+    Parameters
+    ----------
+    final_dict : dict
+        a nested dictionary of dictionaries of arrays
+    depth : int
+        number of dictionary levels above the leaf arrays
+    function : callable
+        leaf array -> new leaf
+
+    Returns
+    -------
+    final_dict : dict
+        the same dictionary
+    """
+    stack = [(final_dict, 1)]
+    while stack:
+        node, level = stack.pop()
+        for key, child in node.items():
+            if level == depth:
+                node[key] = function(child)
+            else:
+                stack.append((child, level + 1))
+    return final_dict
@@ -0,0 +1,176 @@
+import gzip
+import io
+import lzma
+import zlib
+
+# content codings accepted for request bodies and offered for responses, in order of preference
+ENCODINGS = ('gzip', 'deflate', 'lzma')
+# codings results files can be written with, and the suffix added to their name
+FILE_SUFFIXES = {'gzip': '.gz', 'lzma': '.xz'}
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+class DecompressedSizeError(ValueError):
+    """Raised when a compressed body inflates beyond the allowed size, e.g. a zip bomb."""
+
+
+def decompressor(encoding):
+    """Returns a decompressor object for a content coding.
+
+    Raises
+    ------
+    ValueError
+        If the coding is not one of ENCODINGS.
+    """
+    if encoding == 'gzip':
+        return zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    if encoding == 'deflate':
+        # zlib-wrapped as HTTP specifies; raw deflate from non-conforming clients is detected, see DecompressingStream
+        return zlib.decompressobj(wbits=zlib.MAX_WBITS)
+    if encoding == 'lzma':
+        return lzma.LZMADecompressor()
+    raise ValueError('Unsupported content encoding {!r}, expected one of {}'.format(encoding, ', '.join(ENCODINGS)))
+
+
+class DecompressingStream(io.RawIOBase):
+    """A binary stream inflating a compressed stream as it is read, so the body never has to be held whole.
+
+    Each read inflates at most the requested size, so memory is bounded by the read size, not by the compression
+    ratio, and reading stops with DecompressedSizeError once max_size bytes have been produced.
+
+    Parameters
+    ----------
+    raw : file
+        binary stream of the compressed body, e.g. request.stream
+    encoding : str
+        one of ENCODINGS; concatenated gzip members are read one after the other
+    max_size : int
+        maximum number of decompressed bytes
+
+    Raises
+    ------
+    ValueError
+        If the coding is not one of ENCODINGS.
+    """
+
+    def __init__(self, raw, encoding, max_size=DEFAULT_MAX_SIZE):
+        super().__init__()
+        self.raw = raw
+        self.encoding = encoding
+        self.max_size = max_size
+        self.size = 0
+        self._decompressor = decompressor(encoding)
+        self._pending = b''
+        self._started = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        try:
+            data = self._inflate(len(buffer))
+        except (zlib.error, lzma.LZMAError) as e:
+            raise ValueError('Invalid {} body: {}'.format(self.encoding, e)) from None
+        buffer[:len(data)] = data
+        return len(data)
+
+    def _inflate(self, size):
+        while True:
+            if self._decompressor.eof:
+                if not self._next_member():
+                    return b''
+                continue
+            data = self._decompress(self._pending, size)
+            self._pending = self._unconsumed()
+            if data:
+                self.size += len(data)
+                if self.size > self.max_size:
+                    raise DecompressedSizeError('Decompressed body exceeds {} bytes'.format(self.max_size))
+                return data
+            if self._decompressor.eof:
+                continue
+            chunk = self.raw.read(CHUNK_SIZE)
+            if not chunk:
+                if self._started:
+                    raise ValueError('Compressed {} body ended before the end of its stream'.format(self.encoding))
+                return b''
+            if not self._started and self.encoding == 'deflate' and chunk[0] & 0x0f != 8:
+                # not a zlib header: raw deflate
+                self._decompressor = zlib.decompressobj(wbits=-zlib.MAX_WBITS)
+            self._started = True
+            self._pending += chunk
+
+    def _next_member(self):
+        """Starts decompressing the next gzip member after the end of a stream; returns False at the end."""
+        # everything after the end of the stream is in unused_data
+        rest = self._decompressor.unused_data
+        self._pending = b''
+        if self.encoding != 'gzip':
+            return False
+        if not rest:
+            rest = self.raw.read(CHUNK_SIZE)
+            if not rest:
+                return False
+        self._decompressor = decompressor(self.encoding)
+        self._pending = rest
+        return True
+
+    def _decompress(self, data, size):
+        if isinstance(self._decompressor, lzma.LZMADecompressor):
+            return self._decompressor.decompress(data, max_length=size)
+        return self._decompressor.decompress(data, size)
+
+    def _unconsumed(self):
+        if isinstance(self._decompressor, lzma.LZMADecompressor):
+            # the lzma decompressor keeps the input it has not consumed yet
+            return b''
+        return self._decompressor.unconsumed_tail
+
+
+def compress_chunks(chunks, encoding, level=6):
+    """Compresses a stream of str or bytes chunks, e.g. a streamed response body.
+
+    Parameters
+    ----------
+    chunks : iterable
+        str (encoded as UTF-8) or bytes chunks
+    encoding : str
+        one of ENCODINGS
+    level : int
+        compression level, 0-9
+
+    Yields
+    ------
+    chunk : bytes
+        the compressed stream, skipping empty chunks
+    """
+    if encoding == 'lzma':
+        compressor = lzma.LZMACompressor(preset=level)
+    else:
+        compressor = zlib.compressobj(level, wbits=zlib.MAX_WBITS | 16 if encoding == 'gzip' else zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def open_file(file_name, mode, encoding=None):
+    """Opens a results file, compressed with encoding if given, see FILE_SUFFIXES.
+
+    Raises
+    ------
+    ValueError
+        If the coding is not one of FILE_SUFFIXES.
+    """
+    if encoding is None:
+        return open(file_name, mode)
+    if 'b' not in mode:
+        mode += 't'
+    if encoding == 'gzip':
+        return gzip.open(file_name, mode)
+    if encoding == 'lzma':
+        return lzma.open(file_name, mode)
+    raise ValueError('Unsupported file compression {!r}, expected one of {}'.format(
+        encoding, ', '.join(FILE_SUFFIXES)))
@@ -0,0 +1,226 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import daemon_client  # noqa: E402
+from src import json_parser  # noqa: E402
+
+DEFAULT_IDLE_TIMEOUT = 600
+
+
+class ThreadLocalStream:
+    """A stand-in for sys.stdout or sys.stderr writing to a per-thread buffer while a job runs on that thread, and
+    to the original stream otherwise, so concurrent jobs each get their own output."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+
+    def capture(self, buffer):
+        self._local.buffer = buffer
+
+    def release(self):
+        self._local.buffer = None
+
+    def buffer_for_thread(self):
+        """Returns the buffer capturing the current thread's output, None if it is not captured."""
+        return getattr(self._local, 'buffer', None)
+
+    def write(self, text):
+        buffer = getattr(self._local, 'buffer', None)
+        return (self.stream if buffer is None else buffer).write(text)
+
+    def flush(self):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """Runs one command line job per connection, see daemon_client for the protocol."""
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            # a connection without a job, e.g. daemon_client.is_listening
+            return
+        header = json.loads(line)
+        input_fp = io.TextIOWrapper(self.rfile, encoding='utf-8')
+        status, stdout, stderr = run_job(header['argv'], input_fp, header.get('cwd'), self.server.job_slot)
+        # the client may not have sent all of its input, e.g. when the arguments were invalid
+        self.request.shutdown(socket.SHUT_RD)
+        response = {'status': status, 'stdout': stdout, 'stderr': stderr}
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+def run_job(argv, input_fp, cwd=None, job_slot=None):
+    """Runs json_parser.main on the current thread, capturing what it prints.
+
+    Parameters
+    ----------
+    argv : list
+        json_parser command line arguments
+    input_fp : file
+        text stream of the input
+    cwd : str
+        directory relative paths in argv are relative to
+    job_slot : callable
+        If given, the job runs within job_slot(exclusive), exclusive when it forks worker processes, see
+        DaemonServer.job_slot
+
+    Returns
+    -------
+    result : tuple
+        (exit status, stdout, stderr)
+    """
+    stdout, stderr = io.StringIO(), io.StringIO()
+    sys.stdout.capture(stdout)
+    sys.stderr.capture(stderr)
+    try:
+        with job_slot(forks_workers(argv)) if job_slot else contextlib.nullcontext():
+            json_parser.main(argv, input_fp, cwd)
+        status = 0
+    except SystemExit as e:
+        status = e.code if isinstance(e.code, int) else 1
+    except Exception:
+        traceback.print_exc()
+        status = 1
+    finally:
+        sys.stdout.release()
+        sys.stderr.release()
+    return status, stdout.getvalue(), stderr.getvalue()
+
+
+def forks_workers(argv):
+    """Returns True if a job runs worker processes, see json_parser.parse_args. Invalid arguments are left for
+    json_parser.main to report, so their usage message is only printed once."""
+    job_stderr = sys.stderr.buffer_for_thread()
+    sys.stderr.capture(io.StringIO())
+    try:
+        args = json_parser.parse_args(argv)
+    except SystemExit:
+        return False
+    finally:
+        sys.stderr.capture(job_stderr)
+    return (args.workers or os.cpu_count() or 1) > 1
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """A json_parser daemon serving jobs over a Unix socket, one thread per client, that shuts down after
+    idle_timeout seconds without jobs.
+
+    Jobs run concurrently, except the ones forking worker processes (--workers), which run alone: forking
+    while other threads run jobs could copy their half-held locks into the workers.
+
+    Parameters
+    ----------
+    socket_path : str
+        path of the Unix socket; a stale one left by a daemon that died is replaced
+    idle_timeout : float
+        seconds without running jobs before the daemon exits, never if None
+
+    Raises
+    ------
+    OSError
+        If another daemon is already listening on socket_path.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        if os.path.exists(socket_path):
+            if daemon_client.is_listening(socket_path):
+                raise OSError('a daemon is already listening on {}'.format(socket_path))
+            os.unlink(socket_path)
+        super().__init__(socket_path, JobHandler)
+        os.chmod(socket_path, 0o600)
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        self.running_jobs = 0
+        self.last_activity = time.monotonic()
+        self._exclusive_running = False
+        self._exclusive_waiting = 0
+        self._condition = threading.Condition()
+
+    @contextlib.contextmanager
+    def job_slot(self, exclusive=False):
+        """Runs a job alongside the others, or alone if exclusive; exclusive jobs waiting go first."""
+        with self._condition:
+            if exclusive:
+                self._exclusive_waiting += 1
+                try:
+                    self._condition.wait_for(lambda: not self._exclusive_running and self.running_jobs == 0)
+                finally:
+                    self._exclusive_waiting -= 1
+                self._exclusive_running = True
+            else:
+                self._condition.wait_for(lambda: not self._exclusive_running and not self._exclusive_waiting)
+            self.running_jobs += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.running_jobs -= 1
+                if exclusive:
+                    self._exclusive_running = False
+                self.last_activity = time.monotonic()
+                self._condition.notify_all()
+
+    def is_idle(self):
+        with self._condition:
+            return (self.idle_timeout is not None and self.running_jobs == 0
+                    and time.monotonic() - self.last_activity >= self.idle_timeout)
+
+    def serve(self, poll_interval=0.5):
+        """Serves jobs until the daemon has been idle for idle_timeout seconds, then removes the socket."""
+        streams = sys.stdout, sys.stderr
+        if not isinstance(sys.stdout, ThreadLocalStream):
+            sys.stdout, sys.stderr = ThreadLocalStream(sys.stdout), ThreadLocalStream(sys.stderr)
+        watchdog = threading.Thread(target=self._shutdown_when_idle, args=(poll_interval,), daemon=True)
+        watchdog.start()
+        try:
+            self.serve_forever(poll_interval)
+        finally:
+            sys.stdout, sys.stderr = streams
+            self.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def _shutdown_when_idle(self, poll_interval):
+        while not self.is_idle():
+            time.sleep(poll_interval)
+        self.shutdown()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m src.daemon',
+                                     description='Keeps json_parser loaded and runs the jobs of '
+                                                 'python -m src.daemon_client over a Unix socket.')
+    parser.add_argument('--socket', default=daemon_client.socket_path(), metavar='PATH',
+                        help='Unix socket to listen on (default: ${} or {})'.format(
+                            daemon_client.SOCKET_ENV_VAR, daemon_client.socket_path()))
+    parser.add_argument('--idle-timeout', type=float, default=DEFAULT_IDLE_TIMEOUT, metavar='SECONDS',
+                        help='exit after this long without jobs, 0 to never exit (default: {})'.format(
+                            DEFAULT_IDLE_TIMEOUT))
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    server = DaemonServer(args.socket, idle_timeout=args.idle_timeout or None)
+    print('[INFO] json_parser daemon listening on {}'.format(args.socket))
+    server.serve()
@@ -0,0 +1,120 @@
+# Thin client of the json_parser daemon (src/daemon.py), used like the command line, e.g.
+# ``python -m src.daemon_client currency country < input.json``. It only imports the standard library, so it
+# starts much faster than json_parser and its dependencies.
+#
+# Protocol: the client sends one JSON line, {"argv": [...], "cwd": "..."}, then the input until it shuts down its
+# side of the connection; the daemon answers one JSON line, {"status": 0, "stdout": "...", "stderr": "..."}.
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SOCKET_ENV_VAR = 'JSON_PARSER_SOCKET'
+CHUNK_SIZE = 64 * 1024
+# seconds to wait for a daemon started by the client to listen
+START_TIMEOUT = 10
+
+
+def socket_path():
+    """Returns the daemon's socket path: $JSON_PARSER_SOCKET, or one per user in the temporary directory."""
+    return os.environ.get(SOCKET_ENV_VAR) or os.path.join(tempfile.gettempdir(),
+                                                          'json_parser-{}.sock'.format(os.getuid()))
+
+
+def is_listening(path):
+    """Returns True if a daemon accepts connections on the socket."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+        return True
+    except OSError:
+        return False
+
+
+def start_daemon(path, timeout=START_TIMEOUT):
+    """Starts a daemon in the background, detached from the client, and waits for it to listen.
+
+    Raises
+    ------
+    TimeoutError
+        If the daemon does not listen within timeout seconds.
+    """
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.Popen([sys.executable, '-m', 'src.daemon', '--socket', path], cwd=project_dir,
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True)
+    deadline = time.monotonic() + timeout
+    while not is_listening(path):
+        if time.monotonic() > deadline:
+            raise TimeoutError('the json_parser daemon did not start on {}'.format(path))
+        time.sleep(0.01)
+
+
+def run(argv, input_fp=None, path=None, cwd=None, autostart=True):
+    """Runs a command line job on the daemon.
+
+    Parameters
+    ----------
+    argv : list
+        json_parser command line arguments
+    input_fp : file
+        binary stream forwarded as the input, nothing if None
+    path : str
+        the daemon's socket, see socket_path if None
+    cwd : str
+        directory relative paths in argv are relative to, the current one if None
+    autostart : bool
+        If True, a daemon is started when none is listening.
+
+    Returns
+    -------
+    response : dict
+        {'status': exit status, 'stdout': ..., 'stderr': ...}
+    """
+    path = path or socket_path()
+    if autostart and not is_listening(path):
+        start_daemon(path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        header = {'argv': list(argv), 'cwd': cwd or os.getcwd()}
+        sock.sendall(json.dumps(header).encode('utf-8') + b'\n')
+        # the input is sent from another thread, so an early answer (e.g. invalid arguments) is read without
+        # waiting for the end of the input
+        threading.Thread(target=send_input, args=(sock, input_fp), daemon=True).start()
+        with sock.makefile('rb') as fp:
+            line = fp.readline()
+    if not line:
+        return {'status': 1, 'stdout': '', 'stderr': 'the json_parser daemon closed the connection\n'}
+    return json.loads(line)
+
+
+def send_input(sock, input_fp):
+    """Forwards the input to the daemon, then shuts down the writing side of the connection."""
+    try:
+        while input_fp is not None:
+            chunk = input_fp.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            sock.sendall(chunk)
+        sock.shutdown(socket.SHUT_WR)
+    except OSError:
+        # the daemon stopped reading, e.g. invalid arguments; its answer says why
+        pass
+
+
+def main(argv):
+    input_file = any(arg == '--input-file' or arg.startswith('--input-file=') for arg in argv)
+    # unbuffered, so a sending thread still blocked on stdin does not hold a lock at exit
+    input_fp = None if input_file else open(sys.stdin.fileno(), 'rb', buffering=0, closefd=False)
+    response = run(argv, input_fp)
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    return response['status']
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
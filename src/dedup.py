@@ -0,0 +1,188 @@
+import argparse
+import json
+import sys
+
+from src import columnar
+from src import grouping
+
+COUNTS = 'counts'
+INDEX = 'index'
+MODES = (COUNTS, INDEX)
+
+
+class DedupLeaf:
+    """A leaf array that stores each distinct record once.
+
+    Records are told apart by a hash of their fields and values, see record_key. With INDEX, the position of
+    every appended record among the distinct ones is kept, so the leaf can be expanded back to the exact array;
+    with COUNTS only the number of occurrences of each distinct record is kept, and the expanded array lists
+    equal records next to each other in order of first occurrence.
+
+    Parameters
+    ----------
+    mode : str
+        COUNTS or INDEX
+    """
+
+    __slots__ = ('mode', 'records', 'positions', 'occurrences')
+
+    def __init__(self, mode=INDEX):
+        self.mode = mode
+        self.records = []
+        # record_key -> position in records
+        self.positions = {}
+        # one count per distinct record with COUNTS, one position per appended record with INDEX
+        self.occurrences = []
+
+    def append(self, record, key_set=frozenset()):
+        """Appends a flat dictionary without the fields in key_set; it is only copied when it is new."""
+        key = record_key(record, key_set)
+        position = self.positions.get(key)
+        if position is None:
+            position = self.positions[key] = len(self.records)
+            self.records.append(grouping.strip_record(key_set, record))
+            if self.mode == COUNTS:
+                self.occurrences.append(0)
+        if self.mode == COUNTS:
+            self.occurrences[position] += 1
+        else:
+            self.occurrences.append(position)
+
+    def to_dict(self):
+        """Returns the leaf as json-serializable {'records': [...], 'counts': [...]} or {'records': [...],
+        'index': [...]}."""
+        return {'records': self.records, self.mode: self.occurrences}
+
+
+def group_json_dedup(keys_list, json_list, sort=True, mode=INDEX):
+    """Groups a list of flat dictionaries like grouping.group_json, storing each distinct record of a leaf array
+    once, see DedupLeaf. expand_leaves turns the result back into the group_json one.
+
+    Parameters
+    ----------
+    keys_list : list
+        List of keys specified in command line arguments
+    json_list : iterable
+        List (or any iterable) of dictionaries inside json file
+    sort : bool
+        If True, the keys at each level are sorted afterwards.
+    mode : str
+        INDEX to keep the position of every record, COUNTS to keep the occurrences of each distinct one
+
+    Raises
+    ------
+    KeyError
+        If one the keys passed as argument is not a valid key.
+    TypeError
+        If none key is indicated as argument
+
+    Returns
+    -------
+    final_dict : dict
+        a nested dictionary of dictionaries of {'records': [...], 'index': [...]} (or 'counts') leaves
+    """
+    if not keys_list:
+        print("Oops!  That was not valid number of keys.  Try again...")
+        raise TypeError('at least one key is required')
+
+    get_path = grouping.key_path(keys_list)
+    key_set = frozenset(keys_list)
+    final_dict = {}
+    for record in json_list:
+        try:
+            path = get_path(record)
+        except KeyError as ke:
+            print("Oops!  That was not a valid key.  Try again...", ke)
+            raise KeyError(ke.args[0]) from None
+        leaf_for(final_dict, path, mode).append(record, key_set)
+
+    if sort:
+        grouping.sort_nested_dict(final_dict, len(keys_list))
+    return columnar.map_leaves(final_dict, len(keys_list), DedupLeaf.to_dict)
+
+
+def leaf_for(final_dict, path, mode):
+    """Like grouping.leaf_for, creating a DedupLeaf at the end of the path when it is missing."""
+    node = final_dict
+    for value in path[:-1]:
+        child = node.get(value)
+        if child is None:
+            child = node[value] = {}
+        node = child
+    leaf = node.get(path[-1])
+    if leaf is None:
+        leaf = node[path[-1]] = DedupLeaf(mode)
+    return leaf
+
+
+def record_key(record, key_set=frozenset()):
+    """Returns a hashable key equal for records that serialize the same, fields in the same order included.
+
+    Values are keyed with their type, so 1, 1.0 and True stay apart; lists and objects are keyed by their JSON.
+    """
+    key = []
+    for field, value in record.items():
+        if field in key_set:
+            continue
+        if isinstance(value, (list, dict)):
+            value = json.dumps(value)
+        key.append((field, type(value), value))
+    return tuple(key)
+
+
+def expand_leaves(final_dict, depth):
+    """Turns the leaves of a group_json_dedup result back into arrays of records, in place.
+
+    With INDEX leaves the result equals the grouping.group_json one.
+
+    Parameters
+    ----------
+    final_dict : dict
+        a nested dictionary of dictionaries of {'records': [...], 'index': [...]} (or 'counts') leaves
+    depth : int
+        number of dictionary levels above the leaves, the number of keys nested by
+
+    Raises
+    ------
+    ValueError
+        If a leaf is not a deduplicated one.
+
+    Returns
+    -------
+    final_dict : dict
+        the same dictionary, with arrays of records as leaves
+    """
+    return columnar.map_leaves(final_dict, depth, expand_leaf)
+
+
+def expand_leaf(leaf):
+    """Returns the array of records a deduplicated leaf stands for; each record is a copy."""
+    if not isinstance(leaf, dict) or 'records' not in leaf or not (INDEX in leaf) ^ (COUNTS in leaf):
+        raise ValueError('not a deduplicated leaf: {!r}'.format(leaf))
+    records = leaf['records']
+    if INDEX in leaf:
+        return [dict(records[position]) for position in leaf[INDEX]]
+    return [dict(record) for record, count in zip(records, leaf[COUNTS]) for _ in range(count)]
+
+
+def main(argv):
+    """Expands a results file written with json_parser --dedup-leaves, e.g.
+    ``python -m src.dedup docs/result.json --depth 2 --output-file docs/expanded.json``."""
+    parser = argparse.ArgumentParser(prog='python -m src.dedup',
+                                     description='Expands the deduplicated leaves of a json_parser results file.')
+    parser.add_argument('input_file', help='results file written with --dedup-leaves')
+    parser.add_argument('--depth', type=int, required=True, help='number of keys the file was nested by')
+    parser.add_argument('--output-file', metavar='PATH', help='write the expanded result to PATH, not stdout')
+    args = parser.parse_args(argv)
+    with open(args.input_file) as fp:
+        final_dict = expand_leaves(json.load(fp), args.depth)
+    if args.output_file:
+        with open(args.output_file, 'w') as fp:
+            json.dump(final_dict, fp)
+        print('[INFO] Json file created in {}'.format(args.output_file))
+    else:
+        json.dump(final_dict, sys.stdout)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
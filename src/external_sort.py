@@ -0,0 +1,180 @@
+import heapq
+import pickle
+import tempfile
+from operator import itemgetter
+
+from src import grouping
+
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024
+DEFAULT_MERGE_WIDTH = 64
+
+
+def external_sort(keys_list, json_list, memory_budget=DEFAULT_MEMORY_BUDGET, merge_width=DEFAULT_MERGE_WIDTH,
+                  tmp_dir=None):
+    """Sorts dictionaries by a list of keys without holding more than a memory budget of them at once.
+
+    Records are pickled as they arrive and collected into runs of at most memory_budget bytes. Each run is
+    sorted and spilled to an anonymous temporary file, and the runs are k-way merged back into one sorted
+    stream. The sort is stable, so the order is the same as read_and_sort_json_file on the whole list.
+
+    Parameters
+    ----------
+    keys_list : list
+        List of keys specified in command line arguments
+    json_list : iterable
+        List (or any iterable) of dictionaries inside json file
+    memory_budget : int
+        approximate number of bytes of records kept in memory per run
+    merge_width : int
+        maximum number of runs merged at once; more runs are merged in several passes
+    tmp_dir : str
+        directory for the temporary run files, the system default if None
+
+    Raises
+    ------
+    KeyError
+        If one the keys passed as argument is not a valid key.
+    TypeError
+        If none key is indicated as argument
+
+    Yields
+    ------
+    record : dict
+        the dictionaries sorted by keys
+    """
+    get_path = sort_key(keys_list)
+    runs = []
+    try:
+        run = []
+        run_bytes = 0
+        for record in json_list:
+            data = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+            run.append((get_path(record), data))
+            run_bytes += len(data)
+            if run_bytes >= memory_budget:
+                runs.append(spill_run(run, tmp_dir))
+                run = []
+                run_bytes = 0
+
+        if not runs:
+            # everything fitted in the budget, nothing to spill
+            run.sort(key=itemgetter(0))
+            for _, data in run:
+                yield pickle.loads(data)
+            return
+
+        if run:
+            runs.append(spill_run(run, tmp_dir))
+        del run
+
+        while len(runs) > merge_width:
+            runs = [merge_runs(runs[i:i + merge_width], get_path, tmp_dir) for i in range(0, len(runs), merge_width)]
+
+        yield from heapq.merge(*[read_run(fp) for fp in runs], key=get_path)
+    finally:
+        for fp in runs:
+            fp.close()
+
+
+def sort_key(keys_list):
+    """Returns the record -> tuple of key values callable used to sort, reporting invalid keys like
+    read_and_sort_json_file.
+
+    Parameters
+    ----------
+    keys_list : list
+        List of keys specified in command line arguments
+
+    Raises
+    ------
+    TypeError
+        If none key is indicated as argument
+
+    Returns
+    -------
+    get_path : callable
+    """
+    if not keys_list:
+        print("Oops!  That was not valid number of keys.  Try again...")
+        raise TypeError('at least one key is required')
+    get_path = grouping.key_path(keys_list)
+
+    def checked_get_path(record):
+        try:
+            return get_path(record)
+        except KeyError as ke:
+            print("Oops!  That was not a valid key.  Try again...", ke)
+            raise
+
+    return checked_get_path
+
+
+def spill_run(run, tmp_dir=None):
+    """Sorts a run of (key, pickled record) tuples and writes the records to a temporary file.
+
+    Parameters
+    ----------
+    run : list
+        (sort key, pickled record) tuples in arrival order
+    tmp_dir : str
+        directory for the temporary file
+
+    Returns
+    -------
+    fp : file
+        the temporary file, positioned at its start. It is deleted when closed.
+    """
+    run.sort(key=itemgetter(0))
+    fp = tempfile.TemporaryFile(dir=tmp_dir)
+    for _, data in run:
+        fp.write(data)
+    fp.seek(0)
+    return fp
+
+
+def read_run(fp):
+    """Yields the records of a run file one at a time.
+
+    Parameters
+    ----------
+    fp : file
+        a run file written by spill_run or merge_runs
+
+    Yields
+    ------
+    record : dict
+    """
+    # a fresh unpickler per record, a long-lived one would keep every record alive in its memo
+    while True:
+        try:
+            yield pickle.load(fp)
+        except EOFError:
+            return
+
+
+def merge_runs(runs, get_path, tmp_dir=None):
+    """Merges several sorted run files into one, closing (and so deleting) the inputs.
+
+    Parameters
+    ----------
+    runs : list
+        sorted run files
+    get_path : callable
+        the sort key
+    tmp_dir : str
+        directory for the temporary file
+
+    Returns
+    -------
+    fp : file
+        the merged run file, positioned at its start
+    """
+    fp = tempfile.TemporaryFile(dir=tmp_dir)
+    pickler = pickle.Pickler(fp, pickle.HIGHEST_PROTOCOL)
+    for record in heapq.merge(*[read_run(run) for run in runs], key=get_path):
+        pickler.dump(record)
+        pickler.clear_memo()
+    for run in runs:
+        run.close()
+    fp.seek(0)
+    return fp
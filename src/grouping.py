@@ -0,0 +1,200 @@
+from operator import itemgetter
+
+
+def group_json(keys_list, json_list, sort=True, strip_keys=()):
+    """Groups a list of flat dictionaries into a nested dictionary of dictionaries of arrays in a single pass.
+
+    Each record is descended into the tree with setdefault, one level per key, and the record without the
+    grouping keys is appended to the leaf array. The input list and its dictionaries are left untouched.
+
+    Parameters
+    ----------
+    keys_list : list
+        List of keys specified in command line arguments
+    json_list : iterable
+        List (or any iterable) of dictionaries inside json file
+    sort : bool
+        If True, the keys at each level are sorted afterwards so the result matches the layout produced by
+        read_and_sort_json_file + zip_dicts + build_json. Otherwise keys keep their first-seen order.
+    strip_keys : iterable
+        extra keys to leave out of the leaf records, e.g. keys of enclosing levels grouped by elsewhere
+
+    Raises
+    ------
+    KeyError
+        If one the keys passed as argument is not a valid key.
+    TypeError
+        If none key is indicated as argument
+
+    Returns
+    -------
+    final_dict : dict
+        a nested dictionary of dictionaries of arrays
+    """
+    if not keys_list:
+        print("Oops!  That was not valid number of keys.  Try again...")
+        raise TypeError('at least one key is required')
+
+    get_path = key_path(keys_list)
+    key_set = frozenset(keys_list).union(strip_keys)
+    final_dict = {}
+    for record in json_list:
+        try:
+            path = get_path(record)
+        except KeyError as ke:
+            print("Oops!  That was not a valid key.  Try again...", ke)
+            raise KeyError(ke.args[0]) from None
+        leaf_for(final_dict, path).append(strip_record(key_set, record))
+
+    if sort:
+        sort_nested_dict(final_dict, len(keys_list))
+    return final_dict
+
+
+def group_json_views(key_lists, json_list, sort=True, share_records=False):
+    """Groups a list of flat dictionaries into several nested dictionaries, one per list of keys, in a single
+    pass over the input.
+
+    Neither the input list nor its dictionaries are modified, so the views can be built from one parsed payload
+    without copying it first. Leaves reference the same record objects across views wherever possible: the
+    stripped copy of a record is made once per distinct set of grouping keys, so views that only reorder the
+    same keys (currency, country and country, currency) share it.
+
+    Parameters
+    ----------
+    key_lists : list
+        lists of keys, one per view, outermost first
+    json_list : iterable
+        List (or any iterable) of dictionaries inside json file
+    sort : bool
+        If True, the keys at each level of every view are sorted like group_json does.
+    share_records : bool
+        If True, the leaves hold the input dictionaries themselves, grouping keys included, so no record is
+        copied at all.
+
+    Raises
+    ------
+    KeyError
+        If one the keys passed as argument is not a valid key.
+    TypeError
+        If no view, or a view without keys, is indicated
+
+    Returns
+    -------
+    views : list
+        one nested dictionary of dictionaries of arrays per list of keys, in the same order
+    """
+    if not key_lists or not all(key_lists):
+        print("Oops!  That was not valid number of keys.  Try again...")
+        raise TypeError('at least one key is required in every view')
+
+    key_sets = list(dict.fromkeys(frozenset(keys_list) for keys_list in key_lists))
+    # (path getter, position of the view's key set, view) per view
+    views = [(key_path(keys_list), key_sets.index(frozenset(keys_list)), {}) for keys_list in key_lists]
+    for record in json_list:
+        if share_records:
+            projections = [record] * len(key_sets)
+        else:
+            projections = [strip_record(key_set, record) for key_set in key_sets]
+        for get_path, position, final_dict in views:
+            try:
+                path = get_path(record)
+            except KeyError as ke:
+                print("Oops!  That was not a valid key.  Try again...", ke)
+                raise KeyError(ke.args[0]) from None
+            leaf_for(final_dict, path).append(projections[position])
+
+    if sort:
+        for keys_list, (_, _, final_dict) in zip(key_lists, views):
+            sort_nested_dict(final_dict, len(keys_list))
+    return [final_dict for _, _, final_dict in views]
+
+
+def leaf_for(final_dict, path):
+    """Descends a nested dictionary along a path of key values, creating missing levels on the way.
+
+    Parameters
+    ----------
+    final_dict : dict
+        a nested dictionary of dictionaries of arrays
+    path : tuple
+        the values of the grouping keys of one record, outermost first
+
+    Returns
+    -------
+    leaf : list
+        the leaf array at the end of the path
+    """
+    node = final_dict
+    for value in path[:-1]:
+        child = node.get(value)
+        if child is None:
+            child = node[value] = {}
+        node = child
+    leaf = node.get(path[-1])
+    if leaf is None:
+        leaf = node[path[-1]] = []
+    return leaf
+
+
+def strip_record(key_set, record):
+    """Returns a copy of the record without the grouping keys.
+
+    Parameters
+    ----------
+    key_set : frozenset
+        the grouping keys to leave out
+    record : dict
+        a flat dictionary
+
+    Returns
+    -------
+    stripped_record : dict
+    """
+    return {key: value for key, value in record.items() if key not in key_set}
+
+
+def key_path(keys_list):
+    """Returns a callable that extracts the tuple of grouping values of a record.
+
+    Parameters
+    ----------
+    keys_list : list
+        List of keys to nest by
+
+    Returns
+    -------
+    getter : callable
+        record -> tuple of values, always a tuple even for a single key
+    """
+    getter = itemgetter(*keys_list)
+    if len(keys_list) == 1:
+        return lambda record: (getter(record),)
+    return getter
+
+
+def sort_nested_dict(final_dict, depth):
+    """Sorts the keys at every level of a nested dictionary in place, without recursion.
+
+    Parameters
+    ----------
+    final_dict : dict
+        a nested dictionary of dictionaries of arrays
+    depth : int
+        number of dictionary levels above the leaf arrays
+
+    Returns
+    -------
+    final_dict : dict
+        the same dictionary, with every level in sorted key order
+    """
+    stack = [(final_dict, 1)]
+    while stack:
+        node, level = stack.pop()
+        items = sorted(node.items(), key=itemgetter(0))
+        node.clear()
+        node.update(items)
+        if level < depth:
+            for _, child in items:
+                stack.append((child, level + 1))
+    return final_dict
@@ -0,0 +1,113 @@
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue already holds its maximum number of pending jobs."""
+
+
+class Job:
+    """A unit of work submitted to a JobQueue and its outcome."""
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.finished_at = None
+
+    def to_dict(self):
+        """Returns the job status as a json-serializable dict, without the result."""
+        status = {'id': self.id, 'status': self.status}
+        if self.error is not None:
+            status['error'] = self.error
+        return status
+
+
+class JobQueue:
+    """A bounded in-process job queue run by a pool of worker threads.
+
+    At most max_pending jobs may be queued or running at once; submitting more raises QueueFull so callers
+    can push back. Finished jobs, with their results, are kept for result_ttl seconds.
+
+    Parameters
+    ----------
+    workers : int
+        number of worker threads
+    max_pending : int
+        maximum number of queued plus running jobs
+    result_ttl : float
+        seconds a finished job is kept before it expires
+    clock : callable
+        returns the current time in seconds, time.monotonic by default
+    """
+
+    def __init__(self, workers=2, max_pending=16, result_ttl=300, clock=time.monotonic):
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.clock = clock
+        self._jobs = {}
+        self._finished = deque()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='jfile-job')
+
+    def submit(self, function, *args):
+        """Queues function(*args) and returns its Job straight away.
+
+        Raises
+        ------
+        QueueFull
+            If max_pending jobs are already queued or running.
+
+        Returns
+        -------
+        job : Job
+        """
+        with self._lock:
+            self._expire()
+            if self._pending >= self.max_pending:
+                raise QueueFull('{} jobs are already pending'.format(self._pending))
+            job = Job(uuid.uuid4().hex)
+            self._jobs[job.id] = job
+            self._pending += 1
+        self._executor.submit(self._run, job, function, args)
+        return job
+
+    def get(self, job_id):
+        """Returns the job with that id, or None if it is unknown or has expired."""
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def shutdown(self, wait=True):
+        """Stops the worker threads once the queued jobs are done."""
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job, function, args):
+        job.status = RUNNING
+        try:
+            job.result = function(*args)
+            job.status = DONE
+        except Exception as e:
+            job.error = '{!r}'.format(e)
+            job.status = FAILED
+        finally:
+            with self._lock:
+                job.finished_at = self.clock()
+                self._finished.append(job)
+                self._pending -= 1
+
+    def _expire(self):
+        # called with the lock held; jobs are appended to _finished in the order they finish
+        deadline = self.clock() - self.result_ttl
+        while self._finished and self._finished[0].finished_at <= deadline:
+            del self._jobs[self._finished.popleft().id]
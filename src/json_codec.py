@@ -0,0 +1,101 @@
+import json
+import os
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, see get_codec
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # ujson is optional, see get_codec
+    ujson = None
+
+CODEC_ENV_VAR = 'JFILE_JSON_CODEC'
+DEFAULT_CODEC = 'json'
+# backends tried by 'auto', fastest first
+AUTO_ORDER = ('orjson', 'ujson', 'json')
+
+
+class Codec:
+    """A JSON backend: decodes bytes or str and encodes straight to UTF-8 bytes.
+
+    Codecs are pickled by name, so they can be handed to worker processes.
+
+    Parameters
+    ----------
+    name : str
+        the backend name, see get_codec
+    loads : callable
+        bytes or str -> python object
+    dumps : callable
+        (python object, default hook) -> bytes
+    separator : bytes
+        the separator the backend writes between object members, used when joining fragments
+    """
+
+    def __init__(self, name, loads, dumps, separator):
+        self.name = name
+        self.loads = loads
+        self._dumps = dumps
+        self.separator = separator
+
+    def dumps(self, obj, default=None):
+        """Serializes obj to bytes, calling default for objects the backend cannot serialize."""
+        return self._dumps(obj, default)
+
+    def __reduce__(self):
+        return get_codec, (self.name,)
+
+    def __repr__(self):
+        return 'Codec({!r})'.format(self.name)
+
+
+def stdlib_dumps(obj, default=None):
+    return json.dumps(obj, default=default).encode('utf-8')
+
+
+def orjson_dumps(obj, default=None):
+    return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def ujson_dumps(obj, default=None):
+    return ujson.dumps(obj, default=default).encode('utf-8')
+
+
+def available_codecs():
+    """Returns the names of the installed backends, in 'auto' order."""
+    installed = {'orjson': orjson is not None, 'ujson': ujson is not None, 'json': True}
+    return [name for name in AUTO_ORDER if installed[name]]
+
+
+def get_codec(name=None):
+    """Returns a JSON codec by name.
+
+    Parameters
+    ----------
+    name : str
+        'json' (the standard library, byte-identical to json.dump), 'orjson', 'ujson', or 'auto' for the fastest
+        installed one. If None, the JFILE_JSON_CODEC environment variable, or 'json' when it is not set.
+
+    Raises
+    ------
+    ValueError
+        If the backend is unknown or not installed.
+
+    Returns
+    -------
+    codec : Codec
+    """
+    name = name or os.environ.get(CODEC_ENV_VAR) or DEFAULT_CODEC
+    if name == 'auto':
+        name = available_codecs()[0]
+    if name == 'json':
+        return Codec('json', json.loads, stdlib_dumps, b', ')
+    if name not in AUTO_ORDER:
+        raise ValueError('Unknown JSON codec {!r}, expected one of auto, {}'.format(name, ', '.join(AUTO_ORDER)))
+    if name not in available_codecs():
+        raise ValueError('JSON codec {!r} is not installed'.format(name))
+    if name == 'orjson':
+        return Codec('orjson', orjson.loads, orjson_dumps, b',')
+    return Codec('ujson', ujson.loads, ujson_dumps, b',')
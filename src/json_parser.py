@@ -1,8 +1,30 @@
+import argparse
+import contextlib
 import sys
 import os
 import json
+import stat
 from operator import itemgetter
 
+if __package__ in (None, ''):
+    # allow running ``python json_parser.py`` from inside src/ as documented in the README
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import aggregate  # noqa: E402
+from src import binary_result  # noqa: E402
+from src import columnar  # noqa: E402
+from src import compression  # noqa: E402
+from src import dedup  # noqa: E402
+from src import external_sort  # noqa: E402
+from src import grouping  # noqa: E402
+from src import json_codec  # noqa: E402
+from src import leaves  # noqa: E402
+from src import mmap_ingest  # noqa: E402
+from src import parallel  # noqa: E402
+from src import planner  # noqa: E402
+from src import profiling  # noqa: E402
+from src import streaming  # noqa: E402
+
 
 def read_and_sort_json_file(keys_list, json_list):
     """Sorts json based on list of keys.
@@ -183,7 +205,7 @@ def strip_keys_final_dict(key, tmp_dict, aux_dict):
             return tmp_dict
 
 
-def build_json_file(final_json, file_name):
+def build_json_file(final_json, file_name, compress=None):
     """Creates a json file with the resulting nested dictionary of dictionaries of arrays
 
     Parameters
@@ -192,6 +214,8 @@ def build_json_file(final_json, file_name):
         a nested dictionary of dictionaries of arrays
     file_name : str
         a str that contains the path and the name of the result file
+    compress : str
+        If given, the file is compressed as it is written, 'gzip' or 'lzma'
 
     Raises
     ------
@@ -199,40 +223,443 @@ def build_json_file(final_json, file_name):
         If there is an error creating result file.
     """
     try:
-        with open(file_name, 'w') as fp:
+        with compression.open_file(file_name, 'w', compress) as fp:
             json.dump(final_json, fp)
         print('[INFO] Json file created in {}'.format(file_name))
     except FileNotFoundError as fnf_error:
         print("I/O error: {}".format(fnf_error))
 
 
-def handle_control_flow(list_of_keys, json_list_of_dicts):
+def result_file_name(request_id=None, extension='json'):
+    """Returns the path of the results file, docs/result.json in the project root directory, or
+    docs/results/result-<request_id>.json for a per-request results file, with another extension if given"""
+    path = os.path.abspath(__file__)
+    dir_path = os.path.dirname(path)
+    if request_id is None:
+        return dir_path[:-3] + 'docs/result.{}'.format(extension)
+    return dir_path[:-3] + 'docs/results/result-{}.{}'.format(request_id, extension)
+
+
+def compressed_file_name(output_format, compress=None, request_id=None):
+    """Returns the results file name for a format, with the suffix of its compression if any"""
+    file_name = result_file_name(request_id, extension=output_format)
+    return file_name + compression.FILE_SUFFIXES[compress] if compress else file_name
+
+
+def nest_json_groups(list_of_keys, json_list_of_dicts, presorted=False, memory_budget=None, workers=None,
+                     engine='hash', compact_leaves=False, aggregations=None, dedup_leaves=None):
+    """Nests the dictionaries by the keys and returns the result one (top-level key, subtree) group at a time
+
+    Invalid keys are reported before returning for the in-memory engines; with presorted input or a memory
+    budget the input is only consumed while iterating.
+
+    Parameters
+    ----------
+    list_of_keys : list
+        List of keys specified in command line arguments
+    json_list_of_dicts : iterable
+        List of dictionaries inside json file, or an iterator yielding them one at a time
+    presorted : bool
+        If True, the input is already sorted (or grouped) by the keys, and each top-level group is produced as
+        soon as it is complete instead of building the whole tree first.
+    memory_budget : int
+        If set, the input is sorted out of core, spilling sorted runs of about this many bytes to temporary
+        files, and then handled like presorted input. The result is the same as the in-memory path.
+    workers : int
+        If greater than 1, the input is nested in that many worker processes, sharded by the first key.
+    engine : str
+        'hash' nests with grouping.group_json, 'columnar' with columnar.columnar_group_json, which uses numpy
+        for records sharing one schema.
+    compact_leaves : bool
+        If True, the 'hash' engine stores the leaf records as tuples against shared schemas until they are
+        serialized, see leaves.group_json_compact. The output is the same.
+    aggregations : list
+        If given, (field, reducers) tuples: each group is reduced to per-field statistics in one streaming pass
+        instead of a leaf array, see aggregate.aggregate_json. presorted, memory_budget, workers, engine and
+        compact_leaves are not needed then and are ignored.
+    dedup_leaves : str
+        If given, 'index' or 'counts': the 'hash' engine stores each distinct record of a leaf array once,
+        with the position of every record or the occurrences of each distinct one, see dedup.group_json_dedup.
+
+    Returns
+    -------
+    groups : iterator
+        (top-level key, subtree) tuples in output order
+    """
+    if aggregations:
+        return iter(aggregate.aggregate_json(list_of_keys, json_list_of_dicts, aggregations).items())
+
+    if memory_budget:
+        json_list_of_dicts = external_sort.external_sort(list_of_keys, json_list_of_dicts, memory_budget)
+        presorted = True
+
+    if presorted:
+        return streaming.iter_top_level_groups(list_of_keys, json_list_of_dicts)
+
+    if workers and workers > 1:
+        final_json = parallel.parallel_group_json(list_of_keys, json_list_of_dicts, workers)
+    elif engine == 'columnar':
+        final_json = columnar.columnar_group_json(list_of_keys, json_list_of_dicts)
+    elif dedup_leaves:
+        final_json = dedup.group_json_dedup(list_of_keys, json_list_of_dicts, mode=dedup_leaves)
+    elif compact_leaves:
+        final_json = leaves.group_json_compact(list_of_keys, json_list_of_dicts)
+    else:
+        final_json = grouping.group_json(list_of_keys, json_list_of_dicts)
+    return iter(final_json.items())
+
+
+def nest_json_fragments(list_of_keys, json_list_of_dicts, presorted=False, memory_budget=None, workers=None,
+                        engine='hash', compact_leaves=False, output_format='json', codec=None,
+                        aggregations=None, dedup_leaves=None):
+    """Nests the dictionaries by the keys and returns the result one serialized top-level group at a time, or one
+    JSON Lines line per leaf group
+
+    Parameters
+    ----------
+    list_of_keys : list
+        List of keys specified in command line arguments
+    json_list_of_dicts : iterable
+        List of dictionaries inside json file, or an iterator yielding them one at a time
+    presorted, memory_budget, workers, engine, compact_leaves, aggregations, dedup_leaves :
+        how the input is nested, see nest_json_groups. With workers and the in-memory engines, the workers also
+        serialize their groups.
+    output_format : str
+        'json' for the members of one nested document, 'ndjson' for one line per leaf group with its key path,
+        see streaming.dump_leaf_line
+    codec : json_codec.Codec
+        If given, the fragments are bytes dumped by this backend, otherwise str dumped by the json module.
+
+    Returns
+    -------
+    fragments : iterator
+        '"key": subtree' JSON members in output order, see streaming.iter_json_object, or JSON Lines lines
+    """
+    if (workers and workers > 1 and output_format != 'ndjson' and not aggregations and not memory_budget
+            and not presorted):
+        return parallel.parallel_json_groups(list_of_keys, json_list_of_dicts, workers, codec=codec)
+
+    groups = nest_json_groups(list_of_keys, json_list_of_dicts, presorted=presorted, memory_budget=memory_budget,
+                              workers=workers, engine=engine, compact_leaves=compact_leaves,
+                              aggregations=aggregations, dedup_leaves=dedup_leaves)
+    return group_fragments(groups, len(list_of_keys), output_format, codec)
+
+
+def nest_json_views(key_lists, json_list_of_dicts, codec=None):
+    """Nests the dictionaries by several lists of keys in one pass and returns one serialized view at a time
+
+    Parameters
+    ----------
+    key_lists : list
+        lists of keys, one per view
+    json_list_of_dicts : iterable
+        List of dictionaries inside json file, or an iterator yielding them one at a time; left unchanged
+    codec : json_codec.Codec
+        If given, the fragments are bytes dumped by this backend, otherwise str dumped by the json module.
+
+    Returns
+    -------
+    fragments : iterator
+        '"key,key": view' JSON members, one per list of keys, see streaming.iter_json_object
+    """
+    views = grouping.group_json_views(key_lists, json_list_of_dicts)
+    return (streaming.dump_group(','.join(keys_list), view, codec) for keys_list, view in zip(key_lists, views))
+
+
+def group_fragments(groups, depth, output_format='json', codec=None):
+    """Serializes (top-level key, subtree) groups one top-level group, or one leaf group for 'ndjson', at a time."""
+    if output_format == 'ndjson':
+        leaf_groups = streaming.iter_leaf_groups(groups, depth)
+        return (streaming.dump_leaf_line(path, leaf, codec) for path, leaf in leaf_groups)
+    return (streaming.dump_group(key, subtree, codec) for key, subtree in groups)
+
+
+def handle_control_flow(list_of_keys, json_list_of_dicts, presorted=False, memory_budget=None, workers=None,
+                        engine='hash', compact_leaves=False, output_format='json', codec=None, aggregations=None,
+                        file_name=None, profiler=None, compress=None, dedup_leaves=None):
     """Handles the control flow of the script
 
     Parameters
     ----------
     list_of_keys : list
         List of keys specified in command line arguments
-    json_list_of_dicts : list
-        List of dictionaries inside json file
+    json_list_of_dicts : iterable
+        List of dictionaries inside json file, or an iterator yielding them one at a time
+    presorted, memory_budget, workers, engine, compact_leaves, aggregations, dedup_leaves :
+        how the input is nested, see nest_json_fragments
+    output_format : str
+        'json' or 'ndjson', see nest_json_fragments, or 'binary' for a random-access binary results file, see
+        binary_result.write_binary_result
+    codec : json_codec.Codec
+        the JSON backend writing the results file, see json_codec.get_codec if None
+    file_name : str
+        path of the results file, docs/result.json (or docs/result.ndjson, docs/result.jbin) if None
+    profiler : profiling.Profiler
+        If given, records the 'nest' stage (records in, top-level groups or ndjson lines out) and the 'write'
+        stage. Lazy nesting (presorted input, memory_budget, workers) is timed in the 'write' stage.
+    compress : str
+        If given, the 'json' or 'ndjson' results file is compressed as it is written, 'gzip' or 'lzma', and the
+        default file name gets the matching suffix, see compression.FILE_SUFFIXES
     """
-    json_list_ordered = read_and_sort_json_file(list_of_keys, json_list_of_dicts)
-    list_dicts = zip_dicts(list_of_keys, json_list_ordered)
+    codec = codec or json_codec.get_codec()
+    profiler = profiler or profiling.NULL_PROFILER
+    with profiler.stage('nest') as nest_stage:
+        json_list_of_dicts = profiler.count_records(nest_stage, json_list_of_dicts)
+        if output_format == 'binary':
+            groups = nest_json_groups(list_of_keys, json_list_of_dicts, presorted=presorted,
+                                      memory_budget=memory_budget, workers=workers, engine=engine,
+                                      compact_leaves=compact_leaves, aggregations=aggregations,
+                                      dedup_leaves=dedup_leaves)
+        else:
+            groups = nest_json_fragments(list_of_keys, json_list_of_dicts, presorted=presorted,
+                                         memory_budget=memory_budget, workers=workers, engine=engine,
+                                         compact_leaves=compact_leaves, output_format=output_format, codec=codec,
+                                         aggregations=aggregations, dedup_leaves=dedup_leaves)
+        groups = profiler.count_groups(nest_stage, groups)
+    with profiler.stage('write'):
+        if output_format == 'binary':
+            binary_result.write_binary_result(groups, len(list_of_keys),
+                                              file_name or result_file_name(extension=binary_result.EXTENSION),
+                                              codec)
+        else:
+            streaming.stream_json_file(groups, file_name or compressed_file_name(output_format, compress),
+                                       serialized=True, ndjson=output_format == 'ndjson', codec=codec,
+                                       compress=compress)
 
-    final_json = build_json(list_dicts)
 
-    # create filename for the results file
-    path = os.path.abspath(__file__)
-    dir_path = os.path.dirname(path)
-    file_name = dir_path[:-3] + 'docs/result.json'
+def handle_file_control_flow(list_of_keys, input_file, workers=None, batch_size=streaming.DEFAULT_BATCH_SIZE,
+                             output_format='json', codec=None, file_name=None, profiler=None, compress=None):
+    """Handles the control flow of the script for a JSON Lines file on disk, parsed and nested in parallel
+    byte ranges, see mmap_ingest.group_ndjson_file
+
+    Parameters
+    ----------
+    list_of_keys : list
+        List of keys specified in command line arguments
+    input_file : str
+        path of a JSON Lines file
+    workers : int
+        number of worker processes, the number of CPUs if None
+    batch_size : int
+        lines decoded at a time by each worker
+    output_format : str
+        'json', 'ndjson' or 'binary', see handle_control_flow
+    codec : json_codec.Codec
+        the JSON backend decoding the lines and writing the results file, see json_codec.get_codec if None
+    file_name : str
+        path of the results file, docs/result.json (or docs/result.ndjson, docs/result.jbin) if None
+    profiler : profiling.Profiler
+        If given, records the 'parse+nest' stage (top-level groups out) and the 'write' stage.
+    compress : str
+        If given, the 'json' or 'ndjson' results file is compressed, see handle_control_flow
+    """
+    codec = codec or json_codec.get_codec()
+    profiler = profiler or profiling.NULL_PROFILER
+    with profiler.stage('parse+nest') as nest_stage:
+        final_json = mmap_ingest.group_ndjson_file(list_of_keys, input_file, workers=workers, batch_size=batch_size,
+                                                   codec=codec)
+        groups = profiler.count_groups(nest_stage, final_json.items())
+    with profiler.stage('write'):
+        if output_format == 'binary':
+            binary_result.write_binary_result(groups, len(list_of_keys),
+                                              file_name or result_file_name(extension=binary_result.EXTENSION),
+                                              codec)
+        else:
+            fragments = group_fragments(groups, len(list_of_keys), output_format, codec)
+            streaming.stream_json_file(fragments, file_name or compressed_file_name(output_format, compress),
+                                       serialized=True, ndjson=output_format == 'ndjson', codec=codec,
+                                       compress=compress)
 
-    build_json_file(final_json, file_name)
 
+def parse_args(argv):
+    """Parses the command line arguments.
+
+    Parameters
+    ----------
+    argv : list
+        command line arguments without the script name
+
+    Returns
+    -------
+    args : argparse.Namespace
+        keys and options
+    """
+    parser = argparse.ArgumentParser(
+        prog='json_parser.py',
+        description='Reads a json array of flat dictionaries from stdin and nests it by the given keys.')
+    parser.add_argument('keys', nargs='+', help='keys to nest by, outermost first')
+    parser.add_argument('--sorted-input', action='store_true',
+                        help='the input is already sorted by the keys; write each top-level group as soon as '
+                             'it is complete')
+    parser.add_argument('--memory-budget', type=parse_size, metavar='BYTES',
+                        help='sort out of core, spilling sorted runs of about BYTES (e.g. 512M) to temporary files')
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+                        help='worker processes of the sharded strategy, sharded by the first key (0 for one per '
+                             'CPU)')
+    parser.add_argument('--engine', choices=['hash', 'columnar'], default='hash',
+                        help='grouping engine; columnar uses numpy when installed and the records share one schema')
+    parser.add_argument('--input-format', choices=['json', 'ndjson'], default='json',
+                        help='a json array, or one json record per line (JSON Lines)')
+    parser.add_argument('--input-file', metavar='PATH',
+                        help='read this file instead of stdin; with the sharded strategy, a JSON Lines file is '
+                             'memory-mapped and parsed in --workers byte ranges in parallel')
+    parser.add_argument('--batch-size', type=int, default=streaming.DEFAULT_BATCH_SIZE, metavar='LINES',
+                        help='ndjson lines read and decoded at a time')
+    parser.add_argument('--output-format', choices=['json', 'ndjson', 'binary'], default='json',
+                        help='one nested json document, one line per leaf group with its key path, or a binary '
+                             'file with a key path table for random access, see binary_result.BinaryResult')
+    parser.add_argument('--output-file', metavar='PATH',
+                        help='write the result to PATH instead of docs/result.<format>')
+    parser.add_argument('--compress', choices=sorted(compression.FILE_SUFFIXES),
+                        help='compress the json or ndjson results file as it is written, adding .gz or .xz to '
+                             'the default file name')
+    parser.add_argument('--codec', choices=('auto',) + json_codec.AUTO_ORDER,
+                        help='json backend for ndjson input and for the output (default: ${} or json); auto picks '
+                             'the fastest installed one'.format(json_codec.CODEC_ENV_VAR))
+    parser.add_argument('--aggregate', type=parse_aggregations, metavar='FIELD:REDUCERS',
+                        help='reduce each group to statistics instead of a leaf array, e.g. amount:sum,mean or '
+                             '"amount:sum;quantity:min,max"; reducers are {}'.format(', '.join(aggregate.REDUCERS)))
+    parser.add_argument('--compact-leaves', action='store_true',
+                        help='hold the leaf records as tuples against shared schemas until they are written, '
+                             'to lower peak memory')
+    parser.add_argument('--dedup-leaves', choices=dedup.MODES,
+                        help='store each distinct record of a leaf array once, as {"records": [...], "index": '
+                             '[...]} with the position of every record, or "counts" with the occurrences of each; '
+                             'python -m src.dedup expands the result back')
+    parser.add_argument('--profile', action='store_true',
+                        help='print the wall time, records, groups and peak traced memory of each stage')
+    parser.add_argument('--strategy', choices=(planner.AUTO,) + planner.STRATEGIES,
+                        help='how to nest the input; auto (the default) samples it and picks one, see '
+                             'planner.make_plan. --sorted-input, --memory-budget, --engine columnar and '
+                             '--compact-leaves force presorted, external, columnar and hash')
+    parser.add_argument('--explain', action='store_true',
+                        help='print the strategy chosen and the input statistics behind it instead of nesting')
+    args = parser.parse_args(argv)
+    if args.compress and args.output_format == 'binary':
+        parser.error('--compress is not supported with --output-format binary, which is read in place')
+    if ((args.engine == 'columnar' or args.compact_leaves or args.dedup_leaves)
+            and (args.workers or os.cpu_count() or 1) > 1):
+        parser.error('--engine columnar, --compact-leaves and --dedup-leaves are not supported with more than one '
+                     'worker, which nest their shard with the hash engine')
+    forced_by = next(((option, strategy) for option, strategy in (
+        ('--memory-budget', 'external' if args.memory_budget else None),
+        ('--sorted-input', 'presorted' if args.sorted_input else None),
+        ('--engine columnar', 'columnar' if args.engine == 'columnar' else None),
+        ('--compact-leaves', 'hash' if args.compact_leaves else None),
+        ('--dedup-leaves', 'hash' if args.dedup_leaves else None)) if strategy), None)
+    if forced_by and args.strategy not in (None, planner.AUTO, forced_by[1]):
+        parser.error('--strategy {} conflicts with {}, which uses {}'.format(args.strategy, *forced_by))
+    args.strategy = forced_by[1] if forced_by else args.strategy or planner.AUTO
+    if args.strategy == 'sharded' and (args.workers or os.cpu_count() or 1) == 1:
+        parser.error('--strategy sharded needs more than one --workers')
+    return args
+
+
+def parse_aggregations(spec):
+    """Parses the --aggregate option, see aggregate.parse_aggregations.
+
+    Raises
+    ------
+    argparse.ArgumentTypeError
+        If the aggregations are not valid.
+    """
+    try:
+        return aggregate.parse_aggregations(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
 
-if __name__ == '__main__':
-    # keys list and json file from stdin
-    del sys.argv[0]
-    stdin_str = sys.stdin.read()
-    json_list = json.loads(stdin_str)
 
-    handle_control_flow(sys.argv, json_list)
+def parse_size(size):
+    """Parses a number of bytes with an optional K, M or G suffix, e.g. 512M.
+
+    Parameters
+    ----------
+    size : str
+        the size as given in the command line
+
+    Raises
+    ------
+    argparse.ArgumentTypeError
+        If the size is not a positive number of bytes.
+
+    Returns
+    -------
+    number_of_bytes : int
+    """
+    multipliers = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    multiplier = multipliers.get(size[-1:].upper(), 1)
+    digits = size[:-1] if multiplier > 1 else size
+    try:
+        number_of_bytes = int(float(digits) * multiplier)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid size: {!r}'.format(size))
+    if number_of_bytes <= 0:
+        raise argparse.ArgumentTypeError('size must be positive: {!r}'.format(size))
+    return number_of_bytes
+
+
+def main(argv, input_fp=None, cwd=None):
+    """Runs the command line: keys list from the arguments and json file from input_fp (or --input-file), decoded
+    one element (or batch of lines) at a time and nested with the strategy planned from a sample of it, see
+    planner.make_plan; with the 'sharded' strategy, a JSON Lines file on disk is parsed in parallel byte ranges
+    instead
+
+    Parameters
+    ----------
+    argv : list
+        command line arguments, without the program name
+    input_fp : file
+        text stream of the input when there is no --input-file, sys.stdin if None
+    cwd : str
+        directory that relative --input-file and --output-file paths are relative to, the current one if None,
+        e.g. the client's directory for the daemon
+    """
+    args = parse_args(argv)
+    if cwd is not None:
+        args.input_file = args.input_file and os.path.join(cwd, args.input_file)
+        args.output_file = args.output_file and os.path.join(cwd, args.output_file)
+    workers = args.workers or os.cpu_count()
+    codec = json_codec.get_codec(args.codec)
+    profiler = profiling.Profiler() if args.profile else None
+    stages = profiler or profiling.NULL_PROFILER
+    # an --input-file is closed once it has been consumed, a daemon serves many of them
+    with open(args.input_file) if args.input_file else contextlib.nullcontext(input_fp or sys.stdin) as input_fp:
+        if args.input_format == 'ndjson':
+            json_list = streaming.iter_ndjson(input_fp, args.batch_size, codec)
+        else:
+            json_list = streaming.iter_json_array(input_fp)
+        with stages.stage('plan'):
+            plan, json_list = planner.make_plan(args.keys, json_list, args.strategy, workers=workers,
+                                                memory_budget=args.memory_budget, aggregations=args.aggregate,
+                                                input_bytes=input_size(input_fp))
+        if args.explain:
+            print(plan.explain())
+            return
+
+        if plan.strategy == 'sharded' and args.input_file and args.input_format == 'ndjson':
+            handle_file_control_flow(args.keys, args.input_file, workers=plan.workers, batch_size=args.batch_size,
+                                     output_format=args.output_format, codec=codec, file_name=args.output_file,
+                                     profiler=profiler, compress=args.compress)
+        else:
+            if plan.strategy == 'sort':
+                with stages.stage('sort'):
+                    json_list = read_and_sort_json_file(args.keys, list(json_list))
+            handle_control_flow(args.keys, json_list, compact_leaves=args.compact_leaves,
+                                output_format=args.output_format, codec=codec, aggregations=args.aggregate,
+                                file_name=args.output_file, profiler=profiler, compress=args.compress,
+                                dedup_leaves=args.dedup_leaves, **plan.options())
+    if profiler:
+        print(profiler.report())
+
+
+def input_size(input_fp):
+    """Returns the size in bytes of an input read from a regular file, None for a pipe or a terminal."""
+    try:
+        status = os.fstat(input_fp.fileno())
+    except (AttributeError, OSError, ValueError):
+        return None
+    return status.st_size if stat.S_ISREG(status.st_mode) else None
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
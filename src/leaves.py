@@ -0,0 +1,219 @@
+from operator import itemgetter
+
+from src import grouping
+
+DEFAULT_MAX_INTERNED_VALUES = 4096
+
+
+class Interner:
+    """Shares equal schemas and low-cardinality string values between compact leaves.
+
+    Each field interns its string values until it has seen max_values distinct ones; from then on it is
+    treated as high-cardinality and new values are stored as they are.
+
+    Parameters
+    ----------
+    max_values : int
+        distinct values interned per field
+    """
+
+    def __init__(self, max_values=DEFAULT_MAX_INTERNED_VALUES):
+        self.max_values = max_values
+        self._schemas = {}
+        self._values = {}
+
+    def schema(self, fields):
+        """Returns the shared tuple equal to fields."""
+        return self._schemas.setdefault(fields, fields)
+
+    def row(self, schema, values):
+        """Returns values as a tuple, with the string values of low-cardinality fields interned."""
+        row = []
+        for field, value in zip(schema, values):
+            if type(value) is str:
+                field_values = self._values.get(field)
+                if field_values is None:
+                    field_values = self._values[field] = {}
+                interned = field_values.get(value)
+                if interned is not None:
+                    value = interned
+                elif len(field_values) < self.max_values:
+                    field_values[value] = value
+            row.append(value)
+        return tuple(row)
+
+
+class CompactLeaf:
+    """A leaf array that stores its records as tuples against one shared schema.
+
+    Records with the leaf's schema (same fields in the same order) take a tuple of values; any other record
+    is kept as a dict. Records are turned back into dicts on access, iteration and serialization, so a
+    CompactLeaf compares equal to the list of dicts it stands for.
+
+    Parameters
+    ----------
+    interner : Interner
+        shares schemas and values with the other leaves of the same tree
+    """
+
+    __slots__ = ('schema', 'rows', 'interner')
+
+    def __init__(self, interner):
+        self.schema = None
+        self.rows = []
+        self.interner = interner
+
+    def append(self, record):
+        """Appends a flat dictionary."""
+        fields = tuple(record)
+        if self.schema is None:
+            self.schema = self.interner.schema(fields)
+        if fields == self.schema:
+            self.rows.append(self.interner.row(self.schema, record.values()))
+        else:
+            self.rows.append(dict(record))
+
+    def remove(self, record):
+        """Removes the first occurrence of a flat dictionary.
+
+        Raises
+        ------
+        ValueError
+            If the record is not in the leaf.
+        """
+        for position, row in enumerate(self.rows):
+            if self._to_dict(row) == record:
+                del self.rows[position]
+                return
+        raise ValueError('record not in leaf')
+
+    def to_list(self):
+        """Returns the records as a list of dicts."""
+        return [self._to_dict(row) for row in self.rows]
+
+    def _to_dict(self, row):
+        return dict(zip(self.schema, row)) if type(row) is tuple else row
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __bool__(self):
+        return bool(self.rows)
+
+    def __iter__(self):
+        return map(self._to_dict, self.rows)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self._to_dict(row) for row in self.rows[position]]
+        return self._to_dict(self.rows[position])
+
+    def __contains__(self, record):
+        return any(self._to_dict(row) == record for row in self.rows)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, CompactLeaf)):
+            return self.to_list() == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return 'CompactLeaf({!r})'.format(self.to_list())
+
+
+def group_json_compact(keys_list, json_list, sort=True, interner=None):
+    """Groups a list of flat dictionaries like grouping.group_json, storing the leaves as CompactLeaf arrays.
+
+    Parameters
+    ----------
+    keys_list : list
+        List of keys specified in command line arguments
+    json_list : iterable
+        List (or any iterable) of dictionaries inside json file
+    sort : bool
+        If True, the keys at each level are sorted afterwards.
+    interner : Interner
+        schema and value table shared by the leaves, a new one if None
+
+    Raises
+    ------
+    KeyError
+        If one the keys passed as argument is not a valid key.
+    TypeError
+        If none key is indicated as argument
+
+    Returns
+    -------
+    final_dict : dict
+        a nested dictionary of dictionaries of CompactLeaf arrays
+    """
+    if not keys_list:
+        print("Oops!  That was not valid number of keys.  Try again...")
+        raise TypeError('at least one key is required')
+
+    interner = interner or Interner()
+    get_path = grouping.key_path(keys_list)
+    key_set = frozenset(keys_list)
+    # full record schema -> (leaf schema, getter of the leaf values)
+    schemas = {}
+    final_dict = {}
+    for record in json_list:
+        try:
+            path = get_path(record)
+        except KeyError as ke:
+            print("Oops!  That was not a valid key.  Try again...", ke)
+            raise KeyError(ke.args[0]) from None
+        fields = tuple(record)
+        known = schemas.get(fields)
+        if known is None:
+            schema = interner.schema(tuple(field for field in fields if field not in key_set))
+            known = schemas[fields] = (schema, leaf_values_getter(schema))
+        schema, get_values = known
+
+        leaf = leaf_for(final_dict, path, interner)
+        if leaf.schema is None:
+            leaf.schema = schema
+        if leaf.schema is schema:
+            leaf.rows.append(interner.row(schema, get_values(record)))
+        else:
+            leaf.rows.append(grouping.strip_record(key_set, record))
+
+    if sort:
+        grouping.sort_nested_dict(final_dict, len(keys_list))
+    return final_dict
+
+
+def leaf_for(final_dict, path, interner):
+    """Like grouping.leaf_for, creating a CompactLeaf at the end of the path when it is missing."""
+    node = final_dict
+    for value in path[:-1]:
+        child = node.get(value)
+        if child is None:
+            child = node[value] = {}
+        node = child
+    leaf = node.get(path[-1])
+    if leaf is None:
+        leaf = node[path[-1]] = CompactLeaf(interner)
+    return leaf
+
+
+def leaf_values_getter(schema):
+    """Returns a callable picking the values of the schema's fields out of a record, always as a tuple."""
+    if not schema:
+        return lambda record: ()
+    getter = itemgetter(*schema)
+    if len(schema) == 1:
+        return lambda record: (getter(record),)
+    return getter
+
+
+def json_default(obj):
+    """json.dumps default hook serializing CompactLeaf arrays as lists of dicts.
+
+    Raises
+    ------
+    TypeError
+        If obj is not a CompactLeaf, like json.dumps without a default.
+    """
+    if isinstance(obj, CompactLeaf):
+        return obj.to_list()
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(obj).__name__))
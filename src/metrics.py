@@ -0,0 +1,106 @@
+import bisect
+import threading
+
+# request latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# payload size buckets in bytes
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+
+class Histogram:
+    """A Prometheus histogram: cumulative bucket counts, sum and count of observations, per set of labels.
+
+    Parameters
+    ----------
+    name : str
+        metric name
+    documentation : str
+        the HELP text
+    buckets : tuple
+        increasing upper bounds; +Inf is added
+    label_names : tuple
+        names of the labels every observation is given values for, in order
+    """
+
+    def __init__(self, name, documentation, buckets, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        # label values -> [count per bucket (not cumulative, last one +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        """Records one observation for the given label values."""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0]
+            series[0][index] += 1
+            series[1] += value
+
+    def expose(self):
+        """Returns the histogram in the Prometheus text exposition format."""
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} histogram'.format(self.name)]
+        with self._lock:
+            series = sorted((label_values, list(counts), total) for label_values, (counts, total)
+                            in self._series.items())
+        for label_values, counts, total in series:
+            labels = ['{}="{}"'.format(name, escape(value)) for name, value in zip(self.label_names, label_values)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                bucket_labels = ','.join(labels + ['le="{}"'.format(bound)])
+                lines.append('{}_bucket{{{}}} {}'.format(self.name, bucket_labels, cumulative))
+            suffix = '{{{}}}'.format(','.join(labels)) if labels else ''
+            lines.append('{}_sum{} {}'.format(self.name, suffix, total))
+            lines.append('{}_count{} {}'.format(self.name, suffix, cumulative))
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    """Escapes a label value for the Prometheus text format."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RequestMetrics:
+    """Latency and payload size histograms of the requests served by the app, see expose."""
+
+    def __init__(self):
+        self.latency = Histogram('jfile_request_duration_seconds',
+                                 'Time from receiving a request to the end of its response body.',
+                                 LATENCY_BUCKETS, ('method', 'endpoint', 'status'))
+        self.request_size = Histogram('jfile_request_size_bytes', 'Size of the request bodies posted to /jfile.',
+                                      SIZE_BUCKETS, ('content_type',))
+        self.response_size = Histogram('jfile_response_size_bytes',
+                                       'Size of the /jfile response bodies, when it is known before streaming.',
+                                       SIZE_BUCKETS, ('status',))
+
+    def expose(self):
+        """Returns all the metrics in the Prometheus text exposition format."""
+        return ''.join(histogram.expose() for histogram in (self.latency, self.request_size, self.response_size))
+
+
+def expose_admission(stats):
+    """Returns the /jfile admission counters and gauges in the Prometheus text exposition format.
+
+    Parameters
+    ----------
+    stats : dict
+        see admission.AdmissionController.stats
+    """
+    lines = ['# HELP jfile_admitted_requests_total Requests admitted to /jfile.',
+             '# TYPE jfile_admitted_requests_total counter',
+             'jfile_admitted_requests_total {}'.format(stats['admitted']),
+             '# HELP jfile_rejected_requests_total Requests rejected by /jfile admission control, per reason.',
+             '# TYPE jfile_rejected_requests_total counter']
+    lines.extend('jfile_rejected_requests_total{{reason="{}"}} {}'.format(escape(reason), count)
+                 for reason, count in sorted(stats['rejected'].items()))
+    for name, documentation in (('in_flight', 'Requests being processed by /jfile.'),
+                                ('waiting', 'Requests waiting for a /jfile slot.')):
+        lines.extend(['# HELP jfile_requests_{} {}'.format(name, documentation),
+                      '# TYPE jfile_requests_{} gauge'.format(name),
+                      'jfile_requests_{} {}'.format(name, stats[name])])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,184 @@
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from src import grouping
+from src import streaming
+
+# bytes of a range decoded at a time by a worker
+CHUNK_SIZE = 1024 * 1024
+
+
+def group_ndjson_file(keys_list, file_name, workers=None, sort=True, batch_size=streaming.DEFAULT_BATCH_SIZE,
+                      codec=None):
+    """Parses and nests a JSON Lines file on disk in a pool of worker processes.
+
+    The file is memory-mapped and split into one newline-aligned byte range per worker. Each worker maps the
+    file itself, decodes its range and pre-groups it with group_json, so JSON decoding runs on every core
+    instead of in a single front end. The parent merges the partial trees in file order, which keeps the leaf
+    arrays in input order, and sorts the result once.
+
+    Parameters
+    ----------
+    keys_list : list
+        List of keys specified in command line arguments
+    file_name : str
+        path of a JSON Lines file, one flat dictionary per line
+    workers : int
+        number of worker processes (and byte ranges), the number of CPUs if None. With 1 no pool is started.
+    sort : bool
+        If True, the keys at each level are sorted like group_json does.
+    batch_size : int
+        lines decoded at a time by each worker, see streaming.iter_ndjson
+    codec : json_codec.Codec
+        the JSON backend decoding the lines, the json module if None
+
+    Raises
+    ------
+    KeyError
+        If one the keys passed as argument is not a valid key.
+    TypeError
+        If none key is indicated as argument
+    ValueError
+        If a line is not a single JSON value.
+
+    Returns
+    -------
+    final_dict : dict
+        a nested dictionary of dictionaries of arrays
+    """
+    if not keys_list:
+        print("Oops!  That was not valid number of keys.  Try again...")
+        raise TypeError('at least one key is required')
+
+    workers = workers or os.cpu_count() or 1
+    with open(file_name, 'rb') as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            return {}
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            ranges = split_ranges(mm, workers)
+
+    if len(ranges) == 1:
+        partial_trees = [group_range(keys_list, file_name, *ranges[0], batch_size, codec)]
+    else:
+        with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+            futures = [executor.submit(group_range, keys_list, file_name, start, end, batch_size, codec)
+                       for start, end in ranges]
+            partial_trees = [future.result() for future in futures]
+
+    final_dict = partial_trees[0]
+    for partial_tree in partial_trees[1:]:
+        merge_trees(final_dict, partial_tree, len(keys_list))
+    if sort:
+        grouping.sort_nested_dict(final_dict, len(keys_list))
+    return final_dict
+
+
+def split_ranges(mm, number_of_ranges):
+    """Splits a memory-mapped file into about equally sized byte ranges that start and end at line boundaries.
+
+    Parameters
+    ----------
+    mm : mmap.mmap
+        the mapped file
+    number_of_ranges : int
+        the number of ranges wanted; fewer are returned when the file has fewer lines
+
+    Returns
+    -------
+    ranges : list
+        (start, end) byte offsets, covering the whole file in order
+    """
+    size = len(mm)
+    ranges = []
+    start = 0
+    for boundary in range(1, number_of_ranges + 1):
+        if start >= size:
+            break
+        end = size if boundary == number_of_ranges else max(start, size * boundary // number_of_ranges)
+        if end < size:
+            newline = mm.find(b'\n', end)
+            end = size if newline == -1 else newline + 1
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def group_range(keys_list, file_name, start, end, batch_size=streaming.DEFAULT_BATCH_SIZE, codec=None):
+    """Worker entry point: decodes the lines of one byte range of a JSON Lines file and nests them, unsorted.
+
+    Raises
+    ------
+    ValueError
+        If a line is not a single JSON value, with the byte range and the line number within it.
+
+    Returns
+    -------
+    partial_tree : dict
+        a nested dictionary of dictionaries of arrays, in input order
+    """
+    with open(file_name, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        try:
+            records = streaming.iter_ndjson(iter_range_lines(mm, start, end), batch_size, codec)
+            return grouping.group_json(keys_list, records, sort=False)
+        except ValueError as e:
+            raise ValueError('bytes {}-{}: {}'.format(start, end, e)) from None
+
+
+def iter_range_lines(mm, start, end, chunk_size=CHUNK_SIZE):
+    """Yields the lines of a newline-aligned byte range of a mapped file as str, without their newline.
+
+    Only about chunk_size bytes of the range are copied out of the mapping and decoded at a time, so a worker
+    never holds its whole range as text.
+
+    Parameters
+    ----------
+    mm : mmap.mmap
+        the mapped file
+    start, end : int
+        byte offsets of the range, at line boundaries, see split_ranges
+    chunk_size : int
+        bytes decoded at a time; a chunk is extended to the end of the line it stops in
+
+    Yields
+    ------
+    line : str
+    """
+    position = start
+    while position < end:
+        stop = min(end, position + chunk_size)
+        if stop < end:
+            newline = mm.find(b'\n', stop - 1, end)
+            stop = end if newline == -1 else newline + 1
+        lines = mm[position:stop].decode('utf-8').split('\n')
+        if not lines[-1]:
+            # the chunk ends with a newline, not with an empty line
+            lines.pop()
+        yield from lines
+        position = stop
+
+
+def merge_trees(final_dict, partial_tree, depth):
+    """Merges a nested dictionary into another in place, appending the leaf arrays of partial_tree to the ones
+    of final_dict, without recursion.
+
+    Parameters
+    ----------
+    final_dict : dict
+        a nested dictionary of dictionaries of arrays, updated in place
+    partial_tree : dict
+        a nested dictionary of dictionaries of arrays for records that come after those of final_dict
+    depth : int
+        number of dictionary levels above the leaf arrays
+    """
+    stack = [(final_dict, partial_tree, 1)]
+    while stack:
+        node, other, level = stack.pop()
+        for key, child in other.items():
+            existing = node.get(key)
+            if existing is None:
+                node[key] = child
+            elif level == depth:
+                existing.extend(child)
+            else:
+                stack.append((existing, child, level + 1))
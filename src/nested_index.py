@@ -0,0 +1,150 @@
+import threading
+
+from src import grouping
+from src import leaves
+
+
+class NestedIndex:
+    """A long-lived nested dictionary of dictionaries of arrays for a fixed list of keys.
+
+    Records are folded into the existing tree as they arrive, so each add or remove costs time proportional
+    to the batch, not to the whole index. All methods are thread-safe.
+
+    Parameters
+    ----------
+    keys_list : list
+        the keys to nest by, outermost first
+    records : iterable
+        initial dictionaries to add
+    compact : bool
+        If True, leaves are stored as leaves.CompactLeaf arrays, which take a fraction of the memory of lists
+        of dicts.
+
+    Raises
+    ------
+    TypeError
+        If none key is indicated
+    """
+
+    def __init__(self, keys_list, records=(), compact=False):
+        if not keys_list:
+            raise TypeError('at least one key is required')
+        self.keys_list = list(keys_list)
+        self._get_path = grouping.key_path(self.keys_list)
+        self._key_set = frozenset(self.keys_list)
+        self._interner = leaves.Interner() if compact else None
+        self._tree = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self.add(records)
+
+    def __len__(self):
+        return self._count
+
+    def add(self, records):
+        """Adds a batch of dictionaries to the index.
+
+        The whole batch is checked before anything is added, so a record missing a key leaves the index
+        unchanged.
+
+        Parameters
+        ----------
+        records : iterable
+            flat dictionaries
+
+        Raises
+        ------
+        KeyError
+            If a record is missing one of the keys.
+
+        Returns
+        -------
+        number_of_records : int
+            number of records added
+        """
+        batch = [(self._get_path(record), grouping.strip_record(self._key_set, record)) for record in records]
+        with self._lock:
+            for path, stripped_record in batch:
+                self._leaf_for(path).append(stripped_record)
+            self._count += len(batch)
+        return len(batch)
+
+    def remove(self, records):
+        """Removes one matching occurrence of each dictionary from the index.
+
+        Records that are not in the index are skipped. Leaves and levels left empty are pruned.
+
+        Parameters
+        ----------
+        records : iterable
+            flat dictionaries, equal to previously added ones
+
+        Raises
+        ------
+        KeyError
+            If a record is missing one of the keys.
+
+        Returns
+        -------
+        number_of_records : int
+            number of records removed
+        """
+        batch = [(self._get_path(record), grouping.strip_record(self._key_set, record)) for record in records]
+        removed = 0
+        with self._lock:
+            for path, stripped_record in batch:
+                nodes = [self._tree]
+                for value in path[:-1]:
+                    nodes.append(nodes[-1].get(value))
+                    if nodes[-1] is None:
+                        break
+                else:
+                    leaf = nodes[-1].get(path[-1])
+                    if leaf is not None and stripped_record in leaf:
+                        leaf.remove(stripped_record)
+                        removed += 1
+                        self._prune(nodes, path)
+            self._count -= removed
+        return removed
+
+    def snapshot(self, sort=True):
+        """Returns a copy of the nested dictionary that later adds and removes do not change.
+
+        The dictionaries and leaf arrays are copied, the leaf records are shared.
+
+        Parameters
+        ----------
+        sort : bool
+            If True, the keys at each level are sorted like group_json does, otherwise they keep their
+            first-added order.
+
+        Returns
+        -------
+        final_dict : dict
+            a nested dictionary of dictionaries of arrays
+        """
+        depth = len(self.keys_list)
+        with self._lock:
+            final_dict = dict(self._tree)
+            stack = [(final_dict, 1)]
+            while stack:
+                node, level = stack.pop()
+                for key, child in node.items():
+                    node[key] = copy = list(child) if level == depth else dict(child)
+                    if level < depth:
+                        stack.append((copy, level + 1))
+        if sort:
+            grouping.sort_nested_dict(final_dict, depth)
+        return final_dict
+
+    def _leaf_for(self, path):
+        if self._interner is None:
+            return grouping.leaf_for(self._tree, path)
+        return leaves.leaf_for(self._tree, path, self._interner)
+
+    def _prune(self, nodes, path):
+        # drops the leaf and then every dictionary on the path left empty, innermost first
+        for node, value in zip(reversed(nodes), reversed(path)):
+            if node[value]:
+                return
+            del node[value]
@@ -0,0 +1,195 @@
+import heapq
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from operator import itemgetter
+
+from src import grouping
+from src import streaming
+
+# in a forked worker, the records of the call its pool was started for, set by share_records; each call starts
+# its own pool, so concurrent calls never see each other's records
+_shared_records = None
+
+
+def parallel_group_json(keys_list, json_list, workers=None, sort=True):
+    """Groups a list of flat dictionaries into a nested dictionary using a pool of worker processes.
+
+    Records are hash-partitioned by the value of the first key, so every top-level key lives in exactly one
+    shard. Each shard is nested by group_json in its own process and the parent only joins the disjoint
+    subtrees. The subtrees have to be unpickled by the parent; when the result is only going to be written
+    out, parallel_json_groups scales better.
+
+    Parameters
+    ----------
+    keys_list : list
+        List of keys specified in command line arguments
+    json_list : iterable
+        List (or any iterable) of dictionaries inside json file
+    workers : int
+        number of worker processes, the number of CPUs if None. With 1 no pool is started.
+    sort : bool
+        If True, the keys at each level are sorted like group_json does.
+
+    Raises
+    ------
+    KeyError
+        If one the keys passed as argument is not a valid key.
+    TypeError
+        If none key is indicated as argument
+
+    Returns
+    -------
+    final_dict : dict
+        a nested dictionary of dictionaries of arrays
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        return grouping.group_json(keys_list, json_list, sort=sort)
+
+    final_dict = {}
+    for subtree in map_shards(group_shard, keys_list, json_list, workers, sort):
+        final_dict.update(subtree)
+    if sort:
+        # the levels below the first one were already sorted by the workers
+        grouping.sort_nested_dict(final_dict, 1)
+    return final_dict
+
+
+def parallel_json_groups(keys_list, json_list, workers=None, sort=True, codec=None):
+    """Nests and serializes a list of flat dictionaries in a pool of worker processes.
+
+    Like parallel_group_json, but each worker also dumps its top-level groups to JSON, so the parent only
+    passes strings through. The fragments can be written with streaming.write_json_fragments.
+
+    Parameters
+    ----------
+    keys_list : list
+        List of keys specified in command line arguments
+    json_list : iterable
+        List (or any iterable) of dictionaries inside json file
+    workers : int
+        number of worker processes, the number of CPUs if None
+    sort : bool
+        If True, the groups come out in sorted key order, otherwise shard by shard.
+    codec : json_codec.Codec
+        If given, the workers dump bytes fragments with this backend, see streaming.dump_group
+
+    Raises
+    ------
+    KeyError
+        If one the keys passed as argument is not a valid key.
+    TypeError
+        If none key is indicated as argument
+
+    Yields
+    ------
+    fragment : str or bytes
+        one '"key": subtree' JSON member per top-level key
+    """
+    workers = workers or os.cpu_count() or 1
+    shard_groups = map_shards(partial(dump_shard, codec=codec), keys_list, json_list, workers, sort)
+    if sort:
+        groups = heapq.merge(*shard_groups, key=itemgetter(0))
+    else:
+        groups = (group for shard in shard_groups for group in shard)
+    for _, fragment in groups:
+        yield fragment
+
+
+def map_shards(function, keys_list, json_list, workers, sort):
+    """Partitions records by their first key and runs function(keys_list, shard, sort) on each shard in a
+    process pool.
+
+    With the fork start method the workers inherit the records, handed to the pool's initializer, and only
+    receive the indexes of their shard; otherwise each shard is pickled to its worker.
+
+    Returns
+    -------
+    results : list
+        the return value of function for each non-empty shard
+    """
+    json_list = json_list if isinstance(json_list, list) else list(json_list)
+    shards = [indexes for indexes in partition_indexes(keys_list, json_list, workers) if indexes]
+    fork = 'fork' in multiprocessing.get_all_start_methods()
+    if fork:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'),
+                                       initializer=share_records, initargs=(json_list,))
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    with executor:
+        if fork:
+            futures = [executor.submit(run_on_shared_records, function, keys_list, indexes, sort)
+                       for indexes in shards]
+        else:
+            futures = [executor.submit(function, keys_list, [json_list[i] for i in indexes], sort)
+                       for indexes in shards]
+        return [future.result() for future in futures]
+
+
+def partition_indexes(keys_list, json_list, number_of_shards):
+    """Splits the positions of records into shards by the hash of their first key value.
+
+    Parameters
+    ----------
+    keys_list : list
+        List of keys specified in command line arguments
+    json_list : list
+        List of dictionaries inside json file
+    number_of_shards : int
+        number of shards to split into
+
+    Raises
+    ------
+    KeyError
+        If the first key is not a valid key.
+    TypeError
+        If none key is indicated as argument
+
+    Returns
+    -------
+    shards : list
+        number_of_shards lists of positions in json_list, in input order within each shard
+    """
+    if not keys_list:
+        print("Oops!  That was not valid number of keys.  Try again...")
+        raise TypeError('at least one key is required')
+
+    first_key = keys_list[0]
+    shards = [[] for _ in range(number_of_shards)]
+    try:
+        for index, record in enumerate(json_list):
+            shards[hash(record[first_key]) % number_of_shards].append(index)
+    except KeyError as ke:
+        print("Oops!  That was not a valid key.  Try again...", ke)
+        raise
+    return shards
+
+
+def share_records(json_list):
+    """Initializer of forked workers: keeps the records, which the worker inherited with the fork."""
+    global _shared_records
+    _shared_records = json_list
+
+
+def run_on_shared_records(function, keys_list, indexes, sort):
+    """Worker entry point for forked workers: picks the shard out of the inherited records."""
+    return function(keys_list, [_shared_records[i] for i in indexes], sort)
+
+
+def group_shard(keys_list, shard, sort):
+    """Worker entry point: nests one shard."""
+    return grouping.group_json(keys_list, shard, sort=sort)
+
+
+def dump_shard(keys_list, shard, sort, codec=None):
+    """Worker entry point: nests one shard and serializes each of its top-level groups.
+
+    Returns
+    -------
+    groups : list
+        (top-level key, JSON fragment) tuples
+    """
+    subtree = grouping.group_json(keys_list, shard, sort=sort)
+    return [(key, streaming.dump_group(key, value, codec)) for key, value in subtree.items()]
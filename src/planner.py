@@ -0,0 +1,286 @@
+import json
+import math
+import os
+import sys
+from collections import Counter
+from itertools import chain, islice
+from operator import itemgetter
+
+from src import columnar
+from src import external_sort
+
+AUTO = 'auto'
+STRATEGIES = ('hash', 'sort', 'columnar', 'sharded', 'external', 'presorted')
+DEFAULT_SAMPLE_SIZE = 1000
+# below this many records every strategy nests in a few milliseconds, so the hash grouping is kept
+COLUMNAR_MIN_RECORDS = 10000
+# a worker pool takes tens of milliseconds to start and its shards have to be merged back
+SHARDED_MIN_RECORDS = 100000
+# inputs estimated to take more than this fraction of the physical memory once decoded are sorted out of core
+EXTERNAL_MEMORY_FRACTION = 0.5
+
+
+class InputStatistics:
+    """What a sample of the input tells about it.
+
+    Attributes
+    ----------
+    sample_size : int
+        number of sampled records
+    records : int
+        number of records, exact when the whole input was sampled, estimated from input_bytes otherwise, None if
+        unknown
+    exact : bool
+        True if records is exact
+    cardinality : dict
+        estimated distinct values of each key, see estimate_distinct
+    sortedness : float
+        fraction of consecutive sampled records already in key order, 1.0 for sorted input
+    uniform_schema : bool
+        True if all sampled records have the same fields in the same order, see columnar.common_fields
+    record_memory : float
+        average size in bytes of a decoded record, its values included
+    error : str
+        If set, the sample could not be keyed or compared, e.g. a missing key, and the other statistics are not
+        known.
+    """
+
+    def __init__(self, sample_size, records=None, exact=False, cardinality=None, sortedness=None,
+                 uniform_schema=False, record_memory=None, error=None):
+        self.sample_size = sample_size
+        self.records = records
+        self.exact = exact
+        self.cardinality = cardinality or {}
+        self.sortedness = sortedness
+        self.uniform_schema = uniform_schema
+        self.record_memory = record_memory
+        self.error = error
+
+    def estimated_memory(self):
+        """Returns the estimated size in bytes of the decoded input, None if the number of records is unknown."""
+        if self.records is None or self.record_memory is None:
+            return None
+        return self.records * self.record_memory
+
+    def describe(self):
+        """Returns the statistics as lines of text."""
+        if self.records is None:
+            records = 'unknown, more than {}'.format(self.sample_size)
+        else:
+            records = '{}{}'.format('' if self.exact else '~', self.records)
+        lines = ['records: {} (sampled {})'.format(records, self.sample_size)]
+        if self.error:
+            lines.append('sample error: {}'.format(self.error))
+            return lines
+        for key, distinct in self.cardinality.items():
+            lines.append('distinct {!r}: ~{}'.format(key, distinct))
+        lines.append('sortedness: {:.2f}'.format(self.sortedness))
+        lines.append('uniform schema: {}'.format('yes' if self.uniform_schema else 'no'))
+        memory = self.estimated_memory()
+        if memory is not None:
+            lines.append('decoded size: ~{:.1f} MiB'.format(memory / 2 ** 20))
+        return lines
+
+
+class Plan:
+    """The strategy chosen to nest an input, the reason for it and the input statistics behind it.
+
+    Strategies:
+
+    * 'hash': group in memory in one pass, see grouping.group_json
+    * 'sort': sort the records in memory, then write each top-level group as soon as it is complete
+    * 'columnar': group with numpy column operations, see columnar.columnar_group_json
+    * 'sharded': group in worker processes sharded by the first key, see parallel.parallel_json_groups
+    * 'external': sort out of core in runs of memory_budget bytes, see external_sort.external_sort
+    * 'presorted': the input is trusted to be sorted by the keys, see streaming.iter_top_level_groups
+
+    Parameters
+    ----------
+    strategy : str
+        one of STRATEGIES
+    reason : str
+        why it was chosen
+    statistics : InputStatistics
+        the statistics of the sampled input, None if it was not sampled
+    workers : int
+        worker processes of the 'sharded' strategy
+    memory_budget : int
+        run size in bytes of the 'external' strategy
+    """
+
+    def __init__(self, strategy, reason, statistics=None, workers=1, memory_budget=None):
+        self.strategy = strategy
+        self.reason = reason
+        self.statistics = statistics
+        self.workers = workers
+        self.memory_budget = memory_budget
+
+    def options(self):
+        """Returns the json_parser.nest_json_groups arguments running the strategy; the input of 'sort' has to be
+        sorted first, see json_parser.read_and_sort_json_file."""
+        return {'presorted': self.strategy in ('sort', 'presorted'),
+                'memory_budget': self.memory_budget if self.strategy == 'external' else None,
+                'workers': self.workers if self.strategy == 'sharded' else 1,
+                'engine': 'columnar' if self.strategy == 'columnar' else 'hash'}
+
+    def explain(self):
+        """Returns the strategy, the reason for it and the input statistics as text."""
+        strategy = self.strategy
+        if self.strategy == 'sharded':
+            strategy += ', {} workers'.format(self.workers)
+        elif self.strategy == 'external':
+            strategy += ', runs of {} bytes'.format(self.memory_budget)
+        lines = ['strategy: {}'.format(strategy), 'reason: {}'.format(self.reason)]
+        if self.statistics:
+            lines.extend(self.statistics.describe())
+        return '\n'.join(lines)
+
+
+def make_plan(keys_list, json_list, strategy=AUTO, workers=1, memory_budget=None, aggregations=None,
+              input_bytes=None, sample_size=DEFAULT_SAMPLE_SIZE):
+    """Samples the input and chooses how to nest it.
+
+    Unless a strategy is forced, the rules are, in order: 'external' if the decoded input is estimated to take
+    more than EXTERNAL_MEMORY_FRACTION of the physical memory; 'sort' if the sample is already in key order,
+    which costs timsort a linear pass and writes each top-level group as soon as it is complete instead of
+    holding the whole tree; 'sharded' if there are several workers, at least SHARDED_MIN_RECORDS records and at
+    least as many first-key values as workers to balance them; 'columnar' if numpy is installed, the records
+    share one schema and there are at least COLUMNAR_MIN_RECORDS of them; 'hash' otherwise. 'presorted' is
+    never chosen: a record out of order past the sample would fail the run.
+
+    Parameters
+    ----------
+    keys_list : list
+        List of keys specified in command line arguments
+    json_list : iterable
+        List of dictionaries inside json file, or an iterator yielding them one at a time
+    strategy : str
+        AUTO, or one of STRATEGIES to force it; the input is still sampled for Plan.explain
+    workers : int
+        worker processes available to 'sharded'
+    memory_budget : int
+        run size in bytes of 'external', external_sort.DEFAULT_MEMORY_BUDGET if None
+    aggregations : list
+        If given, each group is reduced in one streaming pass, see aggregate.aggregate_json, and the input is
+        neither sampled nor planned for.
+    input_bytes : int
+        size of the input, if known, to estimate the number of records of an iterator
+    sample_size : int
+        maximum number of records sampled: evenly spread over a list, the first ones of an iterator
+
+    Returns
+    -------
+    result : tuple
+        (plan, json_list): the Plan, and the input to nest, which replays the records sampled from an iterator
+    """
+    memory_budget = memory_budget or external_sort.DEFAULT_MEMORY_BUDGET
+    if aggregations:
+        return Plan('hash', 'aggregations reduce each group in one streaming pass'), json_list
+
+    sample, json_list, records, exact = sample_records(json_list, sample_size, input_bytes)
+    statistics = input_statistics(keys_list, sample, records, exact)
+    if strategy != AUTO:
+        return Plan(strategy, 'forced', statistics, workers, memory_budget), json_list
+    return choose_strategy(statistics, workers, memory_budget), json_list
+
+
+def choose_strategy(statistics, workers=1, memory_budget=external_sort.DEFAULT_MEMORY_BUDGET):
+    """Chooses the strategy for the statistics of an input, see make_plan for the rules."""
+    if statistics.error:
+        return Plan('hash', 'the sample could not be keyed and compared ({}), the hash grouping reports '
+                            'it'.format(statistics.error), statistics)
+    records = statistics.records
+    memory, physical_memory = statistics.estimated_memory(), physical_memory_size()
+    if memory is not None and physical_memory and memory > physical_memory * EXTERNAL_MEMORY_FRACTION:
+        return Plan('external', 'the decoded input would take ~{:.0%} of the physical memory'.format(
+            memory / physical_memory), statistics, memory_budget=memory_budget)
+    if statistics.sample_size > 1 and statistics.sortedness == 1.0:
+        return Plan('sort', 'the sample is already sorted by the keys', statistics)
+    large = records is None or records >= COLUMNAR_MIN_RECORDS
+    if workers > 1 and (records is None or records >= SHARDED_MIN_RECORDS):
+        first_key_values = next(iter(statistics.cardinality.values()), 0)
+        if first_key_values >= workers:
+            return Plan('sharded', '{} workers and {} records'.format(
+                workers, records or 'more than {}'.format(statistics.sample_size)), statistics, workers)
+    if columnar.np is not None and statistics.uniform_schema and large:
+        return Plan('columnar', 'unsorted records sharing one schema', statistics)
+    if not large:
+        return Plan('hash', 'fewer than {} records'.format(COLUMNAR_MIN_RECORDS), statistics)
+    return Plan('hash', 'unsorted records {}'.format(
+        'without numpy' if columnar.np is None else 'with several schemas'), statistics)
+
+
+def sample_records(json_list, sample_size, input_bytes=None):
+    """Samples the input without consuming it.
+
+    Returns
+    -------
+    result : tuple
+        (sample, json_list, records, exact): the sampled records, the input to nest, and the number of records
+        and whether it is exact, see InputStatistics
+    """
+    if isinstance(json_list, list):
+        step = max(1, len(json_list) // sample_size) if sample_size else 1
+        return json_list[::step][:sample_size], json_list, len(json_list), True
+    iterator = iter(json_list)
+    sample = list(islice(iterator, sample_size))
+    if len(sample) < sample_size:
+        return sample, iter(sample), len(sample), True
+    records = None
+    if input_bytes and sample:
+        record_bytes = sum(len(json.dumps(record, separators=(',', ':'))) + 1 for record in sample) / len(sample)
+        records = max(len(sample), int(input_bytes / record_bytes))
+    return sample, chain(sample, iterator), records, False
+
+
+def input_statistics(keys_list, sample, records=None, exact=False):
+    """Computes the InputStatistics of a sample of records, of an input of about records records."""
+    statistics = InputStatistics(len(sample), records, exact)
+    if not sample:
+        statistics.sortedness = 1.0
+        return statistics
+    try:
+        path_of = itemgetter(*keys_list)
+        paths = [path_of(record) for record in sample]
+        statistics.sortedness = sum(a <= b for a, b in zip(paths, paths[1:])) / max(1, len(paths) - 1)
+        statistics.cardinality = {key: estimate_distinct([record[key] for record in sample], records)
+                                  for key in keys_list}
+    except (KeyError, TypeError) as e:
+        statistics.error = '{}: {}'.format(type(e).__name__, e)
+        return statistics
+    statistics.uniform_schema = columnar.common_fields(sample) is not None
+    statistics.record_memory = sum(sys.getsizeof(record) + sum(map(sys.getsizeof, record.values()))
+                                   for record in sample) / len(sample)
+    return statistics
+
+
+def estimate_distinct(values, records=None):
+    """Estimates the distinct values of a column from a sample of it, with the guaranteed-error estimator (GEE)
+    of Charikar et al.: values seen once in the sample are scaled up by sqrt(records / sample size), values seen
+    more often are counted once.
+
+    Parameters
+    ----------
+    values : list
+        the sampled values
+    records : int
+        number of values in the whole column, the sample size if None
+
+    Returns
+    -------
+    distinct : int
+    """
+    counts = Counter(values)
+    seen_once = sum(1 for count in counts.values() if count == 1)
+    if not records or records <= len(values):
+        return len(counts)
+    estimate = math.sqrt(records / len(values)) * seen_once + len(counts) - seen_once
+    return min(records, int(round(estimate)))
+
+
+def physical_memory_size():
+    """Returns the physical memory in bytes, None where it is not known."""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
@@ -0,0 +1,120 @@
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class Stage:
+    """Measurements of one pipeline stage: wall time, records consumed, groups produced and peak traced memory."""
+
+    __slots__ = ('name', 'seconds', 'records', 'groups', 'peak_memory')
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.records = None
+        self.groups = None
+        self.peak_memory = None
+
+    def to_dict(self):
+        return {attribute: getattr(self, attribute) for attribute in self.__slots__}
+
+
+class Profiler:
+    """Records the stages of a run of the pipeline, in order.
+
+    Stages are timed with perf_counter and, with trace_memory, the peak memory traced by tracemalloc while they
+    run, which slows the run down. Lazy stages, e.g. nesting presorted input, are consumed by the next stage and
+    their time is counted there; their records and groups are still counted where they are produced.
+
+    Parameters
+    ----------
+    trace_memory : bool
+        If True, tracemalloc is started for the run and each stage records its peak traced memory.
+    """
+
+    enabled = True
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        """Times the code run in the with block as a new stage, which is yielded."""
+        stage = Stage(name)
+        self.stages.append(stage)
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.seconds = time.perf_counter() - start
+            if self.trace_memory:
+                stage.peak_memory = tracemalloc.get_traced_memory()[1]
+            if tracing:
+                tracemalloc.stop()
+
+    def count_records(self, stage, iterable):
+        """Counts the records of iterable in stage.records: a list is returned as it is, any other iterable is
+        passed through and counted as it is consumed."""
+        return count_into(stage, 'records', iterable)
+
+    def count_groups(self, stage, iterable):
+        """Counts the groups of iterable in stage.groups, like count_records."""
+        return count_into(stage, 'groups', iterable)
+
+    def report(self):
+        """Returns the stages as a text table, one line per stage."""
+        lines = ['{:<12} {:>10} {:>10} {:>10} {:>12}'.format('stage', 'seconds', 'records', 'groups', 'peak MiB')]
+        for stage in self.stages:
+            lines.append('{:<12} {:>10.4f} {:>10} {:>10} {:>12}'.format(
+                stage.name, stage.seconds, '-' if stage.records is None else stage.records,
+                '-' if stage.groups is None else stage.groups,
+                '-' if stage.peak_memory is None else '{:.1f}'.format(stage.peak_memory / 2 ** 20)))
+        return '\n'.join(lines)
+
+
+def count_into(stage, attribute, iterable):
+    """Sets stage.<attribute> to the length of a list, or to the number of items of any other iterable once it
+    has been consumed through the returned generator."""
+    if isinstance(iterable, list):
+        setattr(stage, attribute, len(iterable))
+        return iterable
+    setattr(stage, attribute, 0)
+    return counted(stage, attribute, iterable)
+
+
+def counted(stage, attribute, iterable):
+    count = 0
+    try:
+        for count, item in enumerate(iterable, 1):
+            yield item
+    finally:
+        setattr(stage, attribute, count)
+
+
+class NullProfiler:
+    """A Profiler that records nothing, so the pipeline runs unchanged when profiling is off."""
+
+    enabled = False
+    stages = ()
+
+    @contextmanager
+    def stage(self, name):
+        yield None
+
+    def count_records(self, stage, iterable):
+        return iterable
+
+    def count_groups(self, stage, iterable):
+        return iterable
+
+    def report(self):
+        return ''
+
+
+NULL_PROFILER = NullProfiler()
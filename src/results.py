@@ -0,0 +1,116 @@
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+def json_key(key):
+    """Returns a dictionary key as json.dump writes it, i.e. as it appears in the nested document."""
+    # json.dump coerces int, float, bool and None keys exactly like it writes those values
+    return key if isinstance(key, str) else json.dumps(key)
+
+
+class StoredResult:
+    """A nested result kept in memory with a path index over all its levels.
+
+    The index maps the tuple of keys (as they appear in the JSON document) from the top level down to every
+    subtree and leaf array, so a lookup costs a hash of the path instead of a walk of the document.
+
+    Parameters
+    ----------
+    keys_list : list
+        the keys the result is nested by
+    final_dict : dict
+        the nested dictionary of dictionaries of arrays
+    """
+
+    def __init__(self, keys_list, final_dict):
+        self.keys_list = list(keys_list)
+        self.final_dict = final_dict
+        self.paths = {(): final_dict}
+        stack = [((), final_dict)]
+        while stack:
+            path, node = stack.pop()
+            if len(path) == len(self.keys_list):
+                continue
+            for key, child in node.items():
+                child_path = path + (json_key(key),)
+                self.paths[child_path] = child
+                stack.append((child_path, child))
+
+    def lookup(self, path):
+        """Returns the subtree or leaf array at the end of a path of keys.
+
+        Parameters
+        ----------
+        path : iterable
+            keys from the top level down, as str like in the JSON document
+
+        Raises
+        ------
+        KeyError
+            If the path is not in the result.
+
+        Returns
+        -------
+        node : dict or list
+        """
+        return self.paths[tuple(path)]
+
+    def is_leaf(self, path):
+        """Returns True if the path leads to a leaf array."""
+        return len(path) == len(self.keys_list)
+
+
+class ResultStore:
+    """A thread-safe store of nested results by id, keeping the most recently used ones.
+
+    Parameters
+    ----------
+    max_entries : int
+        maximum number of stored results; the least recently used one is dropped beyond it
+    ttl : float
+        seconds a result is kept after it was stored, forever if None
+    clock : callable
+        returns the current time in seconds, time.monotonic by default
+    """
+
+    def __init__(self, max_entries=32, ttl=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, keys_list, final_dict):
+        """Stores a nested result, building its path index, and returns its new id."""
+        result = StoredResult(keys_list, final_dict)
+        result_id = uuid.uuid4().hex
+        expires_at = None if self.ttl is None else self.clock() + self.ttl
+        with self._lock:
+            self._results[result_id] = (result, expires_at)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        return result_id
+
+    def get(self, result_id):
+        """Returns the StoredResult with that id, or None if it is unknown, evicted or expired."""
+        with self._lock:
+            entry = self._results.get(result_id)
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= self.clock():
+                del self._results[result_id]
+                return None
+            self._results.move_to_end(result_id)
+            return entry[0]
+
+    def delete(self, result_id):
+        """Drops a result; returns False if it was not stored."""
+        with self._lock:
+            return self._results.pop(result_id, None) is not None
+
+    def __len__(self):
+        return len(self._results)
+
@@ -0,0 +1,416 @@
+import json
+import re
+from itertools import groupby, islice
+
+from src import compression
+from src import grouping
+from src import leaves
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_BATCH_SIZE = 1000
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+DELIMITERS = ' \t\n\r,]'
+
+
+def iter_json_array(fp, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields the elements of a JSON array one at a time while reading it incrementally from a file object.
+
+    Only the current chunk and the element being decoded are held in memory, so the whole input text never
+    has to be loaded at once.
+
+    Parameters
+    ----------
+    fp : file
+        a text file object positioned at the start of a JSON array, e.g. sys.stdin
+    chunk_size : int
+        number of characters read at a time
+
+    Raises
+    ------
+    json.JSONDecodeError
+        If the input is not a well-formed JSON array.
+
+    Yields
+    ------
+    element : object
+        each decoded element of the array, in order
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+    state = 'start'
+
+    while True:
+        pos = WHITESPACE.match(buf, pos).end()
+        if pos >= len(buf) and state != 'value':
+            if eof:
+                if state == 'end':
+                    return
+                raise json.JSONDecodeError('Unexpected end of JSON array', buf, pos)
+            buf, pos, eof = _refill(fp, buf, pos, chunk_size)
+            continue
+
+        if state == 'start':
+            if buf[pos] != '[':
+                raise json.JSONDecodeError('Expecting a JSON array', buf, pos)
+            pos += 1
+            state = 'first'
+        elif state == 'first':
+            if buf[pos] == ']':
+                pos += 1
+                state = 'end'
+            else:
+                state = 'value'
+        elif state == 'value':
+            try:
+                element, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                buf, pos, eof = _refill(fp, buf, pos, chunk_size)
+                continue
+            if not eof and (end == len(buf) or buf[end] not in DELIMITERS):
+                # a number cut at the end of the buffer, like "1.5e", may continue in the next chunk
+                buf, pos, eof = _refill(fp, buf, pos, chunk_size)
+                continue
+            pos = end
+            state = 'separator'
+            yield element
+        elif state == 'separator':
+            if buf[pos] == ',':
+                pos += 1
+                state = 'value'
+            elif buf[pos] == ']':
+                pos += 1
+                state = 'end'
+            else:
+                raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+        else:
+            raise json.JSONDecodeError('Extra data', buf, pos)
+
+
+def _refill(fp, buf, pos, chunk_size):
+    """Drops the consumed part of the buffer and appends the next chunk.
+
+    The read size grows with the pending data so a single large element is not re-decoded once per chunk.
+    """
+    data = fp.read(max(chunk_size, len(buf) - pos))
+    return buf[pos:] + data, 0, not data
+
+
+def iter_ndjson(fp, batch_size=DEFAULT_BATCH_SIZE, codec=None):
+    """Yields the records of a JSON Lines (NDJSON) stream, one flat dictionary per line, reading and decoding
+    batch_size lines at a time.
+
+    Each batch is decoded with a single loads call; a batch that fails is decoded again line by line to
+    report the offending line. Blank lines are skipped.
+
+    Parameters
+    ----------
+    fp : file
+        a text file object, e.g. sys.stdin
+    batch_size : int
+        number of lines read and decoded at a time
+    codec : json_codec.Codec
+        the JSON backend decoding the lines, the json module if None
+
+    Raises
+    ------
+    ValueError
+        If a line is not a single JSON value, with its line number.
+
+    Yields
+    ------
+    record : dict
+    """
+    loads = json.loads if codec is None else codec.loads
+    first_line = 1
+    while True:
+        lines = list(islice(fp, batch_size))
+        if not lines:
+            return
+        values = [line for line in lines if line.strip()]
+        try:
+            records = loads('[' + ','.join(values) + ']')
+        except ValueError:
+            records = None
+        # a line holding several comma-separated values would decode to more records than lines
+        if records is None or len(records) != len(values):
+            records = [decode_line(line, first_line + offset, loads) for offset, line in enumerate(lines)
+                       if line.strip()]
+        yield from records
+        first_line += len(lines)
+
+
+def decode_line(line, line_number, loads=json.loads):
+    """Decodes one NDJSON line, naming the line in the error if it is not a single JSON value."""
+    try:
+        return loads(line)
+    except ValueError as e:
+        raise ValueError('line {}: {}'.format(line_number, e)) from None
+
+
+def iter_top_level_groups(keys_list, json_list_ordered):
+    """Groups records that arrive sorted (or at least grouped) by the first key, one top-level group at a time.
+
+    Only the records of the current group are held in memory; each group is nested with group_json and handed
+    over as soon as the first key changes.
+
+    Parameters
+    ----------
+    keys_list : list
+        List of keys specified in command line arguments
+    json_list_ordered : iterable
+        dictionaries sorted by keys, e.g. the output of read_and_sort_json_file
+
+    Raises
+    ------
+    KeyError
+        If one the keys passed as argument is not a valid key.
+    TypeError
+        If none key is indicated as argument
+    ValueError
+        If a top-level key shows up again after its group was closed, i.e. the input was not grouped.
+
+    Yields
+    ------
+    group : tuple
+        (top-level key, nested dictionary or leaf array below it)
+    """
+    if not keys_list:
+        print("Oops!  That was not valid number of keys.  Try again...")
+        raise TypeError('at least one key is required')
+
+    first_key = keys_list[0]
+    remaining_keys = keys_list[1:]
+    key_set = frozenset(keys_list)
+    seen_keys = set()
+
+    def top_level_key(record):
+        try:
+            return record[first_key]
+        except KeyError as ke:
+            print("Oops!  That was not a valid key.  Try again...", ke)
+            raise
+
+    for key, records in groupby(json_list_ordered, key=top_level_key):
+        if key in seen_keys:
+            raise ValueError('Input is not grouped by {!r}: {!r} appears twice'.format(first_key, key))
+        seen_keys.add(key)
+        if remaining_keys:
+            yield key, grouping.group_json(remaining_keys, records, strip_keys=(first_key,))
+        else:
+            yield key, [grouping.strip_record(key_set, record) for record in records]
+
+
+def write_json_groups(groups, fp, codec=None):
+    """Writes top-level groups as one JSON object, flushing and releasing each group as soon as it is written.
+
+    Without a codec the output is byte-identical to json.dump of the equivalent dictionary.
+
+    Parameters
+    ----------
+    groups : iterable
+        (top-level key, subtree) tuples, e.g. from iter_top_level_groups
+    fp : file
+        a text file object opened for writing, or a binary one with a codec
+    codec : json_codec.Codec
+        the JSON backend, see dump_group
+
+    Returns
+    -------
+    number_of_groups : int
+        number of top-level groups written
+    """
+    return write_json_fragments((dump_group(key, subtree, codec) for key, subtree in groups), fp, codec)
+
+
+def write_json_fragments(fragments, fp, codec=None):
+    """Writes already serialized top-level groups as one JSON object, flushing after each of them.
+
+    Parameters
+    ----------
+    fragments : iterable
+        '"key": subtree' JSON members, e.g. from dump_group
+    fp : file
+        a text file object opened for writing, or a binary one for bytes fragments
+    codec : json_codec.Codec
+        the JSON backend the bytes fragments were dumped with, None for str fragments
+
+    Returns
+    -------
+    number_of_groups : int
+        number of top-level groups written
+    """
+    opening, separator, closing = punctuation(codec)
+    number_of_groups = 0
+    fp.write(opening)
+    for fragment in fragments:
+        if number_of_groups:
+            fp.write(separator)
+        fp.write(fragment)
+        fp.flush()
+        number_of_groups += 1
+    fp.write(closing)
+    return number_of_groups
+
+
+def iter_json_object(fragments, codec=None):
+    """Yields a JSON object piece by piece from already serialized top-level groups, e.g. to stream it
+    in an HTTP response.
+
+    Parameters
+    ----------
+    fragments : iterable
+        '"key": subtree' JSON members, e.g. from dump_group
+    codec : json_codec.Codec
+        the JSON backend the bytes fragments were dumped with, None for str fragments
+
+    Yields
+    ------
+    chunk : str or bytes
+        the opening brace, each fragment, the separators and the closing brace
+    """
+    opening, separator, closing = punctuation(codec)
+    yield opening
+    first = True
+    for fragment in fragments:
+        if not first:
+            yield separator
+        yield fragment
+        first = False
+    yield closing
+
+
+def punctuation(codec=None):
+    """Returns the opening brace, member separator and closing brace matching the fragments of a codec."""
+    if codec is None:
+        return '{', ', ', '}'
+    return b'{', codec.separator, b'}'
+
+
+def dump_group(key, subtree, codec=None):
+    """Serializes one top-level group as a '"key": subtree' JSON member.
+
+    Dumping a one-item dict keeps the backend's key coercion (ints, floats, None...) and separators. CompactLeaf
+    arrays are written as lists of dicts.
+
+    Parameters
+    ----------
+    key : object
+        the top-level key
+    subtree : dict or list
+        the nested dictionary or leaf array below it
+    codec : json_codec.Codec
+        If given, the member is dumped by this backend straight to bytes, otherwise to str by the json module.
+
+    Returns
+    -------
+    fragment : str or bytes
+    """
+    if codec is None:
+        return json.dumps({key: subtree}, default=leaves.json_default)[1:-1]
+    return codec.dumps({key: subtree}, default=leaves.json_default)[1:-1]
+
+
+def iter_leaf_groups(groups, depth):
+    """Yields every leaf array of top-level groups with its key path, in document order and without recursion.
+
+    Parameters
+    ----------
+    groups : iterable
+        (top-level key, subtree) tuples, e.g. from iter_top_level_groups or final_dict.items()
+    depth : int
+        number of keys, i.e. dictionary levels above the leaf arrays
+
+    Yields
+    ------
+    leaf_group : tuple
+        (tuple of the keys from the top level down, leaf array)
+    """
+    for key, subtree in groups:
+        stack = [((key,), subtree)]
+        while stack:
+            path, node = stack.pop()
+            if len(path) == depth:
+                yield path, node
+            else:
+                stack.extend((path + (child_key,), child) for child_key, child in reversed(list(node.items())))
+
+
+def dump_leaf_line(path, leaf, codec=None):
+    """Serializes one leaf group as a JSON Lines line, {"path": [key, ...], "records": [...]}.
+
+    Unlike the keys of the nested document, the path keeps the original types of the keys.
+
+    Parameters
+    ----------
+    path : tuple
+        the keys from the top level down to the leaf
+    leaf : list
+        the leaf array
+    codec : json_codec.Codec
+        If given, the line is dumped by this backend straight to bytes, otherwise to str by the json module.
+
+    Returns
+    -------
+    line : str or bytes
+        ending with a newline
+    """
+    if codec is None:
+        return json.dumps({'path': list(path), 'records': leaf}, default=leaves.json_default) + '\n'
+    return codec.dumps({'path': list(path), 'records': leaf}, default=leaves.json_default) + b'\n'
+
+
+def write_lines(lines, fp):
+    """Writes already serialized lines, e.g. from dump_leaf_line. Lines are small, so they are left to the
+    file's buffering instead of being flushed one by one.
+
+    Returns
+    -------
+    number_of_lines : int
+        number of lines written
+    """
+    number_of_lines = 0
+    for line in lines:
+        fp.write(line)
+        number_of_lines += 1
+    return number_of_lines
+
+
+def stream_json_file(groups, file_name, serialized=False, ndjson=False, codec=None, compress=None):
+    """Creates a json file with the resulting nested dictionary, writing it one top-level group at a time
+
+    Parameters
+    ----------
+    groups : iterable
+        (top-level key, subtree) tuples, e.g. from iter_top_level_groups
+    file_name : str
+        a str that contains the path and the name of the result file
+    serialized : bool
+        If True, groups are already serialized JSON fragments, e.g. from parallel.parallel_json_groups
+    ndjson : bool
+        If True, groups are already serialized JSON Lines lines, e.g. from dump_leaf_line, written as they are
+    codec : json_codec.Codec
+        If given, the file is written in binary with this backend, and serialized groups are bytes it dumped.
+    compress : str
+        If given, the file is compressed as it is written, 'gzip' or 'lzma', see compression.open_file
+
+    Raises
+    ------
+    IOError
+        If there is an error creating result file.
+    """
+    try:
+        with compression.open_file(file_name, 'w' if codec is None else 'wb', compress) as fp:
+            if ndjson:
+                write_lines(groups, fp)
+            elif serialized:
+                write_json_fragments(groups, fp, codec)
+            else:
+                write_json_groups(groups, fp, codec)
+        print('[INFO] Json file created in {}'.format(file_name))
+    except FileNotFoundError as fnf_error:
+        print("I/O error: {}".format(fnf_error))
@@ -1,5 +1,16 @@
 import pytest
 import base64
+import gzip
+import io
+import json
+import lzma
+import os
+import sys
+import threading
+import time
+
+from werkzeug.datastructures import MultiDict
+from werkzeug.test import EnvironBuilder
 
 
 @pytest.fixture
@@ -75,11 +86,485 @@ def test_jfile_endpoint_rejects_invalid_json_request_payload_with_400_bad_reques
     assert response.status_code == 400
 
 
-def test_jfile_endpoint_returns_no_entity_body_on_happy_path(app):
+def test_jfile_endpoint_returns_no_entity_body_when_writing_a_results_file(app):
     api_client = app.test_client()
     user_credentials = base64.b64encode(b"alvaro:1234").decode()
-    response = api_client.post('/jfile?thing', data='[{"thing": "blah"}]', headers={'content-type': 'application/json',
-                                                                                    "Authorization": "Basic {}".format(
-                                                                                        user_credentials)})
+    response = api_client.post('/jfile?thing&output=file', data='[{"thing": "blah"}]',
+                               headers={'content-type': 'application/json',
+                                        "Authorization": "Basic {}".format(user_credentials)})
     assert len(response.data) == 0
+    file_name = response.headers['X-Result-File']
+    with open(file_name) as fp:
+        assert json.load(fp) == {'blah': [{}]}
+    os.remove(file_name)
+
+
+def test_jfile_endpoint_returns_the_nested_document_in_the_body_on_happy_path(app):
+    api_client = app.test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    response = api_client.post('/jfile?currency&country',
+                               data='[{"country": "US","city": "Boston","currency": "USD","amount": 100},'
+                                    '{"country": "FR","city": "Paris","currency": "EUR","amount": 20}]',
+                               headers={'content-type': 'application/json',
+                                        "Authorization": "Basic {}".format(user_credentials)})
+    assert response.status_code == 201
+    assert response.mimetype == 'application/json'
+    assert response.data == b'{"EUR": {"FR": [{"city": "Paris", "amount": 20}]}, ' \
+                            b'"USD": {"US": [{"city": "Boston", "amount": 100}]}}'
+    assert 'X-Result-File' not in response.headers
+
+
+def test_jfile_endpoint_rejects_keys_missing_from_the_payload_with_400_bad_request(app):
+    api_client = app.test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    response = api_client.post('/jfile?ci', data='[{"thing": "blah"}]',
+                               headers={'content-type': 'application/json',
+                                        "Authorization": "Basic {}".format(user_credentials)})
+    assert response.status_code == 400
+
+
+def test_jfile_endpoint_rejects_unknown_output_mode_with_400_bad_request(app):
+    api_client = app.test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    response = api_client.post('/jfile?thing&output=printer', data='[{"thing": "blah"}]',
+                               headers={'content-type': 'application/json',
+                                        "Authorization": "Basic {}".format(user_credentials)})
+    assert response.status_code == 400
+
+
+def test_parse_query_args_splits_keys_and_options():
+    from src import app
+    args = MultiDict([('currency', ''), ('output', 'file'), ('country', '')])
+    assert app.parse_query_args(args) == (['currency', 'country'], {'output': 'file'})
+
+
+def test_jfile_async_mode_returns_202_and_serves_the_result_once_the_job_is_done(app):
+    api_client = app.test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {"Authorization": "Basic {}".format(user_credentials)}
+    response = api_client.post('/jfile?currency&country&mode=async', data=json.dumps(some_payload()),
+                               headers=dict(headers, **{'content-type': 'application/json'}))
+    assert response.status_code == 202
+    assert response.json['status'] in ('queued', 'running', 'done')
+
+    for _ in range(500):
+        status = api_client.get(response.headers['Location'], headers=headers)
+        if status.json['status'] == 'done':
+            break
+        threading.Event().wait(0.01)
+    result = api_client.get(response.headers['Location'] + '/result', headers=headers)
+    assert result.status_code == 200
+    assert result.json == {'EUR': {'FR': [{'city': 'Paris', 'amount': 20}]},
+                           'USD': {'US': [{'city': 'Boston', 'amount': 100}]}}
+
+
+def test_jfile_async_job_with_an_invalid_key_is_reported_as_failed(app):
+    api_client = app.test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {"Authorization": "Basic {}".format(user_credentials)}
+    response = api_client.post('/jfile?ci&mode=async', data=json.dumps(some_payload()),
+                               headers=dict(headers, **{'content-type': 'application/json'}))
+    for _ in range(500):
+        result = api_client.get(response.headers['Location'] + '/result', headers=headers)
+        if result.status_code != 202:
+            break
+        threading.Event().wait(0.01)
+    assert result.status_code == 422
+    assert result.json['status'] == 'failed'
+
+
+def test_jfile_async_mode_answers_429_when_the_job_queue_is_full(monkeypatch):
+    from src import app as app_module
+    release = threading.Event()
+    monkeypatch.setattr(app_module, 'run_job', lambda *args: release.wait())
+    api_app = app_module.create_app({'JOBS_WORKERS': 1, 'JOBS_MAX_PENDING': 1})
+    api_client = api_app.test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {'content-type': 'application/json', "Authorization": "Basic {}".format(user_credentials)}
+    try:
+        assert api_client.post('/jfile?city&mode=async', data='[]', headers=headers).status_code == 202
+        assert api_client.post('/jfile?city&mode=async', data='[]', headers=headers).status_code == 429
+    finally:
+        release.set()
+
+
+def test_jfile_job_endpoints_answer_404_for_unknown_jobs(app):
+    api_client = app.test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {"Authorization": "Basic {}".format(user_credentials)}
+    assert api_client.get('/jfile/jobs/unknown', headers=headers).status_code == 404
+    assert api_client.get('/jfile/jobs/unknown/result', headers=headers).status_code == 404
+
+
+def some_payload():
+    return [{"country": "US", "city": "Boston", "currency": "USD", "amount": 100},
+            {"country": "FR", "city": "Paris", "currency": "EUR", "amount": 20}]
+
+
+def test_jfile_answers_repeated_requests_from_the_cache(app):
+    api_client = app.test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {'content-type': 'application/json', "Authorization": "Basic {}".format(user_credentials)}
+    first = api_client.post('/jfile?currency&country', data=json.dumps(some_payload()), headers=headers)
+    # the result is cached once the streamed body has been sent
+    assert first.data
+    second = api_client.post('/jfile?currency&country', data=json.dumps(some_payload()), headers=headers)
+    other_keys = api_client.post('/jfile?country&currency', data=json.dumps(some_payload()), headers=headers)
+    assert (first.headers['X-Cache'], second.headers['X-Cache'], other_keys.headers['X-Cache']) == (
+        'MISS', 'HIT', 'MISS')
+    assert second.status_code == 201
+    assert second.data == first.data
+    assert other_keys.data
+    stats = api_client.get('/jfile/cache', headers=headers).json
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 2, 2)
+
+
+def test_jfile_cache_can_be_disabled():
+    from src import app as app_module
+    api_client = app_module.create_app({'CACHE_MAX_ENTRIES': 0}).test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {'content-type': 'application/json', "Authorization": "Basic {}".format(user_credentials)}
+    for _ in range(2):
+        response = api_client.post('/jfile?currency', data=json.dumps(some_payload()), headers=headers)
+        assert 'X-Cache' not in response.headers
+
+
+def test_jfile_index_mode_folds_batches_into_a_named_index(app):
+    api_client = app.test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {'content-type': 'application/json', "Authorization": "Basic {}".format(user_credentials)}
+    payload = some_payload()
+    first = api_client.post('/jfile?currency&country&index=sales', data=json.dumps(payload[:1]), headers=headers)
+    assert first.status_code == 201
+    assert first.json == {'index': 'sales', 'keys': ['currency', 'country'], 'records': 1, 'added': 1}
+    second = api_client.post('/jfile?index=sales', data=json.dumps(payload[1:]), headers=headers)
+    assert second.json['records'] == 2
+
+    document = api_client.get('/jfile/indexes/sales', headers=headers)
+    assert document.json == {'EUR': {'FR': [{'city': 'Paris', 'amount': 20}]},
+                             'USD': {'US': [{'city': 'Boston', 'amount': 100}]}}
+
+    removed = api_client.post('/jfile?index=sales&op=remove', data=json.dumps(payload[:1]), headers=headers)
+    assert removed.status_code == 200
+    assert removed.json['removed'] == 1
+    assert api_client.get('/jfile/indexes/sales', headers=headers).json == {
+        'EUR': {'FR': [{'city': 'Paris', 'amount': 20}]}}
+
+    assert api_client.delete('/jfile/indexes/sales', headers=headers).status_code == 204
+    assert api_client.get('/jfile/indexes/sales', headers=headers).status_code == 404
+
+
+def test_jfile_index_mode_rejects_keys_that_do_not_match_the_index_with_409_conflict(app):
+    api_client = app.test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {'content-type': 'application/json', "Authorization": "Basic {}".format(user_credentials)}
+    api_client.post('/jfile?currency&index=sales', data=json.dumps(some_payload()), headers=headers)
+    response = api_client.post('/jfile?country&index=sales', data=json.dumps(some_payload()), headers=headers)
+    assert response.status_code == 409
+
+
+def test_jfile_accepts_ndjson_payloads_and_answers_ndjson_lines(app):
+    api_client = app.test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {'content-type': 'application/x-ndjson', "Authorization": "Basic {}".format(user_credentials)}
+    data = '\n'.join(json.dumps(record) for record in some_payload()) + '\n'
+    response = api_client.post('/jfile?currency&country', data=data, headers=headers)
+    assert response.status_code == 201
+    assert response.data == b'{"EUR": {"FR": [{"city": "Paris", "amount": 20}]}, ' \
+                            b'"USD": {"US": [{"city": "Boston", "amount": 100}]}}'
+    response = api_client.post('/jfile?currency&country&format=ndjson', data=data, headers=headers)
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.data.decode().splitlines() == [
+        '{"path": ["EUR", "FR"], "records": [{"city": "Paris", "amount": 20}]}',
+        '{"path": ["USD", "US"], "records": [{"city": "Boston", "amount": 100}]}']
+
+
+def test_jfile_rejects_invalid_ndjson_lines_with_400_bad_request(app):
+    api_client = app.test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {'content-type': 'application/x-ndjson', "Authorization": "Basic {}".format(user_credentials)}
+    response = api_client.post('/jfile?city', data='{"city": "Paris"}\n{"city": \n', headers=headers)
+    assert response.status_code == 400
+    assert b'line 2' in response.data
+    response = api_client.post('/jfile?city&format=xml', data='{"city": "Paris"}\n', headers=headers)
+    assert response.status_code == 400
+
+
+def test_jfile_answers_the_same_document_with_the_fastest_json_codec():
+    from src import app as app_module
+    api_client = app_module.create_app({'JSON_CODEC': 'auto'}).test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    response = api_client.post('/jfile?currency&country', data=json.dumps(some_payload()),
+                               headers={'content-type': 'application/json',
+                                        "Authorization": "Basic {}".format(user_credentials)})
+    assert response.status_code == 201
+    assert json.loads(response.data) == {'EUR': {'FR': [{'city': 'Paris', 'amount': 20}]},
+                                         'USD': {'US': [{'city': 'Boston', 'amount': 100}]}}
+
+
+def test_jfile_aggregate_option_answers_statistics_per_group(app):
+    api_client = app.test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {'content-type': 'application/json', "Authorization": "Basic {}".format(user_credentials)}
+    response = api_client.post('/jfile?currency&aggregate=amount:sum,max', data=json.dumps(some_payload()),
+                               headers=headers)
+    assert response.status_code == 201
+    assert json.loads(response.data) == {'EUR': {'amount': {'sum': 20, 'max': 20}},
+                                         'USD': {'amount': {'sum': 100, 'max': 100}}}
+    response = api_client.post('/jfile?currency&aggregate=amount:median', data=json.dumps(some_payload()),
+                               headers=headers)
+    assert response.status_code == 400
+
+
+def test_jfile_views_option_answers_one_nested_document_per_list_of_keys(app):
+    api_client = app.test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {'content-type': 'application/json', "Authorization": "Basic {}".format(user_credentials)}
+    response = api_client.post('/jfile?views=currency,country;country,city', data=json.dumps(some_payload()),
+                               headers=headers)
+    assert response.status_code == 201
+    assert json.loads(response.data) == {
+        'currency,country': {'EUR': {'FR': [{'city': 'Paris', 'amount': 20}]},
+                             'USD': {'US': [{'city': 'Boston', 'amount': 100}]}},
+        'country,city': {'FR': {'Paris': [{'currency': 'EUR', 'amount': 20}]},
+                         'US': {'Boston': [{'currency': 'USD', 'amount': 100}]}}}
+    assert api_client.post('/jfile?city&views=currency', data='[]', headers=headers).status_code == 400
+    assert api_client.post('/jfile?views=currency;', data='[]', headers=headers).status_code == 400
+
+
+def test_jfile_store_output_serves_subtrees_and_paginated_leaf_arrays_by_key_path(app):
+    api_client = app.test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {'content-type': 'application/json', "Authorization": "Basic {}".format(user_credentials)}
+    payload = some_payload() + [{"country": "FR", "city": "Lyon", "currency": "EUR", "amount": 5}]
+    response = api_client.post('/jfile?currency&country&output=store', data=json.dumps(payload), headers=headers)
+    assert response.status_code == 201
+    url = response.json['url']
+    assert response.headers['Location'] == url
+
+    assert api_client.get(url, headers=headers).json == {
+        'EUR': {'FR': [{'city': 'Paris', 'amount': 20}, {'city': 'Lyon', 'amount': 5}]},
+        'USD': {'US': [{'city': 'Boston', 'amount': 100}]}}
+    assert api_client.get(url + '/USD', headers=headers).json == {'US': [{'city': 'Boston', 'amount': 100}]}
+    page = api_client.get(url + '/EUR/FR?limit=1', headers=headers)
+    assert page.json == [{'city': 'Paris', 'amount': 20}]
+    assert page.headers['X-Total-Count'] == '2'
+    next_page = page.headers['Link'].split(';')[0].strip('<>')
+    last = api_client.get(next_page, headers=headers)
+    assert last.json == [{'city': 'Lyon', 'amount': 5}]
+    assert 'Link' not in last.headers
+
+    assert api_client.get(url + '/GBP', headers=headers).status_code == 404
+    assert api_client.get(url + '/EUR/FR?limit=0', headers=headers).status_code == 400
+    assert api_client.delete(url, headers=headers).status_code == 204
+    assert api_client.get(url, headers=headers).status_code == 404
+    assert api_client.post('/jfile?currency&output=store&mode=async', data='[]', headers=headers).status_code == 400
+
+
+def test_metrics_endpoint_exposes_request_latency_and_payload_size_histograms(app):
+    api_client = app.test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {'content-type': 'application/json', "Authorization": "Basic {}".format(user_credentials)}
+    data = json.dumps(some_payload())
+    response = api_client.post('/jfile?currency&country', data=data, headers=headers)
+    body = response.data
+    response.close()
+    api_client.get('/jfile/unknown/EUR', headers=headers).close()
+
+    exposition = api_client.get('/metrics', headers=headers)
+    assert exposition.mimetype == 'text/plain'
+    lines = exposition.data.decode().splitlines()
+    assert 'jfile_request_duration_seconds_count{method="POST",endpoint="/jfile",status="201"} 1' in lines
+    assert 'jfile_request_duration_seconds_count{method="GET",endpoint="/jfile/<result_id>/<path:key_path>",' \
+           'status="404"} 1' in lines
+    assert 'jfile_request_size_bytes_sum{{content_type="application/json"}} {}'.format(len(data)) in lines
+    assert 'jfile_response_size_bytes_sum{{status="201"}} {}'.format(len(body)) in lines
+
+
+def test_metrics_can_be_disabled():
+    from src import app as app_module
+    api_client = app_module.create_app({'METRICS_ENABLED': False}).test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    response = api_client.get('/metrics', headers={"Authorization": "Basic {}".format(user_credentials)})
+    assert response.status_code == 404
+
+
+def test_jfile_inflates_compressed_request_bodies_and_compresses_responses(app):
+    api_client = app.test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {"Authorization": "Basic {}".format(user_credentials)}
+    expected = {"EUR": {"FR": [{"city": "Paris", "amount": 20}]}, "USD": {"US": [{"city": "Boston", "amount": 100}]}}
+    data = json.dumps(some_payload()).encode()
+    response = api_client.post('/jfile?currency&country', data=gzip.compress(data),
+                               headers=dict(headers, **{'content-type': 'application/json',
+                                                        'Content-Encoding': 'gzip', 'Accept-Encoding': 'gzip'}))
+    assert response.status_code == 201
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'X-Cache' not in response.headers
+    assert json.loads(gzip.decompress(response.data)) == expected
+
+    ndjson = b''.join(json.dumps(record).encode() + b'\n' for record in some_payload())
+    response = api_client.post('/jfile?currency&country', data=lzma.compress(ndjson),
+                               headers=dict(headers, **{'content-type': 'application/x-ndjson',
+                                                        'Content-Encoding': 'lzma'}))
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert json.loads(response.data) == expected
+
+
+def test_jfile_rejects_bad_compressed_bodies():
+    from src import app as app_module
+    api_client = app_module.create_app({'MAX_DECOMPRESSED_BYTES': 10 ** 5}).test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {'content-type': 'application/json', "Authorization": "Basic {}".format(user_credentials)}
+    bomb = gzip.compress(b'[' + b' ' * 10 ** 6 + b']')
+    response = api_client.post('/jfile?currency', data=bomb, headers=dict(headers, **{'Content-Encoding': 'gzip'}))
+    assert response.status_code == 413
+    response = api_client.post('/jfile?currency', data=b'garbage',
+                               headers=dict(headers, **{'Content-Encoding': 'gzip'}))
+    assert response.status_code == 400
+    response = api_client.post('/jfile?currency', data=b'[]', headers=dict(headers, **{'Content-Encoding': 'br'}))
+    assert response.status_code == 415
+
+
+def test_jfile_writes_compressed_results_files(app):
+    api_client = app.test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {'content-type': 'application/json', "Authorization": "Basic {}".format(user_credentials)}
+    response = api_client.post('/jfile?currency&output=file&compress=lzma', data=json.dumps(some_payload()),
+                               headers=headers)
+    file_name = response.headers['X-Result-File']
+    assert file_name.endswith('.json.xz')
+    with lzma.open(file_name, 'rt') as fp:
+        assert json.load(fp) == {"EUR": [{"country": "FR", "city": "Paris", "amount": 20}],
+                                 "USD": [{"country": "US", "city": "Boston", "amount": 100}]}
+    os.remove(file_name)
+    assert api_client.post('/jfile?currency&compress=lzma', data='[]', headers=headers).status_code == 400
+
+
+def post_without_content_length(api_client, url, data, headers):
+    """Posts a body the way a chunked upload arrives: without Content-Length, ended by the server."""
+    environ = EnvironBuilder(url, method='POST', data=data, headers=headers).get_environ()
+    del environ['CONTENT_LENGTH']
+    environ['wsgi.input_terminated'] = True
+    return api_client.open(environ)
+
+
+def test_jfile_rejects_payloads_over_the_limits_before_nesting_them():
+    from src import app as app_module
+    app = app_module.create_app({'MAX_BODY_BYTES': 1000, 'MAX_RECORDS': 2, 'MAX_KEYS': 2})
+    api_client = app.test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {'content-type': 'application/json', "Authorization": "Basic {}".format(user_credentials)}
+    ndjson_headers = dict(headers, **{'content-type': 'application/x-ndjson'})
+    record = json.dumps(some_payload()[0])
+    too_large = '[' + ','.join([record] * 20) + ']'
+
+    assert api_client.post('/jfile?currency', data=too_large, headers=headers).status_code == 413
+    assert api_client.post('/jfile?currency', data='[' + ','.join([record] * 3) + ']',
+                           headers=headers).status_code == 413
+    assert api_client.post('/jfile?currency', data='\n'.join([record] * 3), headers=ndjson_headers).status_code == 413
+    assert post_without_content_length(api_client, '/jfile?currency', too_large, headers).status_code == 413
+    assert post_without_content_length(api_client, '/jfile?currency', '\n'.join([record] * 20),
+                                       ndjson_headers).status_code == 413
+    assert api_client.post('/jfile?currency&country&city', data='[]', headers=headers).status_code == 400
+    assert api_client.post('/jfile?views=currency,country,city', data='[]', headers=headers).status_code == 400
+    assert api_client.post('/jfile?currency', data='\n'.join([record] * 2), headers=ndjson_headers).status_code == 201
+    response = post_without_content_length(api_client, '/jfile?currency', '[' + ','.join([record] * 2) + ']',
+                                           headers)
+    assert response.get_json() == {'USD': [{'country': 'US', 'city': 'Boston', 'amount': 100}] * 2}
+
+    rejected = api_client.get('/jfile/admission', headers=headers).get_json()['rejected']
+    assert rejected == {'queue_full': 0, 'wait_timeout': 0, 'body_too_large': 3, 'too_many_records': 2,
+                        'too_many_keys': 2}
+
+
+def test_jfile_holds_its_slot_until_the_response_body_is_sent_and_rejects_beyond_it_with_429():
+    from src import app as app_module
+    app = app_module.create_app({'MAX_CONCURRENT_REQUESTS': 1, 'MAX_WAITING_REQUESTS': 0,
+                                 'CACHE_MAX_ENTRIES': 0})
+    api_client = app.test_client()
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {'content-type': 'application/json', "Authorization": "Basic {}".format(user_credentials)}
+    data = json.dumps(some_payload())
+
+    streaming_response = api_client.post('/jfile?currency', data=data, headers=headers)
+    assert app.extensions['admission'].stats()['in_flight'] == 1
+    started = time.perf_counter()
+    rejected = api_client.post('/jfile?currency', data=data, headers=headers)
+    assert rejected.status_code == 429
+    assert rejected.headers['Retry-After'] == '1'
+    # rejected without waiting for the slot
+    assert time.perf_counter() - started < app.config['ADMISSION_TIMEOUT']
+    assert streaming_response.get_data()
+    assert app.extensions['admission'].stats()['in_flight'] == 0
+    assert api_client.post('/jfile?currency&output=store', data=data, headers=headers).status_code == 201
+    assert app.extensions['admission'].stats()['in_flight'] == 0
+    assert 'jfile_rejected_requests_total{reason="queue_full"} 1' in api_client.get(
+        '/metrics', headers=headers).data.decode().splitlines()
+
+
+def test_jfile_rejects_a_request_that_waited_too_long_for_a_slot_with_429():
+    from src import app as app_module
+    app = app_module.create_app({'MAX_CONCURRENT_REQUESTS': 1, 'MAX_WAITING_REQUESTS': 1, 'ADMISSION_TIMEOUT': 0.01})
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {'content-type': 'application/json', "Authorization": "Basic {}".format(user_credentials)}
+    release = app.extensions['admission'].acquire()
+    try:
+        response = app.test_client().post('/jfile?currency', data=json.dumps(some_payload()), headers=headers)
+    finally:
+        release()
+    assert response.status_code == 429
+    assert app.extensions['admission'].stats()['rejected']['wait_timeout'] == 1
+
+
+def test_small_requests_keep_a_low_latency_while_a_huge_one_is_processed():
+    from src import app as app_module
+    app = app_module.create_app({'MAX_CONCURRENT_REQUESTS': 2, 'CACHE_MAX_ENTRIES': 0})
+    user_credentials = base64.b64encode(b"alvaro:1234").decode()
+    headers = {'content-type': 'application/json', "Authorization": "Basic {}".format(user_credentials)}
+    huge = ''.join(json.dumps({'currency': 'C{}'.format(number % 50), 'country': 'K{}'.format(number % 300),
+                               'amount': number}) + '\n' for number in range(100000))
+    small = json.dumps(some_payload())
+    api_client = app.test_client()
+
+    def post_small():
+        started = time.perf_counter()
+        response = api_client.post('/jfile?currency&country', data=small, headers=headers)
+        response.get_data()
+        assert response.status_code == 201
+        return time.perf_counter() - started
+
+    idle = sorted(post_small() for _ in range(20))
+    outcome = {}
+
+    def post_huge():
+        try:
+            response = app.test_client().post('/jfile?currency&country', data=huge,
+                                              headers=dict(headers, **{'content-type': 'application/x-ndjson'}))
+            response.get_data()
+            outcome['status'] = response.status_code
+        except BaseException as e:
+            outcome['error'] = e
+
+    processing = threading.Thread(target=post_huge)
+    deadline = time.monotonic() + 30
+    processing.start()
+    while app.extensions['admission'].stats()['in_flight'] == 0 and processing.is_alive():
+        assert time.monotonic() < deadline, 'the huge request was never admitted'
+        time.sleep(0.001)
+    loaded = []
+    while processing.is_alive():
+        assert time.monotonic() < deadline, 'the huge request did not finish'
+        loaded.append(post_small())
+    processing.join()
 
+    if 'error' in outcome:
+        raise outcome['error']
+    assert outcome['status'] == 201
+    assert len(loaded) >= 5
+    loaded.sort()
+    # the huge request shares the GIL, so each small one may wait a few switch intervals for it; a small
+    # request queued behind the huge one would instead wait for all of it
+    margin = 10 * sys.getswitchinterval()
+    assert loaded[len(loaded) // 2] < 10 * idle[len(idle) // 2] + margin
@@ -0,0 +1,52 @@
+from src import admission
+import threading
+import time
+import pytest
+
+
+def test_admission_controller_rejects_at_once_when_the_wait_queue_is_full():
+    controller = admission.AdmissionController(max_concurrent=1, max_waiting=0)
+    release = controller.acquire()
+    with pytest.raises(admission.Rejected) as rejected:
+        controller.acquire()
+    assert rejected.value.reason == admission.QUEUE_FULL
+    release()
+    release()
+    controller.acquire()
+    stats = controller.stats()
+    assert (stats['in_flight'], stats['admitted'], stats['rejected'][admission.QUEUE_FULL]) == (1, 2, 1)
+
+
+def test_admission_controller_hands_a_released_slot_to_a_waiting_request():
+    controller = admission.AdmissionController(max_concurrent=1, max_waiting=1, wait_timeout=5)
+    release = controller.acquire()
+    admitted = []
+    waiter = threading.Thread(target=lambda: admitted.append(controller.acquire()))
+    deadline = time.monotonic() + 5
+    waiter.start()
+    while controller.stats()['waiting'] == 0:
+        assert time.monotonic() < deadline, 'the second request never waited'
+        time.sleep(0.001)
+    release()
+    waiter.join()
+    assert len(admitted) == 1
+    assert controller.stats()['in_flight'] == 1
+
+
+def test_admission_controller_rejects_a_request_still_waiting_after_the_timeout():
+    controller = admission.AdmissionController(max_concurrent=1, max_waiting=1, wait_timeout=0.01)
+    controller.acquire()
+    with pytest.raises(admission.Rejected) as rejected:
+        controller.acquire()
+    assert rejected.value.reason == admission.WAIT_TIMEOUT
+    controller.reject(admission.TOO_MANY_RECORDS)
+    assert controller.stats()['rejected'] == {'queue_full': 0, 'wait_timeout': 1, 'body_too_large': 0,
+                                              'too_many_records': 1, 'too_many_keys': 0}
+    assert controller.stats()['waiting'] == 0
+
+
+def test_admission_controller_without_a_concurrency_limit_admits_every_request():
+    controller = admission.AdmissionController(max_concurrent=None, max_waiting=0)
+    for _ in range(100):
+        controller.acquire()
+    assert controller.stats()['in_flight'] == 100
@@ -0,0 +1,44 @@
+from src import aggregate
+from src import grouping
+import pytest
+
+
+def test_aggregate_json_reduces_each_group(some_keys_list, some_json_file):
+    aggregations = [('amount', ('sum', 'count', 'min', 'max', 'mean'))]
+    final_dict = aggregate.aggregate_json(some_keys_list, iter(some_json_file), aggregations)
+    nested = grouping.group_json(some_keys_list, some_json_file)
+    assert list(final_dict) == list(nested)
+    for currency, subtree in nested.items():
+        assert list(final_dict[currency]) == list(subtree)
+        for country, leaf in subtree.items():
+            amounts = [record['amount'] for record in leaf]
+            assert final_dict[currency][country] == {'amount': {
+                'sum': sum(amounts), 'count': len(amounts), 'min': min(amounts), 'max': max(amounts),
+                'mean': sum(amounts) / len(amounts)}}
+
+
+def test_aggregate_json_skips_missing_and_null_values():
+    records = [{'k': 'a', 'x': 2, 'y': None}, {'k': 'a', 'x': 4}, {'k': 'b', 'y': 1}]
+    final_dict = aggregate.aggregate_json(['k'], records, [('x', ('count', 'mean')), ('y', ('max',))])
+    assert final_dict == {'a': {'x': {'count': 2, 'mean': 3.0}, 'y': {'max': None}},
+                          'b': {'x': {'count': 0, 'mean': None}, 'y': {'max': 1}}}
+
+
+def test_aggregate_json_rejects_non_numeric_values_and_invalid_keys(some_json_file):
+    with pytest.raises(TypeError):
+        aggregate.aggregate_json(['currency'], some_json_file, [('city', ('sum',))])
+    with pytest.raises(KeyError):
+        aggregate.aggregate_json(['bad_key'], some_json_file, [('amount', ('sum',))])
+    with pytest.raises(TypeError):
+        aggregate.aggregate_json([], some_json_file, [('amount', ('sum',))])
+
+
+def test_parse_aggregations_reads_reducers_per_field():
+    assert aggregate.parse_aggregations('amount:sum,mean; quantity:max') == [('amount', ('sum', 'mean')),
+                                                                           ('quantity', ('max',))]
+
+
+@pytest.mark.parametrize('spec', ['amount', 'amount:', ':sum', 'amount:median', 'amount:sum;'])
+def test_parse_aggregations_rejects_invalid_specs(spec):
+    with pytest.raises(ValueError):
+        aggregate.parse_aggregations(spec)
@@ -0,0 +1,46 @@
+import copy
+import json
+
+import pytest
+
+from src import binary_result
+from src import grouping
+from src import json_codec
+
+
+def test_binary_result_looks_up_and_exports_subtrees_like_the_json_document(some_json_file, some_keys_list, tmpdir):
+    file_name = str(tmpdir.join('result.jbin'))
+    final_dict = grouping.group_json(some_keys_list, copy.deepcopy(some_json_file))
+    assert binary_result.write_binary_result(final_dict.items(), 2, file_name) == 5
+
+    with binary_result.BinaryResult(file_name) as result:
+        assert len(result) == 5
+        assert result.lookup() == final_dict
+        assert result.lookup(['EUR']) == final_dict['EUR']
+        assert result.lookup(['EUR', 'FR']) == [{'city': 'Paris', 'amount': 20}, {'city': 'Lyon', 'amount': 11.4}]
+        assert result.export() == json.dumps(final_dict).encode()
+        assert result.export(['GBP']) == json.dumps(final_dict['GBP']).encode()
+        assert result.export(['EUR', 'ES']) == json.dumps(final_dict['EUR']['ES']).encode()
+        for path in (['JPY'], ['EUR', 'DE'], ['EU'], ['EUR', 'FR', 'Paris']):
+            with pytest.raises(KeyError):
+                result.lookup(path)
+
+
+def test_binary_result_keeps_the_document_order_of_non_str_keys(tmpdir):
+    file_name = str(tmpdir.join('result.jbin'))
+    final_dict = grouping.group_json(['year', 'month'], [{'year': 2021, 'month': 10, 'day': 1},
+                                                         {'year': 2021, 'month': 9, 'day': 2},
+                                                         {'year': 2020, 'month': 1, 'day': 3}])
+    codec = json_codec.get_codec('auto')
+    binary_result.write_binary_result(final_dict.items(), 2, file_name, codec)
+    with binary_result.BinaryResult(file_name, codec) as result:
+        assert json.loads(result.export()) == json.loads(json.dumps(final_dict))
+        assert list(result.lookup(['2021'])) == ['9', '10']
+        assert result.lookup(['2021', '9']) == [{'day': 2}]
+
+
+def test_binary_result_rejects_other_files(tmpdir):
+    other = tmpdir.join('result.json')
+    other.write('{"EUR": {"FR": []}}' * 4)
+    with pytest.raises(ValueError):
+        binary_result.BinaryResult(str(other))
@@ -0,0 +1,68 @@
+from src import cache
+import pytest
+
+
+@pytest.fixture()
+def result_cache():
+    result_cache = cache.ResultCache(max_entries=2, max_bytes=10, ttl=5, clock=lambda: result_cache.now)
+    result_cache.now = 0
+    yield result_cache
+
+
+def test_cache_key_depends_on_the_body_and_the_order_of_the_keys():
+    assert cache.cache_key(b'[]', ['a', 'b']) == cache.cache_key(b'[]', ['a', 'b'])
+    assert cache.cache_key(b'[]', ['a', 'b']) != cache.cache_key(b'[]', ['b', 'a'])
+    assert cache.cache_key(b'[]', ['a']) != cache.cache_key(b'[ ]', ['a'])
+
+
+def test_result_cache_counts_hits_and_misses(result_cache):
+    assert result_cache.get('k') is None
+    result_cache.put('k', '{}')
+    assert result_cache.get('k') == '{}'
+    assert result_cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 0, 'entries': 1, 'bytes': 2}
+
+
+def test_result_cache_evicts_the_least_recently_used_result(result_cache):
+    result_cache.put('a', '1')
+    result_cache.put('b', '2')
+    result_cache.get('a')
+    result_cache.put('c', '3')
+    assert result_cache.get('b') is None
+    assert result_cache.get('a') == '1'
+    assert result_cache.get('c') == '3'
+    assert result_cache.evictions == 1
+
+
+def test_result_cache_stays_within_max_bytes(result_cache):
+    result_cache.put('a', '123456')
+    result_cache.put('b', '123456')
+    assert result_cache.get('a') is None
+    result_cache.put('c', '12345678901')
+    assert result_cache.get('c') is None
+    assert result_cache.stats()['bytes'] == 6
+
+
+def test_result_cache_expires_results_after_the_ttl(result_cache):
+    result_cache.put('a', '1')
+    result_cache.now = 4
+    assert result_cache.get('a') == '1'
+    result_cache.now = 5
+    assert result_cache.get('a') is None
+    assert result_cache.stats()['entries'] == 0
+
+
+def test_result_cache_tee_caches_the_result_once_all_chunks_are_consumed(result_cache):
+    chunks = result_cache.tee('a', iter(['{', '}']))
+    assert next(chunks) == '{'
+    assert result_cache.stats()['entries'] == 0
+    assert list(chunks) == ['}']
+    assert result_cache.get('a') == '{}'
+
+
+def test_result_cache_tee_does_not_cache_results_larger_than_max_bytes(result_cache):
+    assert list(result_cache.tee('a', ['12345', '67890', '1'])) == ['12345', '67890', '1']
+    assert result_cache.get('a') is None
+
+
+def test_cache_key_depends_on_the_options():
+    assert cache.cache_key(b'[]', ['a'], {'aggregate': 'x:sum'}) != cache.cache_key(b'[]', ['a'])
@@ -0,0 +1,59 @@
+from src import columnar
+from src import grouping
+import json
+import pytest
+
+
+@pytest.fixture()
+def without_numpy(monkeypatch):
+    monkeypatch.setattr(columnar, 'np', None)
+
+
+def test_columnar_group_json_matches_group_json(some_keys_list, some_json_file):
+    pytest.importorskip('numpy')
+    expected = grouping.group_json(some_keys_list, some_json_file)
+    assert json.dumps(columnar.columnar_group_json(some_keys_list, some_json_file)) == json.dumps(expected)
+
+
+def test_columnar_group_json_nests_three_levels_and_keeps_input_order_in_leaves(some_json_file):
+    pytest.importorskip('numpy')
+    keys_list = ['currency', 'country', 'city']
+    records = some_json_file + [dict(some_json_file[1], amount=1)]
+    assert json.dumps(columnar.columnar_group_json(keys_list, records)) == json.dumps(
+        grouping.group_json(keys_list, records))
+
+
+def test_columnar_group_json_returns_leaves_as_column_slices(some_keys_list, some_json_file):
+    assert columnar.columnar_group_json(some_keys_list, some_json_file, as_columns=True)['EUR'] == {
+        'ES': {'city': ['Madrid'], 'amount': [8.9]},
+        'FR': {'city': ['Paris', 'Lyon'], 'amount': [20, 11.4]}}
+
+
+def test_columnar_group_json_keeps_empty_leaves_when_every_field_is_a_key():
+    records = [{'a': 1}, {'a': 2}, {'a': 1}]
+    assert columnar.columnar_group_json(['a'], records) == {1: [{}, {}], 2: [{}]}
+
+
+def test_columnar_group_json_falls_back_to_group_json_for_heterogeneous_records(some_keys_list, some_json_file):
+    some_json_file[0]['extra'] = True
+    assert columnar.columnar_group_json(some_keys_list, some_json_file) == grouping.group_json(
+        some_keys_list, some_json_file)
+    with pytest.raises(ValueError):
+        columnar.columnar_group_json(some_keys_list, some_json_file, as_columns=True)
+
+
+def test_columnar_group_json_falls_back_to_group_json_without_numpy(some_keys_list, some_json_file, without_numpy):
+    assert columnar.columnar_group_json(some_keys_list, some_json_file) == grouping.group_json(
+        some_keys_list, some_json_file)
+    assert columnar.columnar_group_json(some_keys_list, some_json_file, as_columns=True)['GBP'] == {
+        'UK': {'city': ['London'], 'amount': [12.2]}}
+
+
+def test_columnar_group_json_raises_keyerror_if_a_not_valid_key_is_indicated(some_json_file):
+    with pytest.raises(KeyError):
+        columnar.columnar_group_json(['ci'], some_json_file)
+
+
+def test_columnar_group_json_raises_typeerror_if_no_key_is_indicated(some_json_file):
+    with pytest.raises(TypeError):
+        columnar.columnar_group_json([], some_json_file)
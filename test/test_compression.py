@@ -0,0 +1,57 @@
+from src import compression
+import gzip
+import io
+import lzma
+import zlib
+import pytest
+
+BODY = b'[' + b','.join(b'{"currency": "EUR", "amount": %d}' % number for number in range(2000)) + b']'
+
+
+def inflate(data, encoding, max_size=compression.DEFAULT_MAX_SIZE):
+    stream = io.BufferedReader(compression.DecompressingStream(io.BytesIO(data), encoding, max_size))
+    return stream.read()
+
+
+@pytest.mark.parametrize('encoding, data', [
+    ('gzip', gzip.compress(BODY)),
+    ('gzip', gzip.compress(BODY[:100]) + gzip.compress(BODY[100:])),
+    ('deflate', zlib.compress(BODY)),
+    ('deflate', zlib.compress(BODY)[2:-4]),
+    ('lzma', lzma.compress(BODY)),
+])
+def test_decompressing_stream_inflates_each_content_coding(encoding, data):
+    assert inflate(data, encoding) == BODY
+
+
+def test_decompressing_stream_stops_a_zip_bomb_at_max_size():
+    data = gzip.compress(b'0' * 10 ** 7)
+    assert len(data) < 20000
+    with pytest.raises(compression.DecompressedSizeError):
+        inflate(data, 'gzip', max_size=10 ** 6)
+
+
+def test_decompressing_stream_rejects_truncated_and_corrupt_bodies():
+    with pytest.raises(ValueError, match='ended'):
+        inflate(gzip.compress(BODY)[:-10], 'gzip')
+    with pytest.raises(ValueError, match='Invalid'):
+        inflate(b'not compressed at all', 'gzip')
+    with pytest.raises(ValueError):
+        compression.DecompressingStream(io.BytesIO(), 'br')
+
+
+@pytest.mark.parametrize('encoding, decompress', [
+    ('gzip', gzip.decompress), ('deflate', zlib.decompress), ('lzma', lzma.decompress)])
+def test_compress_chunks_round_trips_str_and_bytes_chunks(encoding, decompress):
+    chunks = ['{"EUR": ', b'[1, 2]', '}']
+    assert decompress(b''.join(compression.compress_chunks(chunks, encoding))) == b'{"EUR": [1, 2]}'
+
+
+def test_open_file_writes_compressed_text(tmpdir):
+    file_name = str(tmpdir.join('result.json.xz'))
+    with compression.open_file(file_name, 'w', 'lzma') as fp:
+        fp.write('{"EUR": []}')
+    with lzma.open(file_name, 'rt') as fp:
+        assert fp.read() == '{"EUR": []}'
+    with pytest.raises(ValueError):
+        compression.open_file(file_name, 'w', 'deflate')
@@ -0,0 +1,106 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+from src import daemon
+from src import daemon_client
+
+
+@pytest.fixture
+def socket_dir():
+    # Unix socket paths are limited to about 100 characters, shorter than pytest's tmpdir paths
+    path = tempfile.mkdtemp(prefix='jp')
+    yield path
+    shutil.rmtree(path)
+
+
+def serve(socket_path, idle_timeout):
+    server = daemon.DaemonServer(socket_path, idle_timeout=idle_timeout)
+    thread = threading.Thread(target=server.serve, kwargs={'poll_interval': 0.05})
+    thread.start()
+    return server, thread
+
+
+def test_daemon_runs_concurrent_jobs_like_the_command_line(some_json_file, some_keys_list, socket_dir):
+    socket_path = os.path.join(socket_dir, 'd.sock')
+    server, thread = serve(socket_path, idle_timeout=None)
+    responses = {}
+
+    def records_for(number):
+        # each job nests its own records, so a job answered with another one's tree fails
+        return [dict(record, amount=record['amount'] + number) for record in some_json_file]
+
+    def client(number):
+        argv = some_keys_list + ['--output-file', 'result-{}.json'.format(number)]
+        if number % 2:
+            # forks worker processes, so the daemon runs it alone
+            argv += ['--workers', '2']
+        data = json.dumps(records_for(number)).encode()
+        responses[number] = daemon_client.run(argv, io.BytesIO(data), socket_path, cwd=socket_dir, autostart=False)
+
+    clients = [threading.Thread(target=client, args=(number,)) for number in range(6)]
+    try:
+        for client_thread in clients:
+            client_thread.start()
+        for client_thread in clients:
+            client_thread.join()
+        data = json.dumps(some_json_file).encode()
+        failed = daemon_client.run(['city', 'unknown'], io.BytesIO(data), socket_path, autostart=False)
+    finally:
+        server.shutdown()
+        thread.join()
+
+    for number in range(6):
+        assert responses[number]['status'] == 0
+        assert responses[number]['stdout'] == '[INFO] Json file created in {}\n'.format(
+            os.path.join(socket_dir, 'result-{}.json'.format(number)))
+        with open(os.path.join(socket_dir, 'result-{}.json'.format(number))) as fp:
+            assert json.load(fp)['EUR']['FR'] == [{'city': 'Paris', 'amount': 20 + number},
+                                                  {'city': 'Lyon', 'amount': 11.4 + number}]
+    assert failed['status'] == 1
+    assert "KeyError: 'unknown'" in failed['stderr']
+    assert not os.path.exists(socket_path)
+
+
+def test_job_slot_runs_exclusive_jobs_alone(socket_dir):
+    server = daemon.DaemonServer(os.path.join(socket_dir, 'd.sock'), idle_timeout=None)
+    events = []
+
+    def job(name, exclusive):
+        with server.job_slot(exclusive):
+            events.append(name)
+
+    try:
+        with server.job_slot():
+            exclusive = threading.Thread(target=job, args=('exclusive', True))
+            exclusive.start()
+            for _ in range(500):
+                if server._exclusive_waiting:
+                    break
+                exclusive.join(timeout=0.01)
+            # a job arriving after the waiting exclusive one runs after it
+            shared = threading.Thread(target=job, args=('shared', False))
+            shared.start()
+            shared.join(timeout=0.1)
+            assert events == []
+        exclusive.join(timeout=5)
+        shared.join(timeout=5)
+        assert events == ['exclusive', 'shared']
+    finally:
+        server.server_close()
+
+
+def test_daemon_shuts_down_when_idle_and_replaces_a_stale_socket(socket_dir):
+    socket_path = os.path.join(socket_dir, 'd.sock')
+    open(socket_path, 'w').close()
+    server, thread = serve(socket_path, idle_timeout=0.1)
+    with pytest.raises(OSError):
+        daemon.DaemonServer(socket_path)
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert not os.path.exists(socket_path)
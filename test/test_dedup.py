@@ -0,0 +1,66 @@
+from src import dedup
+from src import grouping
+from src import json_parser
+import copy
+import io
+import json
+import pytest
+
+
+@pytest.fixture()
+def repetitive_records(some_json_file):
+    # rows differing only in their keys, plus values that compare equal but serialize differently
+    records = [dict(record, currency=currency) for currency in ('EUR', 'USD', 'EUR') for record in some_json_file]
+    records += [{'currency': 'EUR', 'country': 'FR', 'city': 'Paris', 'amount': value}
+                for value in (1, 1.0, True, 1, [1], [True], [1])]
+    records.append({'country': 'FR', 'currency': 'EUR', 'amount': 1, 'city': 'Paris'})
+    return records
+
+
+def test_group_json_dedup_expands_back_to_the_group_json_output(repetitive_records):
+    for keys_list in (['currency', 'country'], ['country'], ['currency', 'country', 'city']):
+        for sort in (True, False):
+            expected = grouping.group_json(keys_list, copy.deepcopy(repetitive_records), sort=sort)
+            deduplicated = dedup.group_json_dedup(keys_list, repetitive_records, sort=sort)
+            expanded = dedup.expand_leaves(copy.deepcopy(deduplicated), len(keys_list))
+            assert json.dumps(expanded) == json.dumps(expected)
+
+
+def test_group_json_dedup_stores_each_distinct_record_once(repetitive_records):
+    final_dict = dedup.group_json_dedup(['currency', 'country'], repetitive_records)
+    assert final_dict['USD']['FR'] == {'records': [{'city': 'Paris', 'amount': 20}, {'city': 'Lyon', 'amount': 11.4}],
+                                       'index': [0, 1]}
+    paris = final_dict['EUR']['FR']
+    assert paris['records'] == [{'city': 'Paris', 'amount': 20}, {'city': 'Lyon', 'amount': 11.4},
+                                {'city': 'Paris', 'amount': 1}, {'city': 'Paris', 'amount': 1.0},
+                                {'city': 'Paris', 'amount': True}, {'city': 'Paris', 'amount': [1]},
+                                {'city': 'Paris', 'amount': [True]}, {'amount': 1, 'city': 'Paris'}]
+    assert paris['index'] == [0, 1, 0, 1, 2, 3, 4, 2, 5, 6, 5, 7]
+
+
+def test_group_json_dedup_counts_the_occurrences_of_each_distinct_record(repetitive_records):
+    final_dict = dedup.group_json_dedup(['currency', 'country'], repetitive_records, mode=dedup.COUNTS)
+    assert final_dict['EUR']['UK'] == {'records': [{'city': 'London', 'amount': 12.2},
+                                                   {'city': 'London', 'amount': 10.9}], 'counts': [2, 2]}
+    assert dedup.expand_leaf(final_dict['EUR']['UK']) == [{'city': 'London', 'amount': 12.2}] * 2 + [
+        {'city': 'London', 'amount': 10.9}] * 2
+
+
+def test_group_json_dedup_reports_invalid_keys(some_json_file):
+    with pytest.raises(KeyError):
+        dedup.group_json_dedup(['currency', 'unknown'], some_json_file)
+    with pytest.raises(TypeError):
+        dedup.group_json_dedup([], some_json_file)
+    with pytest.raises(ValueError):
+        dedup.expand_leaves({'EUR': [{'city': 'Paris'}]}, 1)
+
+
+def test_main_dedup_leaves_and_the_expansion_reproduce_the_default_result_file(repetitive_records, some_keys_list,
+                                                                                tmpdir):
+    data = json.dumps(repetitive_records)
+    json_parser.main(some_keys_list + ['--output-file', str(tmpdir.join('result.json'))], io.StringIO(data))
+    json_parser.main(some_keys_list + ['--dedup-leaves', 'index', '--output-file', str(tmpdir.join('dedup.json'))],
+                     io.StringIO(data))
+    dedup.main([str(tmpdir.join('dedup.json')), '--depth', '2', '--output-file', str(tmpdir.join('expanded.json'))])
+    assert tmpdir.join('expanded.json').read() == tmpdir.join('result.json').read()
+    assert tmpdir.join('dedup.json').size() < tmpdir.join('result.json').size()
@@ -0,0 +1,44 @@
+from src import external_sort
+from src import grouping
+from src import streaming
+import os
+import random
+import pytest
+
+
+def random_records(number_of_records):
+    rnd = random.Random(4)
+    return [{'country': rnd.choice('ABCDE'), 'currency': rnd.choice('XYZ'), 'amount': i}
+            for i in range(number_of_records)]
+
+
+def test_external_sort_sorts_in_memory_when_the_input_fits_in_the_budget(some_keys_list, some_json_file):
+    expected = sorted(some_json_file, key=lambda record: (record['currency'], record['country']))
+    assert list(external_sort.external_sort(some_keys_list, some_json_file)) == expected
+
+
+@pytest.mark.parametrize('merge_width', [2, 3, 64])
+def test_external_sort_spills_runs_and_keeps_a_stable_order(merge_width, tmpdir):
+    records = random_records(500)
+    expected = sorted(records, key=lambda record: (record['currency'], record['country']))
+    sorted_records = external_sort.external_sort(['currency', 'country'], iter(records), memory_budget=300,
+                                                 merge_width=merge_width, tmp_dir=str(tmpdir))
+    assert list(sorted_records) == expected
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_external_sort_feeds_the_streaming_writer_with_the_in_memory_result(tmpdir):
+    records = random_records(200)
+    sorted_records = external_sort.external_sort(['country', 'currency'], records, memory_budget=500)
+    groups = streaming.iter_top_level_groups(['country', 'currency'], sorted_records)
+    assert dict(groups) == grouping.group_json(['country', 'currency'], records)
+
+
+def test_external_sort_raises_keyerror_if_a_not_valid_key_is_indicated(some_json_file):
+    with pytest.raises(KeyError):
+        list(external_sort.external_sort(['ci'], some_json_file))
+
+
+def test_external_sort_raises_typeerror_if_no_key_is_indicated(some_json_file):
+    with pytest.raises(TypeError):
+        list(external_sort.external_sort([], some_json_file))
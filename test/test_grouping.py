@@ -0,0 +1,83 @@
+from src import grouping
+from src import json_parser
+import copy
+import pytest
+
+
+def test_group_json_matches_sort_zip_build_json_pipeline(some_keys_list, some_json_file):
+    expected = json_parser.build_json(
+        json_parser.zip_dicts(some_keys_list,
+                              json_parser.read_and_sort_json_file(some_keys_list, copy.deepcopy(some_json_file))))
+    assert grouping.group_json(some_keys_list, some_json_file) == expected
+    assert list(grouping.group_json(some_keys_list, some_json_file)) == list(expected)
+
+
+def test_group_json_does_not_mutate_input(some_keys_list, some_json_file):
+    original = copy.deepcopy(some_json_file)
+    grouping.group_json(some_keys_list, some_json_file)
+    assert some_json_file == original
+
+
+def test_group_json_keeps_first_seen_order_when_not_sorting(some_keys_list, some_json_file):
+    final_dict = grouping.group_json(some_keys_list, some_json_file, sort=False)
+    assert list(final_dict) == ['USD', 'EUR', 'GBP', 'FBP']
+    assert list(final_dict['EUR']) == ['FR', 'ES']
+
+
+def test_group_json_nests_three_levels(some_json_file):
+    assert grouping.group_json(['currency', 'country', 'city'], some_json_file) == {
+        'EUR': {'ES': {'Madrid': [{'amount': 8.9}]},
+                'FR': {'Lyon': [{'amount': 11.4}], 'Paris': [{'amount': 20}]}},
+        'FBP': {'UK': {'London': [{'amount': 10.9}]}},
+        'GBP': {'UK': {'London': [{'amount': 12.2}]}},
+        'USD': {'US': {'Boston': [{'amount': 100}]}}}
+
+
+def test_group_json_handles_hundreds_of_levels_without_recursion():
+    keys_list = ['k{}'.format(i) for i in range(2000)]
+    record = {key: 'v' for key in keys_list}
+    record['amount'] = 1
+    final_dict = grouping.group_json(keys_list, [record, record])
+    for _ in keys_list:
+        final_dict = final_dict['v']
+    assert final_dict == [{'amount': 1}, {'amount': 1}]
+
+
+def test_group_json_raises_keyerror_if_a_not_valid_key_is_indicated(some_json_file):
+    with pytest.raises(KeyError):
+        grouping.group_json(['ci'], some_json_file)
+
+
+def test_group_json_raises_typeerror_if_no_key_is_indicated(some_json_file):
+    with pytest.raises(TypeError):
+        grouping.group_json([], some_json_file)
+
+
+def test_sort_nested_dict_sorts_every_level():
+    final_dict = {'b': {'z': [1], 'a': [2]}, 'a': {'y': [3]}}
+    assert grouping.sort_nested_dict(final_dict, 2) == {'a': {'y': [3]}, 'b': {'a': [2], 'z': [1]}}
+    assert list(final_dict) == ['a', 'b']
+    assert list(final_dict['b']) == ['a', 'z']
+
+
+def test_group_json_views_builds_every_view_in_one_pass_without_mutating_the_input(some_json_file):
+    original = copy.deepcopy(some_json_file)
+    key_lists = [['currency', 'country'], ['country', 'city'], ['country', 'currency']]
+    views = grouping.group_json_views(key_lists, iter(some_json_file))
+    assert views == [grouping.group_json(keys_list, original) for keys_list in key_lists]
+    assert some_json_file == original
+
+
+def test_group_json_views_shares_records_between_views_with_the_same_keys(some_json_file):
+    by_currency, by_country = grouping.group_json_views([['currency', 'country'], ['country', 'currency']],
+                                                        some_json_file)
+    assert by_currency['EUR']['FR'][0] is by_country['FR']['EUR'][0]
+    shared, = grouping.group_json_views([['currency']], some_json_file, share_records=True)
+    assert shared['USD'][0] is some_json_file[0]
+
+
+def test_group_json_views_raises_on_invalid_keys(some_json_file):
+    with pytest.raises(KeyError):
+        grouping.group_json_views([['currency'], ['bad_key']], some_json_file)
+    with pytest.raises(TypeError):
+        grouping.group_json_views([['currency'], []], some_json_file)
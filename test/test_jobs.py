@@ -0,0 +1,56 @@
+from src import jobs
+import threading
+import pytest
+
+
+@pytest.fixture()
+def job_queue():
+    job_queue = jobs.JobQueue(workers=1, max_pending=2, result_ttl=10, clock=lambda: job_queue.now)
+    job_queue.now = 0
+    yield job_queue
+    job_queue.shutdown()
+
+
+def wait_until_finished(job_queue, job):
+    for _ in range(500):
+        if job_queue.get(job.id).finished_at is not None:
+            return job
+        threading.Event().wait(0.01)
+    raise AssertionError('job did not finish')
+
+
+def test_job_queue_runs_the_job_and_keeps_its_result(job_queue):
+    job = wait_until_finished(job_queue, job_queue.submit(sum, [1, 2, 3]))
+    assert job.status == jobs.DONE
+    assert job.result == 6
+    assert job.to_dict() == {'id': job.id, 'status': 'done'}
+
+
+def test_job_queue_records_the_error_of_a_failed_job(job_queue):
+    job = wait_until_finished(job_queue, job_queue.submit(int, 'not a number'))
+    assert job.status == jobs.FAILED
+    assert 'ValueError' in job.to_dict()['error']
+
+
+def test_job_queue_rejects_jobs_when_max_pending_are_queued_or_running(job_queue):
+    release = threading.Event()
+    first = job_queue.submit(release.wait)
+    second = job_queue.submit(release.wait)
+    with pytest.raises(jobs.QueueFull):
+        job_queue.submit(release.wait)
+    release.set()
+    wait_until_finished(job_queue, first)
+    wait_until_finished(job_queue, second)
+    wait_until_finished(job_queue, job_queue.submit(sum, []))
+
+
+def test_job_queue_expires_finished_jobs_after_the_result_ttl(job_queue):
+    job = wait_until_finished(job_queue, job_queue.submit(sum, []))
+    job_queue.now = 9
+    assert job_queue.get(job.id) is job
+    job_queue.now = 10
+    assert job_queue.get(job.id) is None
+
+
+def test_job_queue_returns_none_for_unknown_jobs(job_queue):
+    assert job_queue.get('unknown') is None
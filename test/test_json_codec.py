@@ -0,0 +1,72 @@
+import io
+import json
+import pickle
+
+from src import grouping
+from src import json_codec
+from src import json_parser
+from src import leaves
+from src import streaming
+import pytest
+
+
+@pytest.fixture(params=json_codec.available_codecs())
+def codec(request):
+    return json_codec.get_codec(request.param)
+
+
+def nested_document(codec, final_dict):
+    fp = io.BytesIO()
+    streaming.write_json_groups(final_dict.items(), fp, codec)
+    return fp.getvalue()
+
+
+def test_stdlib_codec_is_byte_identical_to_json_dump(some_keys_list, some_json_file):
+    final_dict = grouping.group_json(some_keys_list, some_json_file)
+    assert nested_document(json_codec.get_codec('json'), final_dict) == json.dumps(final_dict).encode()
+
+
+def test_codecs_write_the_same_document(codec, some_keys_list, some_json_file):
+    final_dict = grouping.group_json(some_keys_list, some_json_file)
+    final_dict[1] = {None: [{'x': 1.5, 'name': 'Zürich', 'big': 2 ** 40}]}
+    document = nested_document(codec, final_dict)
+    assert isinstance(document, bytes)
+    assert json.loads(document) == json.loads(json.dumps(final_dict))
+
+
+def test_codecs_dump_compact_leaves_and_ndjson_lines_the_same(codec, some_keys_list, some_json_file):
+    compact = leaves.group_json_compact(some_keys_list, some_json_file)
+    expected = grouping.group_json(some_keys_list, some_json_file)
+    assert json.loads(nested_document(codec, compact)) == json.loads(json.dumps(expected))
+    lines = [streaming.dump_leaf_line(path, leaf, codec) for path, leaf in
+             streaming.iter_leaf_groups(compact.items(), 2)]
+    assert all(line.endswith(b'\n') for line in lines)
+    assert [json.loads(line) for line in lines] == [json.loads(streaming.dump_leaf_line(path, leaf)) for path, leaf
+                                                    in streaming.iter_leaf_groups(expected.items(), 2)]
+
+
+def test_codecs_decode_ndjson_the_same(codec, some_json_file):
+    text = ''.join(json.dumps(record) + '\n' for record in some_json_file)
+    assert list(streaming.iter_ndjson(io.StringIO(text), 2, codec)) == some_json_file
+    with pytest.raises(ValueError, match='line 2'):
+        list(streaming.iter_ndjson(io.StringIO('{"a": 1}\n{"a"\n'), codec=codec))
+
+
+def test_codecs_write_the_same_result_file(codec, some_keys_list, some_json_file, tmpdir):
+    file_name = str(tmpdir.join('result.json'))
+    json_parser.handle_control_flow(some_keys_list, some_json_file, workers=2, codec=codec, file_name=file_name)
+    with open(file_name, 'rb') as fp:
+        assert json.loads(fp.read()) == grouping.group_json(some_keys_list, some_json_file)
+
+
+def test_codecs_are_pickled_by_name(codec):
+    assert pickle.loads(pickle.dumps(codec)).name == codec.name
+
+
+def test_get_codec_reads_the_environment_and_rejects_unknown_backends(monkeypatch):
+    monkeypatch.setenv(json_codec.CODEC_ENV_VAR, 'auto')
+    assert json_codec.get_codec().name == json_codec.available_codecs()[0]
+    monkeypatch.delenv(json_codec.CODEC_ENV_VAR)
+    assert json_codec.get_codec().name == 'json'
+    with pytest.raises(ValueError):
+        json_codec.get_codec('yaml')
@@ -1,4 +1,12 @@
+from src import binary_result
+from src import grouping
 from src import json_parser
+from src import profiling
+import argparse
+import copy
+import gzip
+import io
+import json
 import pytest
 from unittest.mock import MagicMock
 
@@ -177,3 +185,172 @@ def test_keyerror_exception_raised_if_a_not_valid_key_is_indicated(some_json_fil
     with pytest.raises(KeyError) as ke:
         json_parser.read_and_sort_json_file(['ci'], some_json_file)
         assert "That was not a valid key" in str(ke.value)
+
+
+def test_handle_control_flow_streams_presorted_input_to_the_same_result_file(some_json_file, some_keys_list):
+    json_parser.handle_control_flow(some_keys_list, copy.deepcopy(some_json_file))
+    with open(json_parser.result_file_name()) as fp:
+        expected = fp.read()
+    json_list_ordered = json_parser.read_and_sort_json_file(some_keys_list, some_json_file)
+    assert json_parser.handle_control_flow(some_keys_list, json_list_ordered, presorted=True) is None
+    with open(json_parser.result_file_name()) as fp:
+        assert fp.read() == expected
+
+
+def test_parse_args_reads_keys_and_options():
+    args = json_parser.parse_args(['currency', 'country', '--sorted-input'])
+    assert args.keys == ['currency', 'country']
+    assert args.sorted_input
+
+
+def test_handle_control_flow_with_a_memory_budget_writes_the_same_result_file(some_json_file, some_keys_list):
+    json_parser.handle_control_flow(some_keys_list, copy.deepcopy(some_json_file))
+    with open(json_parser.result_file_name()) as fp:
+        expected = fp.read()
+    json_parser.handle_control_flow(some_keys_list, some_json_file, memory_budget=64)
+    with open(json_parser.result_file_name()) as fp:
+        assert fp.read() == expected
+
+
+@pytest.mark.parametrize('size, number_of_bytes', [('100', 100), ('2K', 2048), ('1.5m', 1572864), ('1G', 1 << 30)])
+def test_parse_size_understands_suffixes(size, number_of_bytes):
+    assert json_parser.parse_size(size) == number_of_bytes
+
+
+@pytest.mark.parametrize('size', ['', 'M', 'abc', '0', '-1K'])
+def test_parse_size_rejects_invalid_sizes(size):
+    with pytest.raises(argparse.ArgumentTypeError):
+        json_parser.parse_size(size)
+
+
+def test_handle_control_flow_with_workers_writes_the_same_result_file(some_json_file, some_keys_list):
+    json_parser.handle_control_flow(some_keys_list, copy.deepcopy(some_json_file))
+    with open(json_parser.result_file_name()) as fp:
+        expected = fp.read()
+    json_parser.handle_control_flow(some_keys_list, some_json_file, workers=2)
+    with open(json_parser.result_file_name()) as fp:
+        assert fp.read() == expected
+
+
+def test_handle_control_flow_with_compact_leaves_writes_the_same_result_file(some_json_file, some_keys_list):
+    json_parser.handle_control_flow(some_keys_list, copy.deepcopy(some_json_file))
+    with open(json_parser.result_file_name()) as fp:
+        expected = fp.read()
+    json_parser.handle_control_flow(some_keys_list, some_json_file, compact_leaves=True)
+    with open(json_parser.result_file_name()) as fp:
+        assert fp.read() == expected
+    assert json_parser.parse_args(['currency', '--compact-leaves']).compact_leaves
+
+
+def test_handle_control_flow_writes_one_ndjson_line_per_leaf_group(some_json_file, some_keys_list, tmpdir):
+    file_name = str(tmpdir.join('result.ndjson'))
+    expected = grouping.group_json(some_keys_list, copy.deepcopy(some_json_file))
+    json_parser.handle_control_flow(some_keys_list, some_json_file, output_format='ndjson', file_name=file_name)
+    with open(file_name) as fp:
+        lines = [json.loads(line) for line in fp]
+    assert lines == [{'path': [currency, country], 'records': leaf} for currency, subtree in expected.items()
+                     for country, leaf in subtree.items()]
+    args = json_parser.parse_args(['currency', '--input-format', 'ndjson', '--output-format', 'ndjson'])
+    assert (args.input_format, args.output_format) == ('ndjson', 'ndjson')
+
+
+def test_handle_file_control_flow_writes_the_same_result_file(some_json_file, some_keys_list, tmpdir):
+    input_file = tmpdir.join('input.ndjson')
+    input_file.write(''.join(json.dumps(record) + '\n' for record in some_json_file))
+    json_parser.handle_control_flow(some_keys_list, copy.deepcopy(some_json_file))
+    with open(json_parser.result_file_name()) as fp:
+        expected = fp.read()
+    json_parser.handle_file_control_flow(some_keys_list, str(input_file), workers=2)
+    with open(json_parser.result_file_name()) as fp:
+        assert fp.read() == expected
+
+
+def test_handle_control_flow_writes_aggregated_groups(some_json_file, some_keys_list, tmpdir):
+    file_name = str(tmpdir.join('result.json'))
+    args = json_parser.parse_args(['currency', 'country', '--aggregate', 'amount:sum,count'])
+    json_parser.handle_control_flow(args.keys, iter(some_json_file), aggregations=args.aggregate,
+                                    file_name=file_name)
+    with open(file_name) as fp:
+        assert json.load(fp)['EUR']['FR'] == {'amount': {'sum': 31.4, 'count': 2}}
+    with pytest.raises(SystemExit):
+        json_parser.parse_args(['currency', '--aggregate', 'amount:median'])
+
+
+def test_handle_control_flow_writes_a_binary_result_file(some_json_file, some_keys_list, tmpdir):
+    file_name = str(tmpdir.join('result.jbin'))
+    expected = grouping.group_json(some_keys_list, copy.deepcopy(some_json_file))
+    json_parser.handle_control_flow(some_keys_list, some_json_file, presorted=False, output_format='binary',
+                                    file_name=file_name)
+    with binary_result.BinaryResult(file_name) as result:
+        assert result.lookup() == expected
+    assert json_parser.parse_args(['currency', '--output-format', 'binary']).output_format == 'binary'
+
+
+def test_handle_control_flow_profiles_the_nest_and_write_stages(some_json_file, some_keys_list, tmpdir):
+    profiler = profiling.Profiler(trace_memory=False)
+    json_parser.handle_control_flow(some_keys_list, iter(some_json_file), file_name=str(tmpdir.join('result.json')),
+                                    profiler=profiler)
+    assert [(stage.name, stage.records, stage.groups) for stage in profiler.stages] == [
+        ('nest', 6, 4), ('write', None, None)]
+    assert json_parser.parse_args(['currency', '--profile']).profile
+
+
+def test_parse_args_reads_the_output_file():
+    assert json_parser.parse_args(['currency', '--output-file', 'out.json']).output_file == 'out.json'
+
+
+def test_main_compresses_the_results_file(some_json_file, some_keys_list, tmpdir):
+    file_name = str(tmpdir.join('result.json.gz'))
+    json_parser.main(some_keys_list + ['--compress', 'gzip', '--output-file', file_name],
+                     io.StringIO(json.dumps(some_json_file)))
+    with gzip.open(file_name, 'rt') as fp:
+        assert json.load(fp) == grouping.group_json(some_keys_list, copy.deepcopy(some_json_file))
+    assert json_parser.compressed_file_name('ndjson', 'lzma', 'id').endswith('docs/results/result-id.ndjson.xz')
+    with pytest.raises(SystemExit):
+        json_parser.parse_args(['currency', '--compress', 'gzip', '--output-format', 'binary'])
+
+
+def test_parse_args_rejects_engine_options_that_workers_ignore():
+    for option in (['--engine', 'columnar'], ['--compact-leaves']):
+        with pytest.raises(SystemExit):
+            json_parser.parse_args(['currency', '--workers', '2'] + option)
+        assert json_parser.parse_args(['currency', '--workers', '1'] + option)
+
+
+def test_main_writes_the_same_result_file_with_every_strategy(some_json_file, some_keys_list, tmpdir):
+    expected = grouping.group_json(some_keys_list, copy.deepcopy(some_json_file))
+    for strategy in ('auto', 'hash', 'sort', 'columnar', 'sharded', 'external'):
+        file_name = str(tmpdir.join('result-{}.json'.format(strategy)))
+        json_parser.main(some_keys_list + ['--strategy', strategy, '--workers', '2', '--output-file', file_name],
+                         io.StringIO(json.dumps(some_json_file)))
+        with open(file_name) as fp:
+            assert json.load(fp) == expected
+
+
+def test_main_explains_the_plan_instead_of_nesting(some_json_file, some_keys_list, tmpdir, capsys):
+    file_name = str(tmpdir.join('result.json'))
+    json_parser.main(some_keys_list + ['--explain', '--output-file', file_name],
+                     io.StringIO(json.dumps(some_json_file)))
+    assert capsys.readouterr().out.splitlines()[:3] == [
+        'strategy: hash', 'reason: fewer than 10000 records', 'records: 6 (sampled 6)']
+    assert not tmpdir.join('result.json').exists()
+
+
+def test_parse_args_maps_the_engine_options_to_forced_strategies():
+    assert json_parser.parse_args(['currency']).strategy == 'auto'
+    assert json_parser.parse_args(['currency', '--sorted-input']).strategy == 'presorted'
+    assert json_parser.parse_args(['currency', '--memory-budget', '1M', '--sorted-input']).strategy == 'external'
+    assert json_parser.parse_args(['currency', '--engine', 'columnar', '--strategy', 'columnar']).strategy == \
+        'columnar'
+    assert json_parser.parse_args(['currency', '--compact-leaves']).strategy == 'hash'
+    for argv in (['--sorted-input', '--strategy', 'hash'], ['--strategy', 'sharded', '--workers', '1']):
+        with pytest.raises(SystemExit):
+            json_parser.parse_args(['currency'] + argv)
+
+
+def test_parse_args_nests_deduplicated_leaves_with_the_hash_strategy():
+    args = json_parser.parse_args(['currency', '--dedup-leaves', 'counts'])
+    assert (args.dedup_leaves, args.strategy) == ('counts', 'hash')
+    for argv in (['--workers', '2'], ['--strategy', 'sort']):
+        with pytest.raises(SystemExit):
+            json_parser.parse_args(['currency', '--dedup-leaves', 'index'] + argv)
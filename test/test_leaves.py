@@ -0,0 +1,68 @@
+import json
+
+from src import grouping
+from src import leaves
+from src import streaming
+import pytest
+
+
+def test_group_json_compact_matches_group_json(some_keys_list, some_json_file):
+    compact = leaves.group_json_compact(some_keys_list, some_json_file)
+    assert compact == grouping.group_json(some_keys_list, some_json_file)
+    assert isinstance(compact['USD']['US'], leaves.CompactLeaf)
+    assert compact['USD']['US'][0] == {'city': 'Boston', 'amount': 100}
+
+
+def test_group_json_compact_serializes_like_group_json(some_keys_list, some_json_file):
+    compact = leaves.group_json_compact(some_keys_list, some_json_file)
+    expected = grouping.group_json(some_keys_list, some_json_file)
+    assert [streaming.dump_group(key, subtree) for key, subtree in compact.items()] == \
+        [streaming.dump_group(key, subtree) for key, subtree in expected.items()]
+    assert json.loads('{' + streaming.dump_group('USD', compact['USD']) + '}') == {'USD': expected['USD']}
+
+
+def test_group_json_compact_shares_schemas_and_values():
+    records = [{'k': 'a', 'city': 'London', 'amount': i} for i in range(3)]
+    records = json.loads(json.dumps(records))
+    compact = leaves.group_json_compact(['k'], records)
+    rows = compact['a'].rows
+    assert rows[0][0] is rows[1][0] is rows[2][0]
+    assert compact['a'].schema == ('city', 'amount')
+
+
+def test_group_json_compact_keeps_records_with_another_schema_as_dicts():
+    records = [{'k': 'a', 'x': 1}, {'k': 'a', 'y': 2, 'x': 3}]
+    compact = leaves.group_json_compact(['k'], records)
+    assert compact == {'a': [{'x': 1}, {'y': 2, 'x': 3}]}
+    assert list(compact['a']) == [{'x': 1}, {'y': 2, 'x': 3}]
+
+
+def test_interner_stops_interning_high_cardinality_fields():
+    interner = leaves.Interner(max_values=2)
+    for value in ['a', 'b', 'c']:
+        interner.row(('f',), [value])
+    assert interner.row(('f',), [''.join(['c'])])[0] == 'c'
+    assert len(interner._values['f']) == 2
+
+
+def test_compact_leaf_append_and_remove():
+    leaf = leaves.CompactLeaf(leaves.Interner())
+    leaf.append({'a': 1, 'b': 2})
+    leaf.append({'b': 3})
+    assert {'b': 3} in leaf and len(leaf) == 2
+    leaf.remove({'a': 1, 'b': 2})
+    assert leaf == [{'b': 3}]
+    with pytest.raises(ValueError):
+        leaf.remove({'a': 1, 'b': 2})
+
+
+def test_group_json_compact_raises_on_invalid_keys(some_json_file):
+    with pytest.raises(KeyError):
+        leaves.group_json_compact(['bad_key'], some_json_file)
+    with pytest.raises(TypeError):
+        leaves.group_json_compact([], some_json_file)
+
+
+def test_json_default_rejects_other_objects():
+    with pytest.raises(TypeError):
+        json.dumps({'a': object()}, default=leaves.json_default)
@@ -0,0 +1,36 @@
+from src import admission
+from src import metrics
+
+
+def test_histogram_exposes_cumulative_buckets_per_label_values():
+    histogram = metrics.Histogram('latency_seconds', 'Latency.', (0.1, 1), ('status',))
+    for value, status in ((0.05, '201'), (0.5, '201'), (5, '201'), (0.1, '400')):
+        histogram.observe(value, status)
+    assert histogram.expose().splitlines() == [
+        '# HELP latency_seconds Latency.',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{status="201",le="0.1"} 1',
+        'latency_seconds_bucket{status="201",le="1"} 2',
+        'latency_seconds_bucket{status="201",le="+Inf"} 3',
+        'latency_seconds_sum{status="201"} 5.55',
+        'latency_seconds_count{status="201"} 3',
+        'latency_seconds_bucket{status="400",le="0.1"} 1',
+        'latency_seconds_bucket{status="400",le="1"} 1',
+        'latency_seconds_bucket{status="400",le="+Inf"} 1',
+        'latency_seconds_sum{status="400"} 0.1',
+        'latency_seconds_count{status="400"} 1']
+
+
+def test_label_values_are_escaped():
+    histogram = metrics.Histogram('size_bytes', 'Size.', (1,), ('content_type',))
+    histogram.observe(0, 'a"b\\')
+    assert 'size_bytes_count{content_type="a\\"b\\\\"} 1' in histogram.expose()
+
+
+def test_expose_admission_counts_rejections_per_reason():
+    stats = admission.AdmissionController().stats()
+    stats['rejected']['queue_full'] = 2
+    lines = metrics.expose_admission(stats).splitlines()
+    assert 'jfile_rejected_requests_total{reason="queue_full"} 2' in lines
+    assert 'jfile_rejected_requests_total{reason="too_many_records"} 0' in lines
+    assert 'jfile_requests_in_flight 0' in lines
@@ -0,0 +1,62 @@
+import json
+import mmap
+
+from src import grouping
+from src import mmap_ingest
+import pytest
+
+
+@pytest.fixture
+def ndjson_file(some_json_file, tmpdir):
+    path = tmpdir.join('input.ndjson')
+    path.write('\n'.join(json.dumps(record) for record in some_json_file) + '\n')
+    return str(path)
+
+
+@pytest.mark.parametrize('workers', [1, 2, 4, 16])
+def test_group_ndjson_file_matches_group_json(some_keys_list, some_json_file, ndjson_file, workers):
+    expected = grouping.group_json(some_keys_list, some_json_file)
+    final_dict = mmap_ingest.group_ndjson_file(some_keys_list, ndjson_file, workers=workers)
+    assert final_dict == expected
+    assert json.dumps(final_dict) == json.dumps(expected)
+
+
+def test_split_ranges_cover_the_file_on_line_boundaries(ndjson_file):
+    with open(ndjson_file, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        ranges = mmap_ingest.split_ranges(mm, 4)
+        assert ranges[0][0] == 0 and ranges[-1][1] == len(mm)
+        assert all(end == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+        assert all(mm[end - 1:end] == b'\n' for _, end in ranges)
+        assert len(mmap_ingest.split_ranges(mm, 100)) == 6
+
+
+def test_merge_trees_appends_leaves_in_order():
+    final_dict = {'a': {'x': [1]}}
+    mmap_ingest.merge_trees(final_dict, {'a': {'x': [2], 'y': [3]}, 'b': {'z': [4]}}, 2)
+    assert final_dict == {'a': {'x': [1, 2], 'y': [3]}, 'b': {'z': [4]}}
+
+
+def test_group_ndjson_file_handles_empty_files(some_keys_list, tmpdir):
+    path = tmpdir.join('empty.ndjson')
+    path.write('')
+    assert mmap_ingest.group_ndjson_file(some_keys_list, str(path), workers=2) == {}
+
+
+def test_group_ndjson_file_reports_invalid_keys_and_lines(ndjson_file, tmpdir):
+    with pytest.raises(KeyError):
+        mmap_ingest.group_ndjson_file(['bad_key'], ndjson_file, workers=2)
+    path = tmpdir.join('bad.ndjson')
+    path.write('{"a": 1}\n{"a": \n')
+    with pytest.raises(ValueError, match='line 2'):
+        mmap_ingest.group_ndjson_file(['a'], str(path), workers=1)
+
+
+def test_iter_range_lines_decodes_a_range_a_chunk_at_a_time(tmpdir):
+    path = tmpdir.join('lines.ndjson')
+    path.write_binary('{"a": "\u2028"}\n\n{"a": 2}\n{"a": 3}'.encode('utf-8'))
+    with open(str(path), 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for chunk_size in (1, 4, 1024):
+            assert list(mmap_ingest.iter_range_lines(mm, 0, len(mm), chunk_size)) == [
+                '{"a": "\u2028"}', '', '{"a": 2}', '{"a": 3}']
+        start = mm.find(b'{"a": 2}')
+        assert list(mmap_ingest.iter_range_lines(mm, start, len(mm), 4)) == ['{"a": 2}', '{"a": 3}']
@@ -0,0 +1,50 @@
+from src import grouping
+from src import nested_index
+import pytest
+
+
+def test_nested_index_builds_the_same_tree_as_group_json(some_keys_list, some_json_file):
+    index = nested_index.NestedIndex(some_keys_list, some_json_file[:3])
+    assert index.add(some_json_file[3:]) == 3
+    assert len(index) == 6
+    assert index.snapshot() == grouping.group_json(some_keys_list, some_json_file)
+    assert list(index.snapshot()) == list(grouping.group_json(some_keys_list, some_json_file))
+
+
+def test_nested_index_snapshot_does_not_change_with_later_batches(some_keys_list, some_json_file):
+    index = nested_index.NestedIndex(some_keys_list, some_json_file[:2])
+    snapshot = index.snapshot()
+    index.add(some_json_file[2:])
+    index.remove(some_json_file[:1])
+    assert snapshot == grouping.group_json(some_keys_list, some_json_file[:2])
+
+
+def test_nested_index_remove_drops_one_occurrence_and_prunes_empty_levels(some_keys_list, some_json_file):
+    index = nested_index.NestedIndex(some_keys_list, some_json_file + some_json_file[:1])
+    assert index.remove([some_json_file[0], some_json_file[4]]) == 2
+    assert index.remove([some_json_file[4], {'currency': 'XXX', 'country': 'US'}]) == 0
+    assert len(index) == 5
+    snapshot = index.snapshot()
+    assert snapshot['USD'] == {'US': [{'city': 'Boston', 'amount': 100}]}
+    assert 'GBP' not in snapshot
+    index.remove([some_json_file[0]])
+    assert 'USD' not in index.snapshot()
+
+
+def test_nested_index_leaves_the_index_unchanged_when_a_record_misses_a_key(some_keys_list, some_json_file):
+    index = nested_index.NestedIndex(some_keys_list, some_json_file[:1])
+    with pytest.raises(KeyError):
+        index.add([some_json_file[1], {'currency': 'EUR'}])
+    assert len(index) == 1
+    assert index.snapshot() == grouping.group_json(some_keys_list, some_json_file[:1])
+
+
+def test_nested_index_requires_keys():
+    with pytest.raises(TypeError):
+        nested_index.NestedIndex([])
+
+
+def test_compact_nested_index_matches_plain_index(some_keys_list, some_json_file):
+    index = nested_index.NestedIndex(some_keys_list, some_json_file + some_json_file[:1], compact=True)
+    assert index.remove([some_json_file[0]]) == 1
+    assert index.snapshot() == grouping.group_json(some_keys_list, some_json_file[1:] + some_json_file[:1])
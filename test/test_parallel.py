@@ -0,0 +1,60 @@
+from src import grouping
+from src import parallel
+from src import streaming
+import io
+import json
+import pytest
+import threading
+
+
+def test_parallel_group_json_matches_group_json(some_keys_list, some_json_file):
+    assert parallel.parallel_group_json(some_keys_list, some_json_file, workers=2) == grouping.group_json(
+        some_keys_list, some_json_file)
+    assert list(parallel.parallel_group_json(some_keys_list, some_json_file, workers=2)) == [
+        'EUR', 'FBP', 'GBP', 'USD']
+
+
+def test_parallel_group_json_with_one_worker_does_not_start_a_pool(some_keys_list, some_json_file, monkeypatch):
+    monkeypatch.setattr(parallel, 'map_shards', None)
+    assert parallel.parallel_group_json(some_keys_list, some_json_file, workers=1) == grouping.group_json(
+        some_keys_list, some_json_file)
+
+
+def test_parallel_json_groups_writes_the_same_document_as_json_dump(some_keys_list, some_json_file):
+    fp = io.StringIO()
+    streaming.write_json_fragments(parallel.parallel_json_groups(some_keys_list, iter(some_json_file), 3), fp)
+    assert fp.getvalue() == json.dumps(grouping.group_json(some_keys_list, some_json_file))
+
+
+def test_partition_indexes_keeps_each_first_key_in_one_shard(some_json_file):
+    shards = parallel.partition_indexes(['country'], some_json_file, 3)
+    assert sorted(index for shard in shards for index in shard) == list(range(len(some_json_file)))
+    for shard in shards:
+        countries = {some_json_file[index]['country'] for index in shard}
+        for other_shard in shards:
+            if other_shard is not shard:
+                assert countries.isdisjoint(some_json_file[index]['country'] for index in other_shard)
+
+
+def test_parallel_group_json_raises_keyerror_if_a_not_valid_key_is_indicated(some_json_file):
+    with pytest.raises(KeyError):
+        parallel.parallel_group_json(['country', 'ci'], some_json_file, workers=2)
+    with pytest.raises(KeyError):
+        parallel.partition_indexes(['ci'], some_json_file, 2)
+
+
+def test_concurrent_calls_each_nest_their_own_records():
+    inputs = [[{'a': 'x{}'.format(number % 7), 'b': number % 3, 'call': call} for number in range(50 + call)]
+              for call in range(6)]
+    results = {}
+
+    def nest(call):
+        results[call] = parallel.parallel_group_json(['a', 'b'], inputs[call], workers=4)
+
+    threads = [threading.Thread(target=nest, args=(call,)) for call in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for call in range(6):
+        assert results[call] == grouping.group_json(['a', 'b'], inputs[call])
@@ -0,0 +1,97 @@
+from src import columnar
+from src import planner
+from operator import itemgetter
+import pytest
+
+
+def make_records(number_of_records, first_key_values=1000):
+    # interleaved so that the records are not sorted by a, b
+    return [{'a': index % first_key_values, 'b': index % 7, 'value': index} for index in range(number_of_records)]
+
+
+def test_estimate_distinct_extrapolates_the_values_seen_once():
+    assert planner.estimate_distinct([1, 1, 2, 3]) == 3
+    assert planner.estimate_distinct([1, 1, 2, 3], records=4) == 3
+    # 2 values seen once scaled by sqrt(400 / 4), plus the one seen twice
+    assert planner.estimate_distinct([1, 1, 2, 3], records=400) == 21
+    assert planner.estimate_distinct(list(range(100)), records=150) == 122
+
+
+def test_sample_records_replays_the_sampled_records_of_an_iterator():
+    records = make_records(50)
+    sample, json_list, number_of_records, exact = planner.sample_records(iter(records), 10, input_bytes=10 ** 6)
+    assert sample == records[:10]
+    assert list(json_list) == records
+    assert not exact and number_of_records > 10
+
+    sample, json_list, number_of_records, exact = planner.sample_records(iter(records), 100)
+    assert (sample, list(json_list), number_of_records, exact) == (records, records, 50, True)
+
+    sample, json_list, number_of_records, exact = planner.sample_records(records, 10)
+    assert sample == records[::5] and json_list is records and (number_of_records, exact) == (50, True)
+
+
+def test_make_plan_sorts_input_whose_sample_is_already_sorted():
+    records = sorted(make_records(20000), key=itemgetter('a', 'b'))
+    plan, json_list = planner.make_plan(['a', 'b'], iter(records))
+    assert plan.strategy == 'sort'
+    assert plan.options() == {'presorted': True, 'memory_budget': None, 'workers': 1, 'engine': 'hash'}
+    assert list(json_list) == records
+
+
+def test_make_plan_keeps_the_hash_grouping_for_small_inputs(some_keys_list, some_json_file):
+    plan, json_list = planner.make_plan(some_keys_list, some_json_file, workers=4)
+    assert plan.strategy == 'hash'
+    assert plan.statistics.cardinality == {'currency': 4, 'country': 4}
+    assert plan.statistics.records == 6 and plan.statistics.exact
+
+
+def test_make_plan_uses_the_columnar_engine_for_large_unsorted_records_sharing_one_schema():
+    pytest.importorskip('numpy')
+    plan, _ = planner.make_plan(['a', 'b'], make_records(20000))
+    assert plan.strategy == 'columnar'
+    assert plan.options()['engine'] == 'columnar'
+
+    records = make_records(20000)
+    records[0]['extra'] = True
+    assert planner.make_plan(['a', 'b'], records)[0].strategy == 'hash'
+
+
+def test_make_plan_shards_large_inputs_with_enough_first_key_values():
+    records = make_records(planner.SHARDED_MIN_RECORDS)
+    plan, _ = planner.make_plan(['a', 'b'], records, workers=4)
+    assert plan.strategy == 'sharded'
+    assert plan.options()['workers'] == 4
+    assert planner.make_plan(['a', 'b'], records, workers=1)[0].strategy != 'sharded'
+    # a single first-key value cannot be spread over the workers
+    assert planner.make_plan(['b', 'a'], make_records(planner.SHARDED_MIN_RECORDS, 1), workers=8)[0].strategy \
+        != 'sharded'
+
+
+def test_make_plan_sorts_out_of_core_inputs_larger_than_the_memory(monkeypatch):
+    monkeypatch.setattr(planner, 'physical_memory_size', lambda: 1024 * 1024)
+    plan, _ = planner.make_plan(['a', 'b'], make_records(20000), memory_budget=4096)
+    assert plan.strategy == 'external'
+    assert plan.options()['memory_budget'] == 4096
+
+
+def test_make_plan_leaves_invalid_keys_to_the_hash_grouping(some_json_file):
+    plan, _ = planner.make_plan(['currency', 'unknown'], some_json_file)
+    assert plan.strategy == 'hash'
+    assert "KeyError: 'unknown'" in plan.explain()
+
+
+def test_make_plan_honours_forced_strategies_and_skips_aggregations(some_keys_list, some_json_file):
+    for strategy in planner.STRATEGIES:
+        plan, _ = planner.make_plan(some_keys_list, some_json_file, strategy, workers=2)
+        assert (plan.strategy, plan.reason) == (strategy, 'forced')
+        assert plan.explain().startswith('strategy: {}'.format(strategy))
+    plan, json_list = planner.make_plan(some_keys_list, iter(some_json_file), aggregations=[('amount', ['sum'])])
+    assert plan.statistics is None
+    assert list(json_list) == some_json_file
+
+
+def test_make_plan_falls_back_to_hash_without_numpy(monkeypatch):
+    monkeypatch.setattr(columnar, 'np', None)
+    plan, _ = planner.make_plan(['a', 'b'], make_records(20000))
+    assert (plan.strategy, plan.reason) == ('hash', 'unsorted records without numpy')
@@ -0,0 +1,23 @@
+from src import profiling
+
+
+def test_profiler_records_time_records_groups_and_peak_memory_per_stage():
+    profiler = profiling.Profiler()
+    with profiler.stage('nest') as stage:
+        records = profiler.count_records(stage, iter(range(3)))
+        groups = profiler.count_groups(stage, [sum(records)])
+    with profiler.stage('write') as stage:
+        buffer = [bytes(1024 * 1024) for _ in groups]
+    assert [stage.name for stage in profiler.stages] == ['nest', 'write']
+    assert (profiler.stages[0].records, profiler.stages[0].groups) == (3, 1)
+    assert profiler.stages[1].peak_memory >= len(buffer[0])
+    assert profiler.stages[1].seconds > 0
+    assert profiler.report().splitlines()[1].split()[:4] == ['nest', '{:.4f}'.format(profiler.stages[0].seconds),
+                                                              '3', '1']
+
+
+def test_null_profiler_passes_the_pipeline_through_unchanged():
+    records = iter(range(3))
+    with profiling.NULL_PROFILER.stage('nest') as stage:
+        assert profiling.NULL_PROFILER.count_records(stage, records) is records
+    assert profiling.NULL_PROFILER.report() == ''
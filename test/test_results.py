@@ -0,0 +1,34 @@
+import pytest
+
+from src import grouping
+from src import results
+
+
+def some_tree():
+    return grouping.group_json(['currency', 'year'], [{'currency': 'EUR', 'year': 2020, 'amount': 1},
+                                                      {'currency': 'EUR', 'year': 2021, 'amount': 2},
+                                                      {'currency': 'USD', 'year': 2020, 'amount': 3}])
+
+
+def test_stored_result_indexes_every_level_by_its_json_keys():
+    result = results.StoredResult(['currency', 'year'], some_tree())
+    assert result.lookup([]) is result.final_dict
+    assert result.lookup(['EUR']) == {2020: [{'amount': 1}], 2021: [{'amount': 2}]}
+    assert result.lookup(['EUR', '2021']) == [{'amount': 2}]
+    assert result.is_leaf(['EUR', '2021']) and not result.is_leaf(['EUR'])
+    with pytest.raises(KeyError):
+        result.lookup(['EUR', '2022'])
+
+
+def test_result_store_drops_the_least_recently_used_and_expired_results():
+    now = [0]
+    store = results.ResultStore(max_entries=2, ttl=10, clock=lambda: now[0])
+    first = store.put(['currency'], {})
+    second = store.put(['currency'], {})
+    store.get(first)
+    third = store.put(['currency'], {})
+    assert store.get(second) is None
+    assert store.get(first) is not None and len(store) == 2
+    now[0] = 10
+    assert store.get(third) is None
+    assert store.delete(first) and not store.delete(first)
@@ -0,0 +1,105 @@
+from src import grouping
+from src import json_parser
+from src import streaming
+import copy
+import io
+import json
+import pytest
+
+
+def test_iter_json_array_yields_each_element_of_the_array(some_json_file):
+    fp = io.StringIO(json.dumps(some_json_file, indent=2))
+    assert list(streaming.iter_json_array(fp, chunk_size=7)) == some_json_file
+
+
+def test_iter_json_array_does_not_split_numbers_across_chunks():
+    fp = io.StringIO('[123456789, 1.5e10 ,-42]')
+    for chunk_size in range(1, 10):
+        fp.seek(0)
+        assert list(streaming.iter_json_array(fp, chunk_size=chunk_size)) == [123456789, 1.5e10, -42]
+
+
+def test_iter_json_array_accepts_an_empty_array():
+    assert list(streaming.iter_json_array(io.StringIO(' [ ] \n'))) == []
+
+
+def test_iter_json_array_is_lazy():
+    elements = streaming.iter_json_array(io.StringIO('[{"a": 1}, {"a": 2}, not json'), chunk_size=4)
+    assert next(elements) == {'a': 1}
+    assert next(elements) == {'a': 2}
+    with pytest.raises(json.JSONDecodeError):
+        next(elements)
+
+
+def test_iter_json_array_rejects_a_json_object():
+    with pytest.raises(json.JSONDecodeError):
+        list(streaming.iter_json_array(io.StringIO('{"a": 1}')))
+
+
+@pytest.mark.parametrize('text', ['[{"a": 1}', '[{"a": 1},]', '[{"a": 1}] []', '[{"a": 1} {"a": 2}]', ''])
+def test_iter_json_array_rejects_malformed_arrays(text):
+    with pytest.raises(json.JSONDecodeError):
+        list(streaming.iter_json_array(io.StringIO(text), chunk_size=3))
+
+
+def test_iter_top_level_groups_yields_one_nested_group_per_first_key(some_keys_list, some_json_file):
+    json_list_ordered = sorted(some_json_file, key=lambda record: (record['currency'], record['country']))
+    groups = list(streaming.iter_top_level_groups(some_keys_list, json_list_ordered))
+    assert groups == list(grouping.group_json(some_keys_list, some_json_file).items())
+
+
+def test_iter_top_level_groups_with_a_single_key_yields_leaf_arrays(some_json_file):
+    groups = streaming.iter_top_level_groups(['country'], [some_json_file[1], some_json_file[2]])
+    assert list(groups) == [('FR', [{'city': 'Paris', 'currency': 'EUR', 'amount': 20},
+                                    {'city': 'Lyon', 'currency': 'EUR', 'amount': 11.4}])]
+
+
+def test_iter_top_level_groups_rejects_input_that_is_not_grouped(some_json_file):
+    with pytest.raises(ValueError):
+        list(streaming.iter_top_level_groups(['country'], some_json_file + some_json_file[:1]))
+
+
+def test_write_json_groups_is_byte_identical_to_json_dump(some_keys_list, some_json_file):
+    final_dict = grouping.group_json(some_keys_list, some_json_file)
+    final_dict[1] = {None: [{'x': 1.5}]}
+    fp = io.StringIO()
+    assert streaming.write_json_groups(final_dict.items(), fp) == 5
+    assert fp.getvalue() == json.dumps(final_dict)
+
+
+def test_write_json_groups_writes_an_empty_object_when_there_are_no_groups():
+    fp = io.StringIO()
+    streaming.write_json_groups([], fp)
+    assert fp.getvalue() == '{}'
+
+
+def test_stream_json_file_creates_the_result_file(some_keys_list, some_json_file, tmpdir):
+    file_name = tmpdir.join('result.json')
+    json_list_ordered = json_parser.read_and_sort_json_file(some_keys_list, copy.deepcopy(some_json_file))
+    streaming.stream_json_file(streaming.iter_top_level_groups(some_keys_list, json_list_ordered), file_name)
+    assert json.loads(file_name.read()) == grouping.group_json(some_keys_list, some_json_file)
+
+
+def test_stream_json_file_swallows_FileNotFoundError_exception_when_non_existing_directory_indicated():
+    streaming.stream_json_file([], '/fake/path')
+
+
+@pytest.mark.parametrize('batch_size', [1, 2, 1000])
+def test_iter_ndjson_yields_each_line_in_batches(some_json_file, batch_size):
+    text = '\n'.join(json.dumps(record) for record in some_json_file) + '\n\n'
+    assert list(streaming.iter_ndjson(io.StringIO(text), batch_size)) == some_json_file
+
+
+@pytest.mark.parametrize('text, line_number', [('{"a": 1}\n{"a": \n', 2), ('{"a": 1}\n\n{"a": 1}, {"a": 2}\n', 3)])
+def test_iter_ndjson_reports_the_invalid_line(text, line_number):
+    with pytest.raises(ValueError, match='line {}'.format(line_number)):
+        list(streaming.iter_ndjson(io.StringIO(text)))
+
+
+def test_iter_leaf_groups_yields_each_leaf_with_its_key_path(some_keys_list, some_json_file):
+    final_dict = grouping.group_json(some_keys_list, some_json_file)
+    leaf_groups = list(streaming.iter_leaf_groups(final_dict.items(), 2))
+    assert [path for path, _ in leaf_groups] == [(currency, country) for currency in final_dict
+                                                 for country in final_dict[currency]]
+    assert json.loads(streaming.dump_leaf_line(*leaf_groups[0])) == \
+        {'path': list(leaf_groups[0][0]), 'records': leaf_groups[0][1]}